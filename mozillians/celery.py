@@ -11,6 +11,7 @@ from django.conf import settings  # noqa
 
 RUN_DAILY = 60 * 60 * 24
 RUN_HOURLY = 60 * 60
+RUN_EVERY_MINUTE = 60
 RUN_EVERY_SIX_HOURS = 6 * 60 * 60
 
 
@@ -45,6 +46,16 @@ app.conf.beat_schedule = {
         'schedule': RUN_DAILY,
         'args': ()
     },
+    'reconcile-member-counts': {
+        'task': 'mozillians.groups.tasks.reconcile_member_counts',
+        'schedule': RUN_DAILY,
+        'args': ()
+    },
+    'reconcile-vouch-counts': {
+        'task': 'mozillians.users.tasks.reconcile_vouch_counts',
+        'schedule': RUN_DAILY,
+        'args': ()
+    },
     'delete-reported-spam-accounts': {
         'task': 'mozillians.users.tasks.delete_reported_spam_accounts',
         'schedule': RUN_DAILY,
@@ -56,6 +67,16 @@ app.conf.beat_schedule = {
     #     'schedule': RUN_EVERY_SIX_HOURS,
     #     'args': ()
     # },
+    'reconcile-basket-subscriptions': {
+        'task': 'mozillians.users.tasks.reconcile_basket_subscriptions',
+        'schedule': RUN_HOURLY,
+        'args': ()
+    },
+    'publish-cis-outbox': {
+        'task': 'mozillians.users.tasks.publish_cis_outbox',
+        'schedule': RUN_EVERY_MINUTE,
+        'args': ()
+    },
     'remove-incomplete-accounts': {
         'task': 'mozillians.users.tasks.remove_incomplete_accounts',
         'schedule': RUN_HOURLY,
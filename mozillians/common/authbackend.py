@@ -13,7 +13,7 @@ from waffle import switch_is_active
 
 from mozillians.dino_park.utils import _dino_park_get_profile_by_userid
 from mozillians.users.models import IdpProfile
-from mozillians.users.tasks import send_userprofile_to_cis
+from mozillians.users.tasks import queue_userprofile_for_cis
 
 
 SSO_AAL_SCOPE = 'https://sso.mozilla.com/claim/AAL'
@@ -180,11 +180,11 @@ class MozilliansAuthBackend(OIDCAuthenticationBackend):
         # Update/Save the Github username
         if 'github|' in auth0_user_id:
             obj.username = self.claims.get('nickname', '')
-        # Save once
-        obj.save()
+        # Save once, only if the identity changed
+        obj.save(only_dirty=True)
 
         # Update CIS
-        send_userprofile_to_cis.delay(profile.pk)
+        queue_userprofile_for_cis(profile.pk)
         return user
 
     def authenticate(self, **kwargs):
@@ -3,7 +3,7 @@ from django.conf import settings
 
 from haystack.signals import BaseSignalProcessor
 
-from mozillians.users.models import IdpProfile, UserProfile
+from mozillians.users.models import DirtyFieldsMixin, IdpProfile, UserProfile
 from mozillians.groups.models import Group
 
 
@@ -19,6 +19,9 @@ class SearchSignalProcessor(BaseSignalProcessor):
         signals.post_delete.connect(self.handle_delete, sender=IdpProfile)
 
     def handle_save(self, sender, instance, **kwargs):
+        # Do not index profiles and identities that did not change.
+        if isinstance(instance, DirtyFieldsMixin) and not instance.has_changed():
+            return
         # Do not index incomplete profiles and not visible groups.
         if not settings.DINO_PARK_ACTIVE:
             if ((isinstance(instance, UserProfile) and instance.is_complete)
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from hashlib import md5
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse as django_reverse
 from django.contrib.staticfiles.storage import staticfiles_storage
 from django.http import HttpResponseRedirect
@@ -16,6 +17,7 @@ from django.utils.safestring import mark_safe
 import bleach
 import markdown as markdown_module
 from django_jinja import library
+from functools32 import lru_cache
 from jinja2 import Markup, contextfunction
 from pytz import timezone, utc
 from sorl.thumbnail import get_thumbnail
@@ -26,6 +28,9 @@ from mozillians.common import utils
 from mozillians.users.managers import PUBLIC
 
 GRAVATAR_URL = 'https://secure.gravatar.com/avatar/{emaildigest}'
+GRAVATAR_CACHE_SIZE = 4096
+GRAVATAR_CACHE_KEY = 'common:gravatar:{0}'
+GRAVATAR_CACHE_TIMEOUT = 60 * 60 * 24
 
 
 @library.global_function
@@ -62,13 +67,60 @@ def urlparams(url_, hash=None, **query):
     return new.geturl()
 
 
-def gravatar(email, default_avatar_url=settings.DEFAULT_AVATAR_URL, size=175, rating='pg'):
-    """Return the Gravatar URL for an email address."""
+def _gravatar_cache_key(email, default_avatar_url, size, rating):
+    params = u'{0}:{1}:{2}:{3}'.format(email, default_avatar_url, size, rating)
+    return GRAVATAR_CACHE_KEY.format(md5(smart_str(params)).hexdigest())
+
+
+def _build_gravatar(email, default_avatar_url, size, rating):
     url = GRAVATAR_URL.format(emaildigest=md5(email).hexdigest())
     url = urlparams(url, d=default_avatar_url, s=size, r=rating)
     return url
 
 
+@lru_cache(maxsize=GRAVATAR_CACHE_SIZE)
+def _gravatar(email, default_avatar_url, size, rating):
+    key = _gravatar_cache_key(email, default_avatar_url, size, rating)
+    url = cache.get(key)
+    if url is None:
+        url = _build_gravatar(email, default_avatar_url, size, rating)
+        cache.set(key, url, GRAVATAR_CACHE_TIMEOUT)
+    return url
+
+
+def gravatar(email, default_avatar_url=settings.DEFAULT_AVATAR_URL, size=175, rating='pg'):
+    """Return the Gravatar URL for an email address.
+
+    URLs are memoized per process in a bounded LRU cache, backed by the
+    shared cache.
+    """
+    return _gravatar(email, default_avatar_url, size, rating)
+
+
+def gravatars(emails, default_avatar_url=settings.DEFAULT_AVATAR_URL, size=175, rating='pg'):
+    """Return a dict mapping each of emails to its Gravatar URL.
+
+    The URLs are looked up in the shared cache with a single get_many,
+    the missing ones are built and stored.
+    """
+    keys = dict((email, _gravatar_cache_key(email, default_avatar_url, size, rating))
+                for email in set(emails))
+    if not keys:
+        return {}
+    cached = cache.get_many(keys.values())
+    urls = {}
+    generated = {}
+    for email, key in keys.items():
+        url = cached.get(key)
+        if url is None:
+            url = _build_gravatar(email, default_avatar_url, size, rating)
+            generated[key] = url
+        urls[email] = url
+    if generated:
+        cache.set_many(generated, GRAVATAR_CACHE_TIMEOUT)
+    return urls
+
+
 @library.global_function
 def field_with_attrs(bfield, **kwargs):
     """Allows templates to dynamically add html attributes to bound
@@ -313,6 +365,8 @@ def get_privacy_aware_photo_url(profile, privacy_level, geometry, **kwargs):
     if profile.privacy_photo >= privacy_level:
         if not profile.photo:
             return gravatar(profile.email, size=geometry)
+        if not kwargs and geometry in profile.photo_thumbnail_urls:
+            return profile.photo_thumbnail_urls[geometry]
         return profile.get_photo_thumbnail(geometry, **kwargs).url
 
     profile.photo = ''
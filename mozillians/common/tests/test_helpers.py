@@ -5,7 +5,7 @@ from django.utils.timezone import is_aware
 from bleach import clean
 from datetime import datetime
 from markdown import markdown
-from mock import patch
+from mock import ANY, patch
 from nose.tools import eq_, ok_
 from pytz import utc
 
@@ -23,6 +23,37 @@ class HelperTests(TestCase):
                          '39b808083f0031a56e9872?s=80&r=bar&d='
                          '%2Fmedia%2Fimg%2Fdefault_avatar.png'))
 
+    @patch('mozillians.common.templatetags.helpers.cache')
+    @patch('mozillians.common.templatetags.helpers.md5', wraps=helpers.md5)
+    def test_gravatar_memoized(self, md5_mock, cache_mock):
+        cache_mock.get.return_value = None
+        helpers._gravatar.cache_clear()
+        avatar_url = helpers.gravatar('foo@example.com', size=80)
+        call_count = md5_mock.call_count
+        eq_(helpers.gravatar('foo@example.com', size=80), avatar_url)
+        eq_(md5_mock.call_count, call_count)
+        cache_mock.set.assert_called_once_with(ANY, avatar_url, helpers.GRAVATAR_CACHE_TIMEOUT)
+
+    @patch('mozillians.common.templatetags.helpers.cache')
+    def test_gravatar_shared_cache(self, cache_mock):
+        cache_mock.get.return_value = 'http://example.com/avatar.png'
+        helpers._gravatar.cache_clear()
+        self.addCleanup(helpers._gravatar.cache_clear)
+        eq_(helpers.gravatar('foo@example.com', size=80), 'http://example.com/avatar.png')
+        ok_(not cache_mock.set.called)
+
+    @patch('mozillians.common.templatetags.helpers.cache')
+    def test_gravatars(self, cache_mock):
+        cache_mock.get.return_value = None
+        cache_mock.get_many.return_value = {}
+        urls = helpers.gravatars(['foo@example.com', 'bar@example.com', 'foo@example.com'],
+                                 size=80)
+        helpers._gravatar.cache_clear()
+        eq_(urls, {'foo@example.com': helpers.gravatar('foo@example.com', size=80),
+                   'bar@example.com': helpers.gravatar('bar@example.com', size=80)})
+        eq_(cache_mock.get_many.call_count, 1)
+        eq_(len(cache_mock.set_many.call_args[0][0]), 2)
+
     @patch('mozillians.common.templatetags.helpers.markdown_module.markdown', wraps=markdown)
     @patch('mozillians.common.templatetags.helpers.bleach.clean', wraps=clean)
     def test_markdown(self, clean_mock, markdown_mock):
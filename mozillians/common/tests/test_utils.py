@@ -4,7 +4,10 @@ from mock import patch, MagicMock
 from nose.tools import eq_
 
 from mozillians.common.tests import TestCase
-from mozillians.common.utils import akismet_spam_check
+from mozillians.common.utils import akismet_spam_check, bundle_profiles
+from mozillians.groups.tests import GroupFactory
+from mozillians.users.models import ExternalAccount, IdpProfile
+from mozillians.users.tests import UserFactory
 
 
 class AkismetTests(TestCase):
@@ -74,3 +77,47 @@ class AkismetTests(TestCase):
         data = params
         data['blog'] = 'http://example.com'
         mock_requests.post.assert_called_with(url, data=data)
+
+
+class BundleProfilesTests(TestCase):
+    def _create_profile(self, username):
+        profile = UserFactory.create(username=username).userprofile
+        IdpProfile.objects.create(profile=profile, auth0_user_id='github|{0}'.format(username),
+                                  email='{0}@example.com'.format(username), primary=True)
+        IdpProfile.objects.create(profile=profile, auth0_user_id='ad|{0}'.format(username),
+                                  email='{0}@example.org'.format(username), primary=False)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_SUMO, identifier=username)
+        GroupFactory.create(name='access {0}'.format(username),
+                            is_access_group=True).add_member(profile)
+        GroupFactory.create(name='tag {0}'.format(username)).add_member(profile)
+        return profile
+
+    def test_same_payloads_as_single_profile(self):
+        profile = self._create_profile('foo')
+        results = bundle_profiles([profile.id])
+        eq_(len(results), 2)
+        eq_(set(data['user_id'] for data in results), set(['github|foo', 'ad|foo']))
+        data = results[0]
+        eq_(data['primaryEmail'], 'foo@example.com')
+        eq_(data['emails'], profile.get_cis_emails())
+        eq_(data['uris'], profile.get_cis_uris())
+        eq_(data['groups'], ['mozilliansorg_access-foo'])
+        eq_(data['tags'], ['tag-foo'])
+        eq_(data['picture'], profile.get_photo_url())
+
+    def test_delete(self):
+        profile = self._create_profile('foo')
+        for data in bundle_profiles([profile.id], delete=True):
+            eq_(data['groups'], [])
+            eq_(data['tags'], [])
+
+    def test_constant_queries(self):
+        profile_ids = [self._create_profile(username).id for username in ('foo', 'bar', 'baz')]
+        # Profiles, identities, external accounts and memberships.
+        with self.assertNumQueries(4):
+            results = bundle_profiles(profile_ids)
+        eq_(len(results), 6)
+
+    def test_profile_without_identities(self):
+        profile = UserFactory.create().userprofile
+        eq_(bundle_profiles([profile.id]), [])
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import sys
 
 from django.conf import settings
@@ -65,25 +67,51 @@ def is_test_environment():
 
 def bundle_profile_data(profile_id, delete=False):
     """Packs all the Identity Profiles of a user into a dictionary."""
-    from mozillians.common.templatetags.helpers import get_object_or_none
-    from mozillians.users.models import IdpProfile, UserProfile
+    return bundle_profiles([profile_id], delete=delete)
 
-    try:
-        profile = UserProfile.objects.get(pk=profile_id)
-    except UserProfile.DoesNotExist:
-        return []
-    human_name = HumanName(profile.full_name)
 
-    primary_idp = get_object_or_none(IdpProfile, profile=profile, primary=True)
-    primary_login_email = profile.email
-    if primary_idp:
-        primary_login_email = primary_idp.email
+def bundle_profiles(profile_ids, delete=False):
+    """Packs all the Identity Profiles of many users into a list of dictionaries."""
+    return [data for _, data in bundle_identities(profile_ids, delete=delete)]
 
-    results = []
-    for idp in profile.idp_profiles.all():
 
-        data = {
-            'user_id': idp.auth0_user_id,
+def bundle_identities(profile_ids, delete=False):
+    """Return (IdpProfile, CIS payload) pairs for all the Identity Profiles of many users.
+
+    The related objects of all the profiles are prefetched together, so the
+    number of queries does not depend on the number of profiles. The parts
+    shared by the Identity Profiles of a user are computed once per user.
+    """
+    from django.db.models import Prefetch
+
+    from mozillians.groups.models import GroupMembership
+    from mozillians.users.models import UserProfile, photo_urls_for
+
+    profiles = (UserProfile.objects.filter(pk__in=profile_ids).order_by('pk')
+                .select_related('user')
+                .prefetch_related('idp_profiles', 'externalaccount_set'))
+    if not delete:
+        memberships = (GroupMembership.objects.filter(status=GroupMembership.MEMBER)
+                       .select_related('group'))
+        profiles = profiles.prefetch_related(
+            Prefetch('groupmembership_set', queryset=memberships, to_attr='cis_memberships'))
+    profiles = list(profiles)
+    pictures = photo_urls_for(profiles, ['160x160'])
+
+    results = []
+    for profile in profiles:
+        idp_profiles = profile.idp_profiles.all()
+        if not idp_profiles:
+            continue
+        human_name = HumanName(profile.full_name)
+
+        primary_login_email = profile.email
+        for idp in idp_profiles:
+            if idp.primary:
+                primary_login_email = idp.email
+                break
+
+        shared = {
             'timezone': profile.timezone,
             'active': profile.user.is_active,
             'lastModified': profile.last_updated.isoformat(),
@@ -93,9 +121,9 @@ def bundle_profile_data(profile_id, delete=False):
             'primaryEmail': primary_login_email,
             'emails': profile.get_cis_emails(),
             'uris': profile.get_cis_uris(),
-            'picture': profile.get_photo_url(),
+            'picture': pictures[profile.pk]['160x160'],
             'shirtSize': profile.get_tshirt_display() or '',
-            'groups': [] if delete else profile.get_cis_groups(idp),
+            'groups': [] if delete else profile.get_cis_groups(None),
             'tags': [] if delete else profile.get_cis_tags(),
 
             # Derived fields
@@ -110,5 +138,13 @@ def bundle_profile_data(profile_id, delete=False):
             'PGPFingerprints': [],
             'authoritativeGroups': []
         }
-        results.append(data)
+
+        for idp in idp_profiles:
+            results.append((idp, dict(shared, user_id=idp.auth0_user_id)))
     return results
+
+
+def cis_payload_hash(data):
+    """Return a digest of a CIS payload, ignoring its lastModified timestamp."""
+    content = dict((key, value) for key, value in data.items() if key != 'lastModified')
+    return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
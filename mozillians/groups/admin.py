@@ -172,6 +172,9 @@ class GroupBaseAdmin(MozilliansAdminExportMixin, admin.ModelAdmin):
     list_filter = [EmptyGroupFilter, NoURLFilter]
     readonly_fields = ['url', 'total_member_count']
 
+    def get_queryset(self, request):
+        return super(GroupBaseAdmin, self).get_queryset(request).with_live_counts()
+
     def get_form(self, request, obj=None, **kwargs):
         defaults = {}
         if obj is None:
@@ -185,7 +188,7 @@ class GroupBaseAdmin(MozilliansAdminExportMixin, admin.ModelAdmin):
         Do not use annonated value member_count directly (bug 908053).
         """
         return obj.members.count()
-    total_member_count.admin_order_field = 'member_count'
+    total_member_count.admin_order_field = 'live_member_count'
 
     class Media:
         css = {
@@ -0,0 +1,176 @@
+"""
+In-process index of the alias names of groups and skills.
+
+Every process keeps its own index per model, searched by trigram. The
+index is updated in place by the alias and group signals once the
+transaction is committed. A version token in the shared cache, changed
+at the same time, tells the other processes to rebuild theirs.
+
+The member counts used for ranking are written by refresh_member_counts()
+with update(), on every membership change. They don't invalidate the
+index, it picks them up when it expires, see ALIAS_INDEX_MAX_AGE.
+"""
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+ALIAS_INDEX_VERSION_KEY = 'groups:alias_index:{0}'
+# Indexes are rebuilt at least this often to pick up member count changes.
+ALIAS_INDEX_MAX_AGE = 10 * 60
+TRIGRAM_LENGTH = 3
+
+_indexes = {}
+# Guards _indexes and the indexes in it, which are updated in place.
+_lock = threading.RLock()
+
+
+def get_trigrams(text):
+    """Return the set of substrings of TRIGRAM_LENGTH characters of text."""
+    return set(text[i:i + TRIGRAM_LENGTH] for i in range(len(text) - TRIGRAM_LENGTH + 1))
+
+
+class AliasIndex(object):
+    """Alias names of the groups of a model.
+
+    Matches are filtered by the visibility of their group and ranked by
+    its member count.
+    """
+
+    def __init__(self, model, version):
+        self.model = model
+        self.version = version
+        self.built = time.time()
+        # alias id -> (lowercase name, group id)
+        self.aliases = {}
+        # trigram -> alias ids
+        self.trigrams = defaultdict(set)
+        # group id -> (name, visible, member_count)
+        self.groups = {}
+
+        has_visible = any(field.name == 'visible' for field in model._meta.fields)
+        fields = ['id', 'name', 'member_count'] + (['visible'] if has_visible else [])
+        for values in model.objects.order_by().values_list(*fields):
+            visible = values[3] if has_visible else True
+            self.set_group(values[0], values[1], visible, values[2])
+        for pk, name, group_id in model.ALIAS_MODEL.objects.values_list('id', 'name', 'alias'):
+            self.set_alias(pk, name, group_id)
+
+    def is_expired(self):
+        return time.time() - self.built > ALIAS_INDEX_MAX_AGE
+
+    def set_group(self, pk, name, visible, member_count):
+        self.groups[pk] = (name, visible, member_count)
+
+    def remove_group(self, pk):
+        self.groups.pop(pk, None)
+
+    def set_alias(self, pk, name, group_id):
+        self.remove_alias(pk)
+        name = name.lower()
+        self.aliases[pk] = (name, group_id)
+        for trigram in get_trigrams(name):
+            self.trigrams[trigram].add(pk)
+
+    def remove_alias(self, pk):
+        if pk not in self.aliases:
+            return
+        name, _ = self.aliases.pop(pk)
+        for trigram in get_trigrams(name):
+            self.trigrams[trigram].discard(pk)
+            if not self.trigrams[trigram]:
+                del self.trigrams[trigram]
+
+    def search(self, query, visible_only=False, limit=None):
+        """Return the ids of the groups with an alias containing query.
+
+        The most popular groups come first.
+        """
+        query = query.lower()
+        postings = [self.trigrams.get(trigram, ()) for trigram in get_trigrams(query)]
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            # Queries shorter than a trigram scan every alias.
+            candidates = self.aliases.keys()
+
+        group_ids = set()
+        for pk in candidates:
+            name, group_id = self.aliases[pk]
+            if query in name and group_id in self.groups:
+                group_ids.add(group_id)
+        if visible_only:
+            group_ids = [pk for pk in group_ids if self.groups[pk][1]]
+
+        ranked = sorted(group_ids, key=lambda pk: (-self.groups[pk][2], self.groups[pk][0]))
+        return ranked[:limit] if limit else ranked
+
+
+def _get_version_key(model):
+    return ALIAS_INDEX_VERSION_KEY.format(model._meta.label_lower)
+
+
+def get_alias_index(model):
+    """Return the alias index of model, rebuilt when it is out of date.
+
+    A new index is built without holding the lock and swapped in.
+    """
+    key = _get_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(key, version, None)
+
+    index = _indexes.get(model)
+    if index is None or index.version != version or index.is_expired():
+        index = AliasIndex(model, version)
+        with _lock:
+            _indexes[model] = index
+    return index
+
+
+def search_alias_index(model, query, visible_only=False, limit=None):
+    """Search the alias index of model, see AliasIndex.search()."""
+    index = get_alias_index(model)
+    with _lock:
+        return index.search(query, visible_only=visible_only, limit=limit)
+
+
+def update_alias_index(model, update):
+    """Call update with the index of this process and invalidate the others.
+
+    Both happen once the transaction is committed, so a rolled back change
+    never reaches an index. An index that is already out of date is
+    dropped instead of updated.
+    """
+    key = _get_version_key(model)
+
+    def apply_update():
+        version = uuid.uuid4().hex
+        with _lock:
+            index = _indexes.get(model)
+            current = index is not None and index.version == cache.get(key)
+            cache.set(key, version, None)
+            if current:
+                update(index)
+                index.version = version
+            else:
+                _indexes.pop(model, None)
+
+    transaction.on_commit(apply_update)
+
+
+def invalidate_alias_index(model):
+    """Have every process rebuild the alias index of model.
+
+    For aliases changed without signals, e.g. with update().
+    """
+    with _lock:
+        _indexes.pop(model, None)
+    transaction.on_commit(
+        lambda: cache.set(_get_version_key(model), uuid.uuid4().hex, None))
@@ -7,7 +7,7 @@ from dal import autocomplete
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as _lazy
 
-from mozillians.groups.models import Group, Invite
+from mozillians.groups.models import Group, GroupMembership, Invite
 from mozillians.groups.tasks import notify_redeemer_invitation
 
 
@@ -110,9 +110,9 @@ class GroupCuratorsForm(happyforms.ModelForm):
         """Custom save method to add multiple curators."""
         obj = super(GroupCuratorsForm, self).save(*args, **kwargs)
 
-        for curator in self.cleaned_data['curators']:
-            if not obj.has_member(curator):
-                obj.add_member(curator)
+        members = obj.groupmembership_set.filter(status=GroupMembership.MEMBER)
+        curators = self.cleaned_data['curators']
+        obj.add_members(curators.exclude(id__in=members.values('userprofile')))
         return obj
 
     class Meta:
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_member_counts(apps, schema_editor):
+    Group = apps.get_model('groups', 'Group')
+    GroupMembership = apps.get_model('groups', 'GroupMembership')
+    Skill = apps.get_model('groups', 'Skill')
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    fields = {'member': 'member_count', 'pending': 'pending_count'}
+    counts = (GroupMembership.objects.filter(status__in=fields.keys())
+              .values_list('group', 'status').annotate(count=Count('id')).order_by())
+    for group_id, status, count in counts:
+        Group.objects.filter(pk=group_id).update(**{fields[status]: count})
+
+    through = UserProfile._meta.get_field('skills').remote_field.through
+    counts = through.objects.values_list('skill').annotate(count=Count('id')).order_by()
+    for skill_id, count in counts:
+        Skill.objects.filter(pk=skill_id).update(member_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0020_auto_20171206_0641'),
+        ('users', '0052_userprofile_basket_vouched'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_member_counts, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Case, Count, IntegerField, Manager, Q, Sum, When
 from django.utils.timezone import now
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as _lazy
@@ -11,20 +12,30 @@ from autoslug.fields import AutoSlugField
 from mozillians.common.templatetags.helpers import get_object_or_none
 from mozillians.common.urlresolvers import reverse
 from mozillians.common.utils import absolutify
-from mozillians.groups.managers import GroupBaseManager, GroupManager, GroupQuerySet
+from mozillians.groups.alias_index import invalidate_alias_index, search_alias_index
+from mozillians.groups.managers import GroupQuerySet
 from mozillians.groups.templatetags.helpers import slugify
-from mozillians.groups.tasks import email_membership_change
+from mozillians.groups.tasks import email_membership_change, email_membership_changes
 from mozillians.users.tasks import (unsubscribe_from_basket_task, subscribe_user_to_basket,
-                                    send_userprofile_to_cis)
+                                    queue_userprofile_for_cis, queue_userprofiles_for_cis)
+
+
+SHARED_SKILLS_CACHE_KEY = 'groups:shared_skills:{0}'
+SHARED_SKILLS_CACHE_TIMEOUT = 60 * 60 * 24
+SHARED_SKILLS_LIMIT = 15
 
 
 class GroupBase(models.Model):
     """Base class for groups in Mozillians."""
+    COUNTER_FIELDS = ('member_count',)
+
     name = models.CharField(db_index=True, max_length=100,
                             unique=True, verbose_name=_lazy(u'Name'))
     url = models.SlugField(blank=True)
+    # Maintained by the membership signals, see refresh_member_counts().
+    member_count = models.PositiveIntegerField(default=0, editable=False)
 
-    objects = GroupBaseManager.from_queryset(GroupQuerySet)()
+    objects = Manager.from_queryset(GroupQuerySet)()
 
     class Meta:
         abstract = True
@@ -47,31 +58,102 @@ class GroupBase(models.Model):
         return self.name
 
     @classmethod
-    def search(cls, query):
-        query = query.lower()
-        results = cls.objects.filter(aliases__name__contains=query)
-        results = results.distinct()
-        return results
+    def search(cls, query, visible_only=False, limit=None):
+        """Return the groups with an alias containing query, most popular first.
+
+        Aliases are matched in the alias index of the process, the
+        database is only queried for the matching ids. Autocompletion
+        should pass a limit, short queries match most groups.
+        """
+        group_ids = search_alias_index(cls, query, visible_only=visible_only, limit=limit)
+        return cls.objects.filter(pk__in=group_ids).order_by('-member_count', 'name')
 
     def save(self, *args, **kwargs):
-        """Override save method."""
+        """Override save method.
+
+        The member counters of existing groups are not saved, they are
+        only written by refresh_member_counts().
+        """
 
         self.name = self.name.lower()
-        super(GroupBase, self).save()
+        update_fields = None
+        if self.pk and not self._state.adding:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super(GroupBase, self).save(update_fields=update_fields)
         if not self.url:
             alias = self.ALIAS_MODEL.objects.create(name=self.name, alias=self)
             self.url = alias.url
-            super(GroupBase, self).save()
+            super(GroupBase, self).save(update_fields=['url'])
 
     def __unicode__(self):
         return self.name
 
+    @classmethod
+    def live_count_annotations(cls):
+        """Return the annotations of GroupQuerySet.with_live_counts()."""
+        return {'live_member_count': Count('members')}
+
+    @classmethod
+    def count_members(cls, pks):
+        """Return the member counts of the groups with the given ids.
+
+        The counts are computed from the memberships and keyed by the
+        name of the stored counter.
+        """
+        name = cls._meta.model_name
+        counts = dict((pk, {'member_count': 0}) for pk in pks)
+        rows = (cls.members.through.objects.filter(**{'{0}__in'.format(name): pks})
+                .values_list(name).annotate(count=Count('pk')).order_by())
+        for pk, count in rows:
+            counts[pk]['member_count'] = count
+        return counts
+
+    @classmethod
+    def refresh_member_counts(cls, pks):
+        """Store the member counts of the groups with the given ids.
+
+        The alias index picks the new counts up when it expires.
+        """
+        for pk, counts in cls.count_members(set(pks)).items():
+            cls.objects.filter(pk=pk).update(**counts)
+
     def merge_groups(self, group_list):
-        """Merge two groups."""
-        for group in group_list:
-            map(lambda x: self.add_member(x), group.members.all())
-            group.aliases.update(alias=self)
-            group.delete()
+        """Merge the given groups into this group.
+
+        Members and aliases move to this group and the merged groups are
+        deleted, with a few queries in one transaction. The members are
+        sent to CIS and reindexed once.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import notify_profiles_changed
+
+        group_ids = [group.pk for group in group_list if group.pk != self.pk]
+        if not group_ids:
+            return
+        name = self._meta.model_name
+        through = self.members.through
+
+        with transaction.atomic():
+            profile_ids = set(through.objects.filter(**{'{0}__in'.format(name): group_ids})
+                                             .values_list('userprofile_id', flat=True))
+            existing = set(through.objects.filter(**{name: self, 'userprofile__in': profile_ids})
+                                          .values_list('userprofile_id', flat=True))
+            through.objects.bulk_create([
+                through(**{'userprofile_id': pk, '{0}_id'.format(name): self.pk})
+                for pk in profile_ids.difference(existing)])
+            self.ALIAS_MODEL.objects.filter(alias__in=group_ids).update(alias=self)
+            type(self).objects.filter(pk__in=group_ids).delete()
+
+        type(self).refresh_member_counts([self.pk])
+        invalidate_alias_index(type(self))
+        if profile_ids:
+            # The shared skills of the groups of the members changed.
+            member_group_ids = (GroupMembership.objects.filter(userprofile__in=profile_ids,
+                                                               status=GroupMembership.MEMBER)
+                                .values_list('group_id', flat=True).distinct())
+            Group.invalidate_shared_skills(member_group_ids)
+            notify_profiles_changed(profile_ids)
 
     def user_can_leave(self, userprofile):
         """Checks if a member of a group can leave."""
@@ -168,6 +250,10 @@ class GroupMembership(models.Model):
         (PENDING_TERMS, _lazy(u'Pending terms')),
         (PENDING, _lazy(u'Pending')),
     )
+    # The only valid (old, new) status changes, there is no demotion.
+    PROMOTIONS = ((PENDING, MEMBER),
+                  (PENDING, PENDING_TERMS),
+                  (PENDING_TERMS, MEMBER))
 
     userprofile = models.ForeignKey('users.UserProfile', db_index=True)
     group = models.ForeignKey('groups.Group', db_index=True)
@@ -182,10 +268,37 @@ class GroupMembership(models.Model):
     def __unicode__(self):
         return u'%s in %s' % (self.userprofile, self.group)
 
+    @classmethod
+    def delete_memberships(cls, memberships):
+        """Delete the memberships of a queryset in a single query.
+
+        The post_delete signals would notify CIS and refresh the caches
+        once per membership, their work is done once for all of them
+        instead. Returns the (group id, userprofile id) of the deleted
+        memberships.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import ViewerClearance
+
+        memberships = cls.objects.filter(pk__in=list(memberships.values_list('pk', flat=True)))
+        rows = list(memberships.values_list('group_id', 'userprofile_id'))
+        if not rows:
+            return rows
+        memberships._raw_delete(memberships.db)
+
+        group_ids = set(group_id for group_id, profile_id in rows)
+        profile_ids = set(profile_id for group_id, profile_id in rows)
+        queue_userprofiles_for_cis(profile_ids)
+        Group.refresh_member_counts(group_ids)
+        Group.invalidate_shared_skills(group_ids)
+        ViewerClearance.invalidate(*profile_ids)
+        return rows
+
 
 class Group(GroupBase):
     """Group class."""
     ALIAS_MODEL = GroupAlias
+    COUNTER_FIELDS = ('member_count', 'pending_count')
 
     # Possible group types
     OPEN = u'yes'
@@ -267,8 +380,7 @@ class Group(GroupBase):
     is_access_group = models.BooleanField(default=False,
                                           choices=ACCESS_GROUP_TYPES,
                                           verbose_name='Is this an access group?')
-
-    objects = GroupManager.from_queryset(GroupQuerySet)()
+    pending_count = models.PositiveIntegerField(default=0, editable=False)
 
     @classmethod
     def get_functional_areas(cls):
@@ -290,19 +402,140 @@ class Group(GroupBase):
         return cls.get_non_functional_areas(curators__isnull=False)
 
     @classmethod
-    def search(cls, query):
-        return super(Group, cls).search(query).visible()
+    def search(cls, query, limit=None):
+        return super(Group, cls).search(query, visible_only=True, limit=limit).visible()
+
+    @classmethod
+    def live_count_annotations(cls):
+        def count_status(status):
+            return Sum(Case(When(groupmembership__status=status, then=1),
+                            default=0, output_field=IntegerField()))
+
+        return {
+            'live_member_count': count_status(GroupMembership.MEMBER),
+            'live_pending_count': count_status(GroupMembership.PENDING),
+        }
+
+    @classmethod
+    def count_members(cls, pks):
+        fields = {
+            GroupMembership.MEMBER: 'member_count',
+            GroupMembership.PENDING: 'pending_count',
+        }
+        counts = dict((pk, dict.fromkeys(fields.values(), 0)) for pk in pks)
+        rows = (GroupMembership.objects.filter(group__in=pks, status__in=fields.keys())
+                .values_list('group', 'status').annotate(count=Count('pk')).order_by())
+        for pk, status, count in rows:
+            counts[pk][fields[status]] = count
+        return counts
+
+    def get_shared_skills(self, limit=SHARED_SKILLS_LIMIT):
+        """Return the skills that more than one member has, most common first.
+
+        The skills are counted with a single query and cached until the
+        memberships of the group or the skills of its members change.
+        The cached skills only have an id and a name.
+        """
+        key = SHARED_SKILLS_CACHE_KEY.format(self.pk)
+        skills = cache.get(key)
+        if skills is None:
+            members_q = Q(members__groupmembership__group=self,
+                          members__groupmembership__status=GroupMembership.MEMBER)
+            skills = list(Skill.objects.filter(members_q)
+                          .annotate(shared=Count('members', distinct=True))
+                          .filter(shared__gt=1).order_by('-shared', 'name')
+                          .values_list('id', 'name')[:limit])
+            cache.set(key, skills, SHARED_SKILLS_CACHE_TIMEOUT)
+        return [Skill(id=pk, name=name) for pk, name in skills]
+
+    @classmethod
+    def invalidate_shared_skills(cls, pks):
+        """Drop the cached shared skills of the groups with the given ids."""
+        cache.delete_many([SHARED_SKILLS_CACHE_KEY.format(pk) for pk in set(pks)])
 
     def merge_groups(self, group_list):
-        for membership in GroupMembership.objects.filter(group__in=group_list):
-            # add_member will never demote someone, so just add them with the current membership
-            # level from the merging group and they'll end up with the highest level from
-            # either group.
-            self.add_member(membership.userprofile, membership.status)
+        """Merge the given groups into this group.
+
+        Memberships, curators, invites and aliases move to this group and
+        the merged groups are deleted, with a few queries in one
+        transaction. Every member keeps the highest status they had in
+        any of the groups. CIS, the search index and the caches are
+        refreshed once.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import UserProfile, ViewerClearance, notify_profiles_changed
 
-        for group in group_list:
-            group.aliases.update(alias=self)
-            group.delete()
+        group_ids = [group.pk for group in group_list if group.pk != self.pk]
+        if not group_ids:
+            return
+        ranks = {GroupMembership.PENDING: 0,
+                 GroupMembership.PENDING_TERMS: 1,
+                 GroupMembership.MEMBER: 2}
+
+        with transaction.atomic():
+            merged = GroupMembership.objects.filter(group__in=group_ids)
+            # The highest status and the first join date of every merged member
+            merged_members = {}
+            rows = merged.values_list('userprofile_id', 'userprofile__user_id', 'status',
+                                      'date_joined')
+            for pk, user_pk, status, date_joined in rows:
+                if pk in merged_members:
+                    old_status, old_date_joined = merged_members[pk][1:]
+                    if ranks[old_status] > ranks[status]:
+                        status = old_status
+                    if old_date_joined and (not date_joined or old_date_joined < date_joined):
+                        date_joined = old_date_joined
+                merged_members[pk] = (user_pk, status, date_joined)
+
+            memberships = self.groupmembership_set.filter(userprofile__in=merged_members.keys())
+            existing = dict(memberships.values_list('userprofile_id', 'status'))
+
+            GroupMembership.objects.bulk_create([
+                GroupMembership(userprofile_id=pk, group=self, status=status,
+                                date_joined=date_joined)
+                for pk, (user_pk, status, date_joined) in merged_members.items()
+                if pk not in existing])
+
+            # add_member() never demotes anyone, neither does the merge.
+            promoted = dict((pk, (user_pk, existing[pk], status))
+                            for pk, (user_pk, status, date_joined) in merged_members.items()
+                            if (existing.get(pk), status) in GroupMembership.PROMOTIONS)
+            for status in [GroupMembership.PENDING_TERMS, GroupMembership.MEMBER]:
+                pks = [pk for pk, change in promoted.items() if change[2] == status]
+                if pks:
+                    memberships.filter(userprofile__in=pks).update(status=status,
+                                                                   updated_on=now())
+            memberships.filter(needs_renewal=True).update(needs_renewal=False, updated_on=now())
+
+            self.curators.add(*UserProfile.objects.filter(groups_curated__in=group_ids).distinct())
+
+            # Keep one invite per redeemer, the others are deleted with their group.
+            invites = (Invite.objects.filter(group__in=group_ids)
+                                     .exclude(redeemer__in=self.invite_set.values('redeemer')))
+            invite_ids = dict(invites.order_by('id').values_list('redeemer_id', 'id'))
+            Invite.objects.filter(id__in=invite_ids.values()).update(group=self)
+
+            GroupAlias.objects.filter(alias__in=group_ids).update(alias=self)
+
+            # Also notifies CIS about the merged members.
+            GroupMembership.delete_memberships(merged)
+            Group.objects.filter(pk__in=group_ids).delete()
+
+        changes = [change for change in promoted.values()
+                   if change[2] in [GroupMembership.PENDING, GroupMembership.MEMBER]]
+        if changes:
+            email_membership_changes.delay(self.pk, changes)
+        if self.name == settings.NDA_GROUP:
+            for pk, change in promoted.items():
+                if change[2] == GroupMembership.MEMBER:
+                    subscribe_user_to_basket.delay(pk, [settings.BASKET_NDA_NEWSLETTER])
+
+        Group.refresh_member_counts([self.pk])
+        Group.invalidate_shared_skills([self.pk] + group_ids)
+        ViewerClearance.invalidate(*merged_members.keys())
+        invalidate_alias_index(Group)
+        if merged_members:
+            notify_profiles_changed(merged_members.keys())
 
     def add_member(self, userprofile, status=GroupMembership.MEMBER, inviter=None):
         """
@@ -320,7 +553,7 @@ class Group(GroupBase):
                                                               group=self,
                                                               defaults=defaults)
 
-        send_userprofile_to_cis.delay(membership.userprofile.pk)
+        queue_userprofile_for_cis(membership.userprofile.pk)
 
         # Remove the need_removal flag in any case
         # We have a renewal, let's save the object.
@@ -330,18 +563,11 @@ class Group(GroupBase):
 
         if membership.status != status:
             # Status changed
-            # The only valid status change states are:
-            # PENDING to MEMBER
-            # PENDING to PENDING_TERMS
-            # PENDING_TERMS to MEMBER
-
+            # The only valid status change states are in GroupMembership.PROMOTIONS
             old_status = membership.status
             membership.status = status
-            statuses = [(GroupMembership.PENDING, GroupMembership.MEMBER),
-                        (GroupMembership.PENDING, GroupMembership.PENDING_TERMS),
-                        (GroupMembership.PENDING_TERMS, GroupMembership.MEMBER)]
 
-            if (old_status, status) in statuses:
+            if (old_status, status) in GroupMembership.PROMOTIONS:
                 # Status changed
                 membership.save()
                 if membership.status in [GroupMembership.PENDING, GroupMembership.MEMBER]:
@@ -368,9 +594,6 @@ class Group(GroupBase):
         If a user is a member of a reviewed or closed group,
         then the membership is in a pending state.
         """
-        # Avoid circular dependencies
-        from mozillians.users.models import UserProfile
-
         try:
             membership = GroupMembership.objects.get(group=self, userprofile=userprofile)
         except GroupMembership.DoesNotExist:
@@ -392,28 +615,10 @@ class Group(GroupBase):
             # if the group to remove is the NDA
             if not GroupMembership.objects.filter(userprofile=userprofile,
                                                   group__name__in=settings.NDA_ACCESS_GROUPS):
-                group_memberships = GroupMembership.objects.none()
-                # If the user is not staff, we need to delete the memberships to any access group
-                if not userprofile.can_create_access_groups:
-                    group_memberships = GroupMembership.objects.filter(userprofile=userprofile,
-                                                                       group__is_access_group=True)
-
-                for access_membership in group_memberships:
-                    group = access_membership.group
-                    if not group.curator_can_leave(userprofile):
-                        # If the user is the only curator, let's add the superusers as curators
-                        # as a fallback option
-                        for super_user in UserProfile.objects.filter(user__is_superuser=True):
-                            group.curators.add(super_user)
-                            if not group.has_member(super_user):
-                                group.add_member(super_user)
-                    group.curators.remove(userprofile)
-                    access_membership.delete()
-                    # Notify CIS about this change
-                    send_userprofile_to_cis.delay(access_membership.userprofile.pk)
+                self._remove_from_access_groups(userprofile)
 
             # Notify CIS about this change
-            send_userprofile_to_cis.delay(membership.userprofile.pk)
+            queue_userprofile_for_cis(membership.userprofile.pk)
 
         # Group is either of Group.REVIEWED or Group.CLOSED, change membership to `status`
         else:
@@ -430,6 +635,152 @@ class Group(GroupBase):
         if send_email:
             email_membership_change.delay(self.pk, userprofile.user.pk, old_status, status)
 
+    def add_members(self, userprofiles, status=GroupMembership.MEMBER, inviter=None):
+        """
+        Add many users to this group at once, see add_member().
+
+        Memberships are created, renewed and promoted with a few queries,
+        the emails are sent by a single task and CIS is notified once.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import ViewerClearance
+
+        profile_ids = set(userprofile.pk for userprofile in userprofiles)
+        if not profile_ids:
+            return
+        memberships = GroupMembership.objects.filter(group=self, userprofile__in=profile_ids)
+        existing = dict((row[0], row[1:]) for row in memberships.values_list(
+            'userprofile_id', 'userprofile__user_id', 'status', 'needs_renewal'))
+
+        GroupMembership.objects.bulk_create([
+            GroupMembership(userprofile_id=pk, group=self, status=status, date_joined=now())
+            for pk in profile_ids.difference(existing)])
+
+        # Remove the need_removal flag in any case
+        renewed = [pk for pk, (user_pk, old_status, needs_renewal) in existing.items()
+                   if needs_renewal]
+        if renewed:
+            (GroupMembership.objects.filter(group=self, userprofile__in=renewed)
+                                    .update(needs_renewal=False, updated_on=now()))
+
+        promoted = dict((pk, (user_pk, old_status))
+                        for pk, (user_pk, old_status, needs_renewal) in existing.items()
+                        if (old_status, status) in GroupMembership.PROMOTIONS)
+        if promoted:
+            (GroupMembership.objects.filter(group=self, userprofile__in=promoted.keys())
+                                    .update(status=status, updated_on=now()))
+            if status in [GroupMembership.PENDING, GroupMembership.MEMBER]:
+                email_membership_changes.delay(
+                    self.pk, [(user_pk, old_status, status)
+                              for user_pk, old_status in promoted.values()])
+
+            # Since there is no demotion, we can check if the new status is MEMBER and
+            # subscribe the users to the NDA newsletter if the group is NDA
+            if self.name == settings.NDA_GROUP and status == GroupMembership.MEMBER:
+                for pk in promoted:
+                    subscribe_user_to_basket.delay(pk, [settings.BASKET_NDA_NEWSLETTER])
+
+        if inviter:
+            # Set the invites to the last person who renewed the memberships
+            (Invite.objects.filter(group=self, redeemer__in=profile_ids)
+                           .update(inviter=inviter, updated=now()))
+
+        # The bulk queries skip the GroupMembership signals.
+        queue_userprofiles_for_cis(profile_ids)
+        if len(profile_ids) > len(existing) or renewed or promoted:
+            Group.refresh_member_counts([self.pk])
+            Group.invalidate_shared_skills([self.pk])
+            ViewerClearance.invalidate(*profile_ids)
+
+    def remove_members(self, userprofiles, status=None):
+        """
+        Remove many users from this group at once, see remove_member().
+
+        Memberships are deleted with GroupMembership.delete_memberships()
+        or moved to status with a single update. The emails are sent by a
+        single task.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import UserProfile, ViewerClearance
+
+        memberships = GroupMembership.objects.filter(
+            group=self, userprofile__in=[userprofile.pk for userprofile in userprofiles])
+        rows = list(memberships.order_by('id').values_list('id', 'userprofile_id',
+                                                           'userprofile__user_id', 'status'))
+        if not rows:
+            return
+
+        # Same rules as remove_member()
+        if not status or self.accepting_new_members == Group.OPEN:
+            deleted, updated = rows, []
+        else:
+            deleted = [row for row in rows if row[3] != GroupMembership.MEMBER]
+            updated = [row for row in rows if row[3] == GroupMembership.MEMBER]
+
+        if deleted:
+            deleted_profile_ids = [row[1] for row in deleted]
+            GroupMembership.delete_memberships(
+                GroupMembership.objects.filter(id__in=[row[0] for row in deleted]))
+            # delete the invitations to the group if they exist
+            Invite.objects.filter(group=self, redeemer__in=deleted_profile_ids).delete()
+            # Remove all the access groups of the users without an NDA membership
+            profiles = (UserProfile.objects.filter(id__in=deleted_profile_ids)
+                        .exclude(groupmembership__group__name__in=settings.NDA_ACCESS_GROUPS))
+            for userprofile in profiles:
+                self._remove_from_access_groups(userprofile)
+
+        if updated:
+            updated_profile_ids = [row[1] for row in updated]
+            (GroupMembership.objects.filter(id__in=[row[0] for row in updated])
+                                    .update(status=status, needs_renewal=False,
+                                            updated_on=now()))
+            # The update skips the GroupMembership signals.
+            queue_userprofiles_for_cis(updated_profile_ids)
+            Group.refresh_member_counts([self.pk])
+            Group.invalidate_shared_skills([self.pk])
+            ViewerClearance.invalidate(*updated_profile_ids)
+
+        profile_ids = [row[1] for row in rows]
+        # If group is the NDA group, unsubscribe users from the newsletter.
+        if self.name == settings.NDA_GROUP:
+            profiles = UserProfile.objects.filter(id__in=profile_ids).select_related('user')
+            for userprofile in profiles:
+                unsubscribe_from_basket_task.delay(userprofile.email,
+                                                   [settings.BASKET_NDA_NEWSLETTER])
+
+        email_membership_changes.delay(self.pk, [(row[2], row[3], status) for row in rows])
+
+    def add_superusers_as_curators(self):
+        """Add the superusers as curators and members of this group.
+
+        This is the fallback when the only curator of an access group leaves.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import UserProfile
+
+        super_users = UserProfile.objects.filter(user__is_superuser=True)
+        self.curators.add(*super_users)
+        members = self.groupmembership_set.filter(status=GroupMembership.MEMBER)
+        self.add_members(super_users.exclude(id__in=members.values('userprofile')))
+
+    def _remove_from_access_groups(self, userprofile):
+        """Remove a user without NDA access from the access groups."""
+        # If the user is not staff, we need to delete the memberships to any access group
+        if userprofile.can_create_access_groups:
+            return
+        group_memberships = GroupMembership.objects.filter(userprofile=userprofile,
+                                                           group__is_access_group=True)
+        for access_membership in group_memberships.select_related('group'):
+            group = access_membership.group
+            if not group.curator_can_leave(userprofile):
+                # If the user is the only curator, let's add the superusers as curators
+                # as a fallback option
+                group.add_superusers_as_curators()
+            group.curators.remove(userprofile)
+            access_membership.delete()
+            # Notify CIS about this change
+            queue_userprofile_for_cis(access_membership.userprofile_id)
+
     def has_member(self, userprofile):
         """
         Return True if this user is in this group with status MEMBER.
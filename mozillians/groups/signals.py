@@ -1,11 +1,108 @@
 from django.db.models import signals
 from django.dispatch import receiver
 
-from mozillians.groups.models import GroupMembership
+from mozillians.groups.alias_index import update_alias_index
+from mozillians.groups.models import Group, GroupAlias, GroupMembership, Skill, SkillAlias
+from mozillians.users.models import UserProfile
 
 
 @receiver(signals.post_delete, sender=GroupMembership, dispatch_uid='delete_groupmembership_sig')
 def delete_groupmembership(sender, instance, **kwargs):
-    from mozillians.users.tasks import send_userprofile_to_cis
+    from mozillians.users.tasks import queue_userprofile_for_cis
 
-    send_userprofile_to_cis.delay(instance.userprofile.pk)
+    queue_userprofile_for_cis(instance.userprofile_id)
+
+
+# Keep the denormalized member counters and the cached shared skills
+# of groups in sync.
+@receiver(signals.post_delete, sender=GroupMembership,
+          dispatch_uid='update_group_member_counts_delete_sig')
+@receiver(signals.post_save, sender=GroupMembership,
+          dispatch_uid='update_group_member_counts_save_sig')
+def update_group_member_counts(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Group.refresh_member_counts([instance.group_id])
+        Group.invalidate_shared_skills([instance.group_id])
+
+
+@receiver(signals.m2m_changed, sender=UserProfile.skills.through,
+          dispatch_uid='update_skill_member_counts_sig')
+def update_skill_member_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # The cleared relations are not known after the clear.
+        related = instance.members if reverse else instance.skills
+        instance._cleared_ids = list(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        skill_ids, profile_ids = [instance.pk], pk_set
+    else:
+        skill_ids, profile_ids = pk_set, [instance.pk]
+    if skill_ids and profile_ids:
+        Skill.refresh_member_counts(skill_ids)
+        # The shared skills of the groups of the profiles changed.
+        group_ids = (GroupMembership.objects.filter(userprofile__in=profile_ids,
+                                                    status=GroupMembership.MEMBER)
+                     .values_list('group_id', flat=True).distinct())
+        Group.invalidate_shared_skills(group_ids)
+
+
+# Keep the alias index of this process up to date.
+def _get_indexed_values(instance):
+    """Return the values of the fields of instance stored in the alias index."""
+    fields = [field for field in ('name', 'visible', 'alias_id') if hasattr(instance, field)]
+    return fields, tuple(getattr(instance, field) for field in fields)
+
+
+@receiver(signals.pre_save, sender=Group, dispatch_uid='load_alias_index_group_sig')
+@receiver(signals.pre_save, sender=Skill, dispatch_uid='load_alias_index_skill_sig')
+@receiver(signals.pre_save, sender=GroupAlias, dispatch_uid='load_alias_index_alias_sig')
+@receiver(signals.pre_save, sender=SkillAlias, dispatch_uid='load_alias_index_skill_alias_sig')
+def load_alias_index_values(sender, instance, raw=False, **kwargs):
+    """Remember the indexed values before the save, to skip unchanged saves."""
+    instance._indexed_values = None
+    if instance.pk and not raw:
+        fields, values = _get_indexed_values(instance)
+        instance._indexed_values = (sender.objects.filter(pk=instance.pk)
+                                    .values_list(*fields).first())
+
+
+def _indexed_values_changed(sender, instance):
+    loaded = instance.__dict__.pop('_indexed_values', None)
+    return loaded != _get_indexed_values(instance)[1]
+
+
+@receiver(signals.post_save, sender=Group, dispatch_uid='update_alias_index_group_save_sig')
+@receiver(signals.post_save, sender=Skill, dispatch_uid='update_alias_index_skill_save_sig')
+def update_alias_index_group(sender, instance, raw=False, **kwargs):
+    if not raw and _indexed_values_changed(sender, instance):
+        update_alias_index(sender, lambda index: index.set_group(
+            instance.pk, instance.name, instance.is_visible, instance.member_count))
+
+
+@receiver(signals.post_delete, sender=Group, dispatch_uid='update_alias_index_group_delete_sig')
+@receiver(signals.post_delete, sender=Skill, dispatch_uid='update_alias_index_skill_delete_sig')
+def update_alias_index_group_delete(sender, instance, **kwargs):
+    update_alias_index(sender, lambda index: index.remove_group(instance.pk))
+
+
+@receiver(signals.post_save, sender=GroupAlias, dispatch_uid='update_alias_index_alias_sig')
+@receiver(signals.post_save, sender=SkillAlias, dispatch_uid='update_alias_index_skill_alias_sig')
+def update_alias_index_alias(sender, instance, raw=False, **kwargs):
+    if not raw and _indexed_values_changed(sender, instance):
+        model = sender._meta.get_field('alias').related_model
+        update_alias_index(model, lambda index: index.set_alias(
+            instance.pk, instance.name, instance.alias_id))
+
+
+@receiver(signals.post_delete, sender=GroupAlias,
+          dispatch_uid='update_alias_index_alias_delete_sig')
+@receiver(signals.post_delete, sender=SkillAlias,
+          dispatch_uid='update_alias_index_skill_alias_delete_sig')
+def update_alias_index_alias_delete(sender, instance, **kwargs):
+    model = sender._meta.get_field('alias').related_model
+    update_alias_index(model, lambda index: index.remove_alias(instance.pk))
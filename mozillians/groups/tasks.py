@@ -28,6 +28,27 @@ def remove_empty_groups():
         model.objects.annotate(mcount=Count('members')).filter(mcount=0).delete()
 
 
+@app.task(ignore_result=True)
+def reconcile_member_counts():
+    """Fix the stored member counts of groups and skills that drifted.
+
+    The counters are kept in sync by the membership signals, this
+    catches up with memberships changed without them, e.g. in bulk.
+    """
+
+    from mozillians.groups.models import Group, Skill
+
+    for model in [Group, Skill]:
+        fields = dict((name, name[len('live_'):]) for name in model.live_count_annotations())
+        groups = (model.objects.with_live_counts().order_by()
+                  .values('pk', *(fields.keys() + fields.values())))
+        for group in groups:
+            stale = dict((field, group[live]) for live, field in fields.items()
+                         if group[field] != group[live])
+            if stale:
+                model.objects.filter(pk=group['pk']).update(**stale)
+
+
 # TODO: Schedule this task nightly
 
 @app.task(ignore_result=True)
@@ -90,10 +111,34 @@ def email_membership_change(group_pk, user_pk, old_status, new_status):
     This is queued from Group.add_member() and Group.remove_member().
     """
 
-    from mozillians.groups.models import Group, GroupMembership
+    from mozillians.groups.models import Group
 
     group = Group.objects.get(pk=group_pk)
     user = User.objects.get(pk=user_pk)
+    _send_membership_change_email(group, user, old_status, new_status)
+
+
+@app.task(ignore_result=True)
+def email_membership_changes(group_pk, changes):
+    """
+    Email users that their group membership status has changed.
+
+    changes is a list of (user_pk, old_status, new_status), see
+    email_membership_change(). This is queued from Group.add_members()
+    and Group.remove_members().
+    """
+
+    from mozillians.groups.models import Group
+
+    group = Group.objects.get(pk=group_pk)
+    users = User.objects.select_related('userprofile').in_bulk(
+        [change[0] for change in changes])
+    for user_pk, old_status, new_status in changes:
+        _send_membership_change_email(group, users[user_pk], old_status, new_status)
+
+
+def _send_membership_change_email(group, user, old_status, new_status):
+    from mozillians.groups.models import GroupMembership
 
     # TODO: Switch locale to user's preferred language so translation will occur
     # Using English for now
@@ -143,11 +188,11 @@ def invalidate_group_membership():
         memberships = (group.groupmembership_set.filter(updated_on__lte=last_update)
                                                 .exclude(userprofile__id__in=curator_ids))
 
-        for member in memberships:
-            status = None
-            if group.accepting_new_members != Group.OPEN:
-                status = GroupMembership.PENDING
-            group.remove_member(member.userprofile, status=status)
+        status = None
+        if group.accepting_new_members != Group.OPEN:
+            status = GroupMembership.PENDING
+        profiles = [member.userprofile for member in memberships.select_related('userprofile')]
+        group.remove_members(profiles, status=status)
 
 
 @app.task
@@ -0,0 +1,102 @@
+from django.core.cache.backends.locmem import LocMemCache
+
+from mock import patch
+from nose.tools import eq_, ok_
+
+from mozillians.common.tests import TestCase
+from mozillians.groups.alias_index import get_alias_index, get_trigrams
+from mozillians.groups.models import Group, Skill
+from mozillians.groups.tests import GroupAliasFactory, GroupFactory, SkillFactory
+from mozillians.users.tests import UserFactory
+
+
+class AliasIndexTests(TestCase):
+    def setUp(self):
+        cache_patcher = patch('mozillians.groups.alias_index.cache',
+                              LocMemCache('alias-index-tests', {}))
+        indexes_patcher = patch.dict('mozillians.groups.alias_index._indexes', clear=True)
+        cache_patcher.start()
+        indexes_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        self.addCleanup(indexes_patcher.stop)
+
+    def test_get_trigrams(self):
+        eq_(get_trigrams('abcd'), set(['abc', 'bcd']))
+        eq_(get_trigrams('ab'), set())
+
+    def test_search_ranked_by_member_count(self):
+        group_1 = GroupFactory.create(name='foo small')
+        group_2 = GroupFactory.create(name='big foo')
+        GroupFactory.create(name='bar')
+        for user in UserFactory.create_batch(2):
+            group_2.add_member(user.userprofile)
+
+        eq_(get_alias_index(Group).search('FOO'), [group_2.pk, group_1.pk])
+        eq_(get_alias_index(Group).search('fo', limit=1), [group_2.pk])
+        eq_(list(Group.search('foo')), [group_2, group_1])
+
+    def test_search_visible_only(self):
+        group = GroupFactory.create(name='foo', visible=False)
+        eq_(get_alias_index(Group).search('foo'), [group.pk])
+        eq_(get_alias_index(Group).search('foo', visible_only=True), [])
+        eq_(list(Group.search('foo')), [])
+
+    @patch('mozillians.groups.alias_index.transaction.on_commit', lambda func: func())
+    def test_incremental_updates(self):
+        group = GroupFactory.create(name='foo')
+        index = get_alias_index(Group)
+
+        alias = GroupAliasFactory.create(alias=group, name='bar')
+        with self.assertNumQueries(0):
+            ok_(get_alias_index(Group) is index)
+            eq_(index.search('bar'), [group.pk])
+
+        alias.delete()
+        eq_(index.search('bar'), [])
+        group.delete()
+        eq_(get_alias_index(Group).search('foo'), [])
+
+    @patch('mozillians.groups.alias_index.transaction.on_commit', lambda func: func())
+    def test_other_process_changes_rebuild(self):
+        skill = SkillFactory.create(name='foo')
+        index = get_alias_index(Skill)
+        # Changes of another process only bump the shared version.
+        with patch.dict('mozillians.groups.alias_index._indexes', clear=True):
+            SkillFactory.create(name='food')
+        ok_(get_alias_index(Skill) is not index)
+        eq_(len(get_alias_index(Skill).search('foo')), 2)
+        ok_(skill.pk in get_alias_index(Skill).search('foo'))
+
+    def test_version_changed_on_commit(self):
+        group = GroupFactory.create(name='foo')
+        index = get_alias_index(Group)
+        version = index.version
+        with patch('mozillians.groups.alias_index.transaction.on_commit') as on_commit_mock:
+            GroupAliasFactory.create(alias=group, name='bar')
+        # Every index is updated after the commit.
+        eq_(index.search('bar'), [])
+        eq_(index.version, version)
+        ok_(on_commit_mock.called)
+
+        on_commit_mock.call_args[0][0]()
+        eq_(index.search('bar'), [group.pk])
+        ok_(index.version != version)
+        ok_(get_alias_index(Group) is index)
+
+    def test_unchanged_save_keeps_version(self):
+        group = GroupFactory.create(name='foo')
+        get_alias_index(Group)
+        with patch('mozillians.groups.alias_index.transaction.on_commit') as on_commit_mock:
+            group = Group.objects.get(pk=group.pk)
+            group.max_reminder = 10
+            group.save()
+            ok_(not on_commit_mock.called)
+
+            group.visible = False
+            group.save()
+            ok_(on_commit_mock.called)
+
+    def test_search_limit(self):
+        skills = [SkillFactory.create(name='foo{0}'.format(i)) for i in range(3)]
+        eq_(len(Skill.search('fo', limit=2)), 2)
+        eq_(set(Skill.search('fo')), set(skills))
@@ -110,18 +110,14 @@ class TestGroupRemoveMember(TestCase):
         # that is used to email the member.
         with override_script_prefix('/fr/'):
             url = reverse('groups:confirm_member', args=[self.group.url, user.userprofile.pk])
-        with patch('mozillians.groups.models.email_membership_change',
+        with patch('mozillians.groups.models.email_membership_changes',
                    autospec=True) as mock_email:
             with self.login(curator) as client:
                 response = client.post(url, follow=False)
         eq_(302, response.status_code)
         # email sent for curated group
-        ok_(mock_email.delay.called)
-        group_pk, user_pk, old_status, new_status = mock_email.delay.call_args[0]
-        eq_(self.group.pk, group_pk)
-        eq_(user.pk, user_pk)
-        eq_(GroupMembership.PENDING, old_status)
-        eq_(GroupMembership.MEMBER, new_status)
+        mock_email.delay.assert_called_once_with(
+            self.group.pk, [(user.pk, GroupMembership.PENDING, GroupMembership.MEMBER)])
 
     def test_rejecting_sends_email(self):
         # when curator rejects someone, they are sent an email
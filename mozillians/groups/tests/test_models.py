@@ -3,16 +3,23 @@ from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
 
-from mock import patch
+from mock import ANY, call, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
 from mozillians.groups.models import Group, GroupAlias, GroupMembership, Skill
-from mozillians.groups.tests import GroupAliasFactory, GroupFactory, SkillFactory
+from mozillians.groups.tests import (GroupAliasFactory, GroupFactory, InviteFactory,
+                                     SkillFactory)
 from mozillians.users.tests import UserFactory
 
 
 class GroupBaseTests(TestCase):
+    def setUp(self):
+        # The alias index is only updated on commit, start from a new one.
+        indexes_patcher = patch.dict('mozillians.groups.alias_index._indexes', clear=True)
+        indexes_patcher.start()
+        self.addCleanup(indexes_patcher.stop)
+
     def test_groups_are_saved_lowercase(self):
         group = GroupFactory.create(name='FooBAR')
         eq_(group.name, 'foobar')
@@ -75,6 +82,50 @@ class GroupBaseTests(TestCase):
         # user5 pending in both, and is still pending
         ok_(master_group.has_pending_member(user5.userprofile))
 
+    @patch('mozillians.users.models.notify_profiles_changed')
+    def test_merge_skills(self, notify_mock):
+        master_skill = SkillFactory.create()
+        merge_skill = SkillFactory.create()
+        shared, moved = [UserFactory.create().userprofile for i in range(2)]
+        shared.skills.add(master_skill, merge_skill)
+        moved.skills.add(merge_skill)
+        notify_mock.reset_mock()
+
+        master_skill.merge_groups([merge_skill])
+        ok_(not Skill.objects.filter(pk=merge_skill.pk).exists())
+        eq_(set(master_skill.members.all()), set([shared, moved]))
+        ok_(master_skill.aliases.filter(name=merge_skill.name).exists())
+        eq_(Skill.objects.get(pk=master_skill.pk).member_count, 2)
+        notify_mock.assert_called_once_with(set([shared.pk, moved.pk]))
+
+    @patch('mozillians.users.models.notify_profiles_changed')
+    @patch('mozillians.groups.models.queue_userprofiles_for_cis')
+    @patch('mozillians.groups.models.email_membership_changes')
+    def test_merge_groups_curators_and_invites(self, mail_task, cis_mock, notify_mock):
+        master_group = GroupFactory.create()
+        merge_group_1 = GroupFactory.create()
+        merge_group_2 = GroupFactory.create()
+        curator, member, invited = [UserFactory.create().userprofile for i in range(3)]
+        merge_group_1.curators.add(curator)
+        merge_group_2.curators.add(curator)
+        GroupMembership.objects.create(userprofile=member, group=master_group,
+                                       status=GroupMembership.PENDING)
+        GroupMembership.objects.create(userprofile=member, group=merge_group_1,
+                                       status=GroupMembership.MEMBER)
+        InviteFactory.create(group=merge_group_1, redeemer=invited)
+        InviteFactory.create(group=merge_group_2, redeemer=invited)
+
+        master_group.merge_groups([merge_group_1, merge_group_2])
+
+        eq_(list(master_group.curators.all()), [curator])
+        eq_(list(master_group.invite_set.values_list('redeemer', flat=True)), [invited.pk])
+        ok_(master_group.has_member(member))
+        eq_(Group.objects.get(pk=master_group.pk).member_count, 1)
+        mail_task.delay.assert_called_once_with(
+            master_group.pk, [(member.user.pk, GroupMembership.PENDING, GroupMembership.MEMBER)])
+        cis_mock.assert_called_once_with(set([member.pk]))
+        notify_mock.assert_called_once_with([member.pk])
+
     def test_search(self):
         group = GroupFactory.create(visible=True)
         GroupFactory.create(visible=False)
@@ -313,6 +364,105 @@ class GroupTests(TestCase):
         group.remove_member(user.userprofile)
         ok_(not group.has_member(user.userprofile))
 
+    @patch('mozillians.groups.models.queue_userprofiles_for_cis')
+    @patch('mozillians.groups.models.email_membership_changes')
+    def test_add_members(self, mail_task, cis_mock):
+        new, pending, member = [UserFactory.create().userprofile for i in range(3)]
+        group = GroupFactory.create()
+        GroupMembership.objects.create(userprofile=pending, group=group,
+                                       status=GroupMembership.PENDING)
+        GroupMembership.objects.create(userprofile=member, group=group,
+                                       status=GroupMembership.MEMBER, needs_renewal=True)
+
+        group.add_members([new, pending, member])
+        for profile in [new, pending, member]:
+            ok_(GroupMembership.objects.filter(userprofile=profile, group=group,
+                                               status=GroupMembership.MEMBER,
+                                               needs_renewal=False).exists())
+        mail_task.delay.assert_called_once_with(
+            group.pk, [(pending.user.pk, GroupMembership.PENDING, GroupMembership.MEMBER)])
+        cis_mock.assert_called_once_with(set([new.pk, pending.pk, member.pk]))
+        eq_(Group.objects.get(pk=group.pk).member_count, 3)
+
+        # never demotes anyone
+        mail_task.reset_mock()
+        group.add_members([new, pending], status=GroupMembership.PENDING)
+        eq_(group.groupmembership_set.filter(status=GroupMembership.MEMBER).count(), 3)
+        ok_(not mail_task.delay.called)
+
+    @patch('mozillians.groups.models.queue_userprofiles_for_cis')
+    @patch('mozillians.groups.models.email_membership_changes')
+    def test_remove_members(self, mail_task, cis_mock):
+        pending, member = [UserFactory.create().userprofile for i in range(2)]
+        group = GroupFactory.create(accepting_new_members=Group.REVIEWED)
+        GroupMembership.objects.create(userprofile=pending, group=group,
+                                       status=GroupMembership.PENDING)
+        GroupMembership.objects.create(userprofile=member, group=group,
+                                       status=GroupMembership.MEMBER)
+
+        group.remove_members([pending, member], status=GroupMembership.PENDING)
+        ok_(not GroupMembership.objects.filter(userprofile=pending, group=group).exists())
+        ok_(GroupMembership.objects.filter(userprofile=member, group=group,
+                                           status=GroupMembership.PENDING).exists())
+        mail_task.delay.assert_called_once_with(
+            group.pk, [(pending.user.pk, GroupMembership.PENDING, GroupMembership.PENDING),
+                       (member.user.pk, GroupMembership.MEMBER, GroupMembership.PENDING)])
+        eq_(cis_mock.call_args_list, [call(set([pending.pk])), call([member.pk])])
+        eq_(Group.objects.get(pk=group.pk).member_count, 0)
+
+    @patch('mozillians.groups.models.queue_userprofiles_for_cis')
+    def test_delete_memberships(self, cis_mock):
+        group_1, group_2 = GroupFactory.create(), GroupFactory.create()
+        profile = UserFactory.create().userprofile
+        group_1.add_member(profile)
+        group_2.add_member(profile)
+        kept = UserFactory.create().userprofile
+        group_1.add_member(kept)
+        cis_mock.reset_mock()
+
+        rows = GroupMembership.delete_memberships(
+            GroupMembership.objects.filter(userprofile=profile))
+        eq_(sorted(rows), sorted([(group_1.pk, profile.pk), (group_2.pk, profile.pk)]))
+        cis_mock.assert_called_once_with(set([profile.pk]))
+        eq_(Group.objects.get(pk=group_1.pk).member_count, 1)
+        eq_(Group.objects.get(pk=group_2.pk).member_count, 0)
+        eq_(GroupMembership.delete_memberships(GroupMembership.objects.none()), [])
+
+    @patch('mozillians.groups.models.cache')
+    def test_get_shared_skills(self, cache_mock):
+        cache_mock.get.return_value = None
+        group = GroupFactory.create()
+        skill_1, skill_2, skill_3 = [SkillFactory.create(name=name) for name in 'abc']
+        users = UserFactory.create_batch(3)
+        for user in users:
+            group.add_member(user.userprofile)
+            user.userprofile.skills.add(skill_3)
+        users[0].userprofile.skills.add(skill_1, skill_2)
+        users[1].userprofile.skills.add(skill_2)
+
+        with self.assertNumQueries(1):
+            skills = group.get_shared_skills()
+        eq_([(skill.id, skill.name) for skill in skills], [(skill_3.id, 'c'), (skill_2.id, 'b')])
+        cache_mock.set.assert_called_once_with('groups:shared_skills:{0}'.format(group.pk),
+                                               [(skill_3.id, 'c'), (skill_2.id, 'b')], ANY)
+
+        cache_mock.get.return_value = [(skill_1.id, 'a')]
+        with self.assertNumQueries(0):
+            eq_([skill.name for skill in group.get_shared_skills()], ['a'])
+
+    @patch('mozillians.groups.models.cache')
+    def test_shared_skills_invalidated(self, cache_mock):
+        group = GroupFactory.create()
+        skill = SkillFactory.create()
+        user = UserFactory.create()
+        group.add_member(user.userprofile)
+        key = 'groups:shared_skills:{0}'.format(group.pk)
+        cache_mock.delete_many.assert_called_with([key])
+
+        cache_mock.reset_mock()
+        user.userprofile.skills.add(skill)
+        cache_mock.delete_many.assert_called_once_with([key])
+
 
 class GroupAliasBaseTests(TestCase):
     def test_auto_slug_field(self):
@@ -368,3 +518,40 @@ class GroupManagerTests(TestCase):
             group.add_member(u.userprofile, status=GroupMembership.PENDING_TERMS)
 
         eq_(Group.objects.get(name='foo').member_count, 3)
+
+    def test_group_counts_follow_memberships(self):
+        group = GroupFactory.create(name='foo')
+        user_1, user_2 = UserFactory.create_batch(2)
+        group.add_member(user_1.userprofile, status=GroupMembership.PENDING)
+        group.add_member(user_2.userprofile)
+        group = Group.objects.get(pk=group.pk)
+        eq_((group.member_count, group.pending_count), (1, 1))
+
+        group.add_member(user_1.userprofile)
+        group.remove_member(user_2.userprofile)
+        group = Group.objects.get(pk=group.pk)
+        eq_((group.member_count, group.pending_count), (1, 0))
+
+        # Saving a stale instance does not overwrite the counters.
+        group.add_member(user_2.userprofile)
+        group.description = 'bar'
+        group.save()
+        eq_(Group.objects.get(pk=group.pk).member_count, 2)
+
+    def test_skill_counts_follow_memberships(self):
+        skill = SkillFactory.create(name='foo')
+        user = UserFactory.create()
+        user.userprofile.skills.add(skill)
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 1)
+        user.userprofile.skills.clear()
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 0)
+
+    def test_with_live_counts(self):
+        group = GroupFactory.create(name='foo')
+        user = UserFactory.create()
+        group.add_member(user.userprofile, status=GroupMembership.PENDING)
+        Group.objects.filter(pk=group.pk).update(pending_count=0)
+
+        group = Group.objects.with_live_counts().get(pk=group.pk)
+        eq_((group.live_member_count, group.live_pending_count), (0, 1))
+        eq_(group.pending_count, 0)
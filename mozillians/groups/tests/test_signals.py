@@ -23,6 +23,6 @@ class SignalsTests(TestCase):
 
         instance = GroupMembership.objects.all()[0]
 
-        with patch('mozillians.users.tasks.send_userprofile_to_cis') as mock_cis:
+        with patch('mozillians.users.tasks.queue_userprofile_for_cis') as mock_cis:
             signals.delete_groupmembership(GroupMembership, instance)
-            mock_cis.delay.assert_called_once_with(user.userprofile.pk)
+            mock_cis.assert_called_once_with(user.userprofile.pk)
@@ -13,7 +13,7 @@ from mozillians.common.tests import TestCase
 from mozillians.groups import tasks
 from mozillians.groups.models import Group, GroupMembership, Skill
 from mozillians.groups.tasks import (invalidate_group_membership, email_membership_change,
-                                     notify_membership_renewal)
+                                     email_membership_changes, notify_membership_renewal)
 from mozillians.groups.tests import GroupFactory, InviteFactory, SkillFactory
 from mozillians.users.tests import UserFactory
 
@@ -37,6 +37,21 @@ class SendPendingMembershipEmailsTests(TestCase):
         eq_(Skill.objects.all().count(), 1)
         ok_(Skill.objects.filter(id=skill_1.id).exists())
 
+    def test_reconcile_member_counts(self):
+        user = UserFactory.create()
+        group = GroupFactory.create()
+        skill = SkillFactory.create()
+        group.add_member(user.userprofile)
+        skill.members.add(user.userprofile)
+        Group.objects.update(member_count=5, pending_count=2)
+        Skill.objects.update(member_count=0)
+
+        tasks.reconcile_member_counts()
+
+        group = Group.objects.get(pk=group.pk)
+        eq_((group.member_count, group.pending_count), (1, 0))
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 1)
+
     def test_sending_pending_email(self):
         # If a curated group has a pending membership, added since the reminder email
         # was last sent, send the curator an email.  It should contain the count of
@@ -202,11 +217,23 @@ class EmailMembershipChangeTests(TestCase):
         eq_('Removed from Mozillians group "%s"' % self.group.name, subject)
         ok_('You have been removed' in body)
 
+    def test_membership_changes(self):
+        other_user = UserFactory.create()
+        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+            email_membership_changes(self.group.pk,
+                                     [(self.user.pk, GroupMembership.PENDING,
+                                       GroupMembership.MEMBER),
+                                      (other_user.pk, GroupMembership.MEMBER, None)])
+        eq_(mock_send_mail.call_count, 2)
+        eq_([self.user.email], mock_send_mail.call_args_list[0][0][3])
+        eq_([other_user.email], mock_send_mail.call_args_list[1][0][3])
+        ok_('You have been removed' in mock_send_mail.call_args_list[1][0][1])
+
 
 class MembershipInvalidationTests(TestCase):
     """ Test membership invalidation."""
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.models.email_membership_changes')
     def test_invalidate_open_group(self, mail_task):
         member = UserFactory.create(vouched=True)
         curator = UserFactory.create(vouched=True)
@@ -231,9 +258,10 @@ class MembershipInvalidationTests(TestCase):
         ok_(not group.groupmembership_set.filter(userprofile=member.userprofile).exists())
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
 
-        mail_task.delay.assert_called_once_with(group.id, member.id, GroupMembership.MEMBER, None)
+        mail_task.delay.assert_called_once_with(group.id,
+                                                [(member.id, GroupMembership.MEMBER, None)])
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.models.email_membership_changes')
     def test_invalidate_group_by_request(self, mail_task):
         member = UserFactory.create(vouched=True)
         curator = UserFactory.create(vouched=True)
@@ -258,10 +286,10 @@ class MembershipInvalidationTests(TestCase):
                                              status=GroupMembership.PENDING).exists())
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
 
-        mail_task.delay.assert_called_once_with(group.id, member.id, GroupMembership.MEMBER,
-                                                GroupMembership.PENDING)
+        mail_task.delay.assert_called_once_with(
+            group.id, [(member.id, GroupMembership.MEMBER, GroupMembership.PENDING)])
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.models.email_membership_changes')
     def invalidate_closed_group(self, mail_task):
         member = UserFactory.create(vouched=True)
         curator = UserFactory.create(vouched=True)
@@ -286,10 +314,10 @@ class MembershipInvalidationTests(TestCase):
                                              status=GroupMembership.PENDING).exists())
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
 
-        mail_task.delay.assert_called_once_with(group.id, member.id, GroupMembership.MEMBER,
-                                                GroupMembership.PENDING)
+        mail_task.delay.assert_called_once_with(
+            group.id, [(member.id, GroupMembership.MEMBER, GroupMembership.PENDING)])
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.models.email_membership_changes')
     def test_invalidate_group_pending_membership(self, mail_task):
         """Invalidate a group where a user has not yet been accepted by a curator.
 
@@ -317,7 +345,7 @@ class MembershipInvalidationTests(TestCase):
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
         ok_(not mail_task.called)
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.models.email_membership_changes')
     def invalidate_group_pending_terms(self, mail_task):
         """Invalidate a group where a user has not yet accepted the terms.
 
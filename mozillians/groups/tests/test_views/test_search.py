@@ -4,6 +4,7 @@ from django.core.urlresolvers import reverse
 from django.http import HttpResponseBadRequest
 from django.test import Client
 
+from mock import patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.templatetags.helpers import urlparams
@@ -111,6 +112,12 @@ class IndexSkillsTests(TestCase):
 
 
 class SearchTests(TestCase):
+    def setUp(self):
+        # The alias index is only updated on commit, start from a new one.
+        indexes_patcher = patch.dict('mozillians.groups.alias_index._indexes', clear=True)
+        indexes_patcher.start()
+        self.addCleanup(indexes_patcher.stop)
+
     def test_search_existing_group(self):
         user = UserFactory.create()
         group_1 = GroupFactory.create(visible=True)
@@ -1,8 +1,6 @@
 import json
 import re
 
-from collections import defaultdict
-
 from django import http
 from django.conf import settings
 from django.contrib import messages
@@ -19,7 +17,8 @@ from dal import autocomplete
 from waffle.decorators import waffle_flag, waffle_switch
 
 from mozillians.common.decorators import allow_unvouched
-from mozillians.common.templatetags.helpers import get_object_or_none, urlparams
+from mozillians.common.templatetags.helpers import (get_object_or_none, get_privacy_level,
+                                                   urlparams)
 from mozillians.common.urlresolvers import reverse
 from mozillians.groups import forms
 from mozillians.groups.models import Group, GroupMembership, Invite, Skill
@@ -28,7 +27,11 @@ from mozillians.groups.tasks import (notify_curators_invitation_accepted,
                                      notify_redeemer_invitation,
                                      notify_redeemer_invitation_invalid,
                                      notify_membership_renewal)
-from mozillians.users.models import UserProfile
+from mozillians.users.models import UserProfile, photo_urls_for
+
+
+# Number of group names returned to auto-completion by search().
+SEARCH_AUTOCOMPLETE_LIMIT = 20
 
 
 def _list_groups(request, template, query, context={}):
@@ -79,7 +82,7 @@ def index_groups(request):
     if group_form.is_valid():
         group = group_form.save()
         group.curators.add(request.user.userprofile)
-        group.add_member(request.user.userprofile, GroupMembership.MEMBER)
+        group.add_members([request.user.userprofile], GroupMembership.MEMBER)
         return redirect(reverse('groups:group_edit', args=[group.url]))
 
     query = Group.get_non_functional_areas()
@@ -114,7 +117,8 @@ def search(request, searched_object=Group):
     """
     term = request.GET.get('term', None)
     if request.is_ajax() and term:
-        groups = searched_object.search(term).values_list('name', flat=True)
+        groups = (searched_object.search(term, limit=SEARCH_AUTOCOMPLETE_LIMIT)
+                  .values_list('name', flat=True))
         return http.HttpResponse(json.dumps(list(groups)), content_type='application/json')
 
     return http.HttpResponseBadRequest()
@@ -191,25 +195,13 @@ def show(request, url, alias_model, template):
         invitation = get_object_or_none(Invite, redeemer=profile, group=group, accepted=False)
         data.update(invitation=invitation)
         # Order by UserProfile.Meta.ordering
-        memberships = memberships.order_by('userprofile')
+        memberships = (memberships.order_by('userprofile')
+                       .select_related('userprofile', 'userprofile__user'))
 
         # Find the most common skills of the group members.
         # Order by popularity in the group.
-        shared_skill_ids = (group.members.filter(groupmembership__status=GroupMembership.MEMBER)
-                            .values_list('skills', flat=True))
-
-        count_skills = defaultdict(int)
-        for skill_id in shared_skill_ids:
-            count_skills[skill_id] += 1
-        common_skills_ids = [k for k, _ in sorted(count_skills.items(),
-                                                  key=lambda x: x[1],
-                                                  reverse=True)
-                             if count_skills[k] > 1]
-
-        # Translate ids to Skills preserving order.
-        skills = [Skill.objects.get(id=skill_id) for skill_id in common_skills_ids if skill_id]
-
-        data.update(skills=skills, membership_filter_form=membership_filter_form)
+        data.update(skills=group.get_shared_skills(),
+                    membership_filter_form=membership_filter_form)
 
     page = request.GET.get('page', 1)
     paginator = Paginator(memberships, settings.ITEMS_PER_PAGE)
@@ -223,6 +215,11 @@ def show(request, url, alias_model, template):
 
     show_pagination = paginator.count > settings.ITEMS_PER_PAGE
 
+    if isinstance(group, Group):
+        # Resolve the avatars of the whole page with a single cache lookup.
+        data.update(photo_urls=photo_urls_for([membership.userprofile for membership in people],
+                                              ['70x70'], get_privacy_level(request)))
+
     extra_data = dict(
         people=people,
         group=group,
@@ -318,7 +315,7 @@ def confirm_member(request, url, user_pk):
             status = GroupMembership.MEMBER
             if group.terms:
                 status = GroupMembership.PENDING_TERMS
-            group.add_member(profile, status=status, inviter=request.user.userprofile)
+            group.add_members([profile], status=status, inviter=request.user.userprofile)
             if membership.needs_renewal:
                 messages.info(request, _('The membership of the user has been renewed.'))
             else:
@@ -343,7 +340,7 @@ def review_terms(request, url):
     membership_form = forms.TermsReviewForm(request.POST or None)
     if membership_form.is_valid():
         if membership_form.cleaned_data['terms_accepted'] == 'True':
-            group.add_member(request.user.userprofile, GroupMembership.MEMBER)
+            group.add_members([request.user.userprofile], GroupMembership.MEMBER)
         else:
             membership.delete()
         return redirect(reverse('groups:show_group', args=[group.url]))
@@ -385,7 +382,7 @@ def join_group(request, url):
             messages.info(request, _('Your membership request has been sent '
                                      'to the group curator(s).'))
 
-        group.add_member(profile_to_add, status=status)
+        group.add_members([profile_to_add], status=status)
 
     return redirect(reverse('groups:show_group', args=[group.url]))
 
@@ -524,6 +521,15 @@ class SkillsAutocomplete(autocomplete.Select2QuerySetView):
             return False
         return True
 
+    def get_queryset(self):
+        """Match skill aliases through the alias index."""
+        if self.q:
+            # Only the pages up to the requested one are needed.
+            page = self.request.GET.get(self.page_kwarg, '1')
+            limit = self.paginate_by * (int(page) if page.isdigit() else 1)
+            return Skill.search(self.q, limit=limit)
+        return super(SkillsAutocomplete, self).get_queryset()
+
     def get_create_option(self, context, q):
         """Disable create_object if skill exists."""
         search_q = q.strip()
@@ -594,9 +600,9 @@ def accept_reject_invitation(request, invite_pk, action):
     invite = get_object_or_404(Invite, pk=invite_pk, redeemer=redeemer)
     if action == 'accept':
         if invite.group.terms:
-            invite.group.add_member(redeemer, GroupMembership.PENDING_TERMS)
+            invite.group.add_members([redeemer], GroupMembership.PENDING_TERMS)
         else:
-            invite.group.add_member(redeemer, GroupMembership.MEMBER)
+            invite.group.add_members([redeemer], GroupMembership.MEMBER)
         invite.accepted = True
         invite.save()
         notify_curators_invitation_accepted.delay(invite.pk)
@@ -643,11 +649,11 @@ def force_group_invalidation(request, url, alias_model, template=''):
         curator_ids = group.curators.all().values_list('id', flat=True)
         memberships = group.groupmembership_set.exclude(userprofile__id__in=curator_ids)
 
-        for member in memberships:
-            status = None
-            if group.accepting_new_members != Group.OPEN:
-                status = GroupMembership.PENDING
-            group.remove_member(member.userprofile, status=status)
+        status = None
+        if group.accepting_new_members != Group.OPEN:
+            status = GroupMembership.PENDING
+        profiles = [member.userprofile for member in memberships.select_related('userprofile')]
+        group.remove_members(profiles, status=status)
     else:
         raise http.Http404
 
@@ -26,7 +26,8 @@ from mozillians.phonebook.validators import validate_username
 from mozillians.phonebook.widgets import MonthYearWidget
 from mozillians.users import get_languages_for_locale
 from mozillians.users.managers import PUBLIC
-from mozillians.users.models import AbuseReport, ExternalAccount, IdpProfile, Language, UserProfile
+from mozillians.users.models import (AVATAR_SIZE, AbuseReport, ExternalAccount, IdpProfile,
+                                     Language, UserProfile, normalize_photo)
 from mozillians.users.search_indexes import IdpProfileIndex, UserProfileIndex
 
 
@@ -167,22 +168,27 @@ class BasicInformationForm(happyforms.ModelForm):
         widgets = {'bio': forms.Textarea()}
 
     def clean_photo(self):
-        """Clean possible bad Image data.
+        """Clean possible bad Image data and normalize the photo.
 
         Try to load EXIF data from image. If that fails, remove EXIF
         data by re-saving the image. Related bug 919736.
 
+        Photos that are not RGB or larger than AVATAR_SIZE are re-saved
+        too, so that thumbnails never need to convert them.
+
         """
         photo = self.cleaned_data['photo']
         if photo and isinstance(photo, UploadedFile):
             image = Image.open(photo.file)
             try:
                 image._get_exif()
+                broken_exif = False
             except (AttributeError, IOError, KeyError, IndexError):
+                broken_exif = True
+            oversized = image.size[0] > AVATAR_SIZE[0] or image.size[1] > AVATAR_SIZE[1]
+            if broken_exif or oversized or image.mode != 'RGB':
                 cleaned_photo = StringIO()
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                image.save(cleaned_photo, format='JPEG', quality=95)
+                normalize_photo(image).save(cleaned_photo, format='JPEG', quality=95)
                 photo.file = cleaned_photo
                 photo.size = cleaned_photo.tell()
         return photo
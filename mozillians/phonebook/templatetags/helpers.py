@@ -8,7 +8,7 @@ from django.utils.translation import get_language
 from django_jinja import library
 import jinja2
 
-from mozillians.users import get_languages_for_locale
+from mozillians.users import get_language_names
 from mozillians.users.models import IdpProfile
 
 
@@ -47,12 +47,7 @@ def langcode_to_name(code, locale=None):
 
     if not locale:
         locale = get_language()
-    translated_languages = get_languages_for_locale(locale)
-    try:
-        lang = dict(translated_languages)[code]
-    except KeyError:
-        return code
-    return lang
+    return get_language_names(locale).get(code, code)
 
 
 @library.filter
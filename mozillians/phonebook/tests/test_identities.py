@@ -4,10 +4,11 @@ from django.core.urlresolvers import reverse
 from django.test.utils import override_settings, override_script_prefix
 
 from mock import ANY, Mock, patch
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.models import IdpProfile
+from mozillians.users.managers import PUBLIC
+from mozillians.users.models import IdpProfile, UserProfile
 from mozillians.users.tests import UserFactory
 
 
@@ -124,6 +125,27 @@ class EditProfileIdentities(TestCase):
                 url = reverse('phonebook:profile_edit')
             self.assertRedirects(response, url)
 
+    @patch('mozillians.phonebook.views.messages')
+    @patch('mozillians.phonebook.views.requests.post')
+    @patch('mozillians.phonebook.views.JWS')
+    def test_change_primary_updates_public_flags(self, jws_mock, request_post_mock, msg_mock):
+        user = UserFactory.create(email='', userprofile={'privacy_email': PUBLIC})
+        ok_(not UserProfile.objects.get(pk=user.userprofile.pk).public_indexable)
+
+        (jws_mock.from_compact.return_value).payload = json.dumps({
+            'email': 'bar@example.com',
+            'email_verified': True,
+            'https://sso.mozilla.com/claim/original_connection_user_id': 'ad|ldap'
+        })
+        with self.login(user) as client:
+            session = client.session
+            session['oidc_verify_nonce'] = 'nonce'
+            session['oidc_verify_state'] = 'state'
+            session.save()
+            client.get(self.url, self.get_data, follow=True)
+        eq_(User.objects.get(pk=user.pk).email, 'bar@example.com')
+        ok_(UserProfile.objects.get(pk=user.userprofile.pk).public_indexable)
+
     @patch('mozillians.phonebook.views.messages')
     @patch('mozillians.phonebook.views.requests.post')
     @patch('mozillians.phonebook.views.JWS')
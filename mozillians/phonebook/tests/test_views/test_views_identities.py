@@ -5,7 +5,8 @@ from mock import ANY, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.models import IdpProfile
+from mozillians.users.managers import PUBLIC
+from mozillians.users.models import IdpProfile, UserProfile
 from mozillians.users.tests import UserFactory
 
 
@@ -160,3 +161,30 @@ class IdentitiesViewsTests(TestCase):
         ok_(IdpProfile.objects.filter(pk=idp.pk, primary_contact_identity=True).exists())
         msg = 'Primary Contact Identity successfully updated.'
         mocked_message.success.assert_called_once_with(ANY, msg)
+
+    @patch('mozillians.phonebook.views.messages')
+    def test_change_identity_updates_profile_email(self, mocked_message):
+        user = UserFactory.create()
+        IdpProfile.objects.create(
+            profile=user.userprofile,
+            auth0_user_id='github|1',
+            email=user.email,
+            primary=True
+        )
+        idp = IdpProfile.objects.create(
+            profile=user.userprofile,
+            auth0_user_id='email|2',
+            email='foo@example.com',
+            primary=False,
+            privacy=PUBLIC
+        )
+
+        with self.login(user) as client:
+            url = reverse('phonebook:change_primary_contact_identity',
+                          kwargs={'identity_pk': idp.pk})
+            client.get(url, follow=True)
+
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        eq_(profile.primary_contact_email, 'foo@example.com')
+        eq_(profile.primary_contact_privacy, PUBLIC)
+        eq_(profile.email, 'foo@example.com')
@@ -42,7 +42,7 @@ from mozillians.phonebook.models import Invite
 from mozillians.phonebook.utils import redeem_invite
 from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC, PRIVATE
 from mozillians.users.models import AbuseReport, ExternalAccount, IdpProfile, UserProfile
-from mozillians.users.tasks import (check_spam_account, send_userprofile_to_cis,
+from mozillians.users.tasks import (check_spam_account, queue_userprofile_for_cis,
                                     update_email_in_basket)
 
 
@@ -188,8 +188,7 @@ def view_profile(request, username):
 
     data['shown_user'] = profile.user
     data['profile'] = profile
-    data['access_groups'] = profile.get_annotated_access_groups()
-    data['tags'] = profile.get_annotated_tags()
+    data['access_groups'], data['tags'] = profile.get_annotated_groups()
     data['abuse_form'] = abuse_form
     data['primary_identity'] = profile.identity_profiles.filter(primary_contact_identity=True)
     data['alternate_identities'] = profile.identity_profiles.filter(primary_contact_identity=False)
@@ -346,7 +345,7 @@ def delete_identity(request, identity_pk):
     if idp_query.exists():
         idp_type = idp_query[0].get_type_display()
         idp_query.delete()
-        send_userprofile_to_cis.delay(profile.pk)
+        queue_userprofile_for_cis(profile.pk)
         msg = _(u'Identity {0} successfully deleted.'.format(idp_type))
         messages.success(request, msg)
         return redirect('phonebook:profile_edit')
@@ -372,6 +371,7 @@ def change_primary_contact_identity(request, identity_pk):
     if alternate_identities.filter(primary_contact_identity=True).exists():
         alternate_identities.filter(pk=identity_pk).update(primary_contact_identity=True)
         alternate_identities.exclude(pk=identity_pk).update(primary_contact_identity=False)
+        profile.refresh_primary_contact(save=True)
 
         msg = _(u'Primary Contact Identity successfully updated.')
         messages.success(request, msg)
@@ -731,9 +731,10 @@ class VerifyIdentityCallbackView(View):
                 # Also update the primary email of the user
                 update_email_in_basket(profile.user.email, idp.email)
                 User.objects.filter(pk=profile.user.id).update(email=idp.email)
+                UserProfile.refresh_public_flags([profile.pk])
                 append_msg = ' You need to use this identity the next time you will login.'
 
-            send_userprofile_to_cis.delay(profile.pk)
+            queue_userprofile_for_cis(profile.pk)
             if created:
                 msg = 'Account successfully verified.'
                 if append_msg:
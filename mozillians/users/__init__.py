@@ -5,6 +5,8 @@ default_app_config = 'mozillians.users.apps.UserConfig'
 
 
 AVAILABLE_LANGUAGES = {}
+# The languages of AVAILABLE_LANGUAGES indexed by code, see get_language_names.
+LANGUAGE_NAMES = {}
 REMOVE_LANGS = ['art', 'cpe', 'cpf', 'cpp', 'de_AT', 'de_CH',
                 'mul', 'und', 'mis', 'zxx', 'en_US', 'en_GB', 'en_AU', 'en_CA',
                 'fr_CA', 'fr_CH']
@@ -13,8 +15,9 @@ REMOVE_LANGS = ['art', 'cpe', 'cpf', 'cpp', 'de_AT', 'de_CH',
 def get_languages_for_locale(locale):
     """This method returns available languages localized in locale.
 
-    If a language cannnot be localized, return REFERENCE_LANGUAGE.
-    Translated dictionaries get cached in AVAILABLE_LANGUAGES.
+    If a language cannnot be localized, return the English name.
+    Translated dictionaries get cached in AVAILABLE_LANGUAGES, the
+    English one included, on first use.
 
     We use Babel to get translated language names.
 
@@ -26,14 +29,18 @@ def get_languages_for_locale(locale):
         try:
             local_lang = babel.Locale.parse(locale).languages
         except babel.UnknownLocaleError:
-            return AVAILABLE_LANGUAGES['en']
+            # Remember unknown locales too, parsing them is as slow.
+            AVAILABLE_LANGUAGES[locale] = get_languages_for_locale('en')
+            LANGUAGE_NAMES[locale] = LANGUAGE_NAMES['en']
+            return AVAILABLE_LANGUAGES[locale]
 
         # If a translation is missing, add an untranslated entry from
-        # the REFERENCE_LANGUAGE
-        diff = [lc for lc in REFERENCE_LANGUAGE.keys()
+        # the English names.
+        reference_language = babel.Locale('en').languages
+        diff = [lc for lc in reference_language.keys()
                 if lc not in local_lang.keys()]
         for lc in diff:
-            local_lang[lc] = REFERENCE_LANGUAGE[lc]
+            local_lang[lc] = reference_language[lc]
 
         # Remove unwanted and testing languages.
         for lang in REMOVE_LANGS:
@@ -46,9 +53,29 @@ def get_languages_for_locale(locale):
                             key=lambda language: language[1])
 
         AVAILABLE_LANGUAGES[locale] = local_lang
+        LANGUAGE_NAMES[locale] = dict(local_lang)
     return AVAILABLE_LANGUAGES[locale]
 
 
-REFERENCE_LANGUAGE = babel.Locale('en').languages
-# Add 'en' to AVAILABLE_LANGUAGES
-get_languages_for_locale('en')
+def get_language_names(locale):
+    """Return the languages localized in locale as a {code: name} dictionary.
+
+    Same languages as get_languages_for_locale, for lookups by code.
+    """
+    locale = locale.replace('-', '_')
+    if locale not in LANGUAGE_NAMES:
+        get_languages_for_locale(locale)
+    return LANGUAGE_NAMES[locale]
+
+
+class LazyLanguageChoices(object):
+    """The languages of a locale as field choices, loaded on first iteration.
+
+    Keeps Babel out of the import of the models.
+    """
+
+    def __init__(self, locale):
+        self.locale = locale
+
+    def __iter__(self):
+        return iter(get_languages_for_locale(self.locale))
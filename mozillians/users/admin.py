@@ -25,11 +25,12 @@ from mozillians.groups.admin import BaseGroupMembershipAutocompleteForm
 from mozillians.users.admin_forms import (AbuseReportAutocompleteForm, AlternateEmailForm,
                                           UserProfileAdminForm, VouchAutocompleteForm)
 from mozillians.groups.models import GroupMembership, Skill
-from mozillians.users.models import get_languages_for_locale
+from mozillians.users import get_languages_for_locale
 from mozillians.users.models import (AbuseReport, ExternalAccount, IdpProfile, Language, PUBLIC,
                                      UserProfile, UsernameBlacklist, Vouch)
 from mozillians.users.tasks import (check_celery, subscribe_user_to_basket,
                                     unsubscribe_from_basket_task, index_all_profiles,
+                                    reconcile_vouch_counts,
                                     send_userprofile_to_cis)
 
 
@@ -77,11 +78,7 @@ def update_vouch_flags_action():
     """Update can_vouch, is_vouched flag action."""
 
     def update_vouch_flags(modeladmin, request, queryset):
-        for profile in queryset:
-            vouches_received = profile.vouches_received.count()
-            profile.can_vouch = vouches_received >= settings.CAN_VOUCH_THRESHOLD
-            profile.is_vouched = vouches_received > 0
-            profile.save()
+        reconcile_vouch_counts(profile_ids=list(queryset.values_list('pk', flat=True)))
     update_vouch_flags.short_description = 'Update vouch flags'
     return update_vouch_flags
 
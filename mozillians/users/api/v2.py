@@ -10,7 +10,8 @@ from mozillians.common.templatetags.helpers import absolutify, markdown
 from mozillians.common.urlresolvers import reverse
 from mozillians.groups.models import Group, GroupMembership
 from mozillians.users.managers import PUBLIC
-from mozillians.users.models import ExternalAccount, IdpProfile, Language, UserProfile
+from mozillians.users.models import (ExternalAccount, IdpProfile, Language, UserProfile,
+                                     photo_urls_for)
 
 
 # Serializers
@@ -148,11 +149,12 @@ class UserProfileDetailedSerializer(serializers.HyperlinkedModelSerializer):
         }
 
     def get_photo(self, obj):
+        urls = photo_urls_for([obj], ['150x150', '300x300', '500x500'])[obj.pk]
         return {
-            'value': obj.get_photo_url('300x300'),
-            '150x150': obj.get_photo_url('150x150'),
-            '300x300': obj.get_photo_url('300x300'),
-            '500x500': obj.get_photo_url('500x500'),
+            'value': urls['300x300'],
+            '150x150': urls['150x150'],
+            '300x300': urls['300x300'],
+            '500x500': urls['500x500'],
         }
 
     def transform_photo(self, obj, value):
@@ -257,7 +259,8 @@ class UserProfileViewSet(NoCacheReadOnlyModelViewSet):
         if privacy_level == PUBLIC:
             queryset = queryset.public()
 
-        queryset = queryset.privacy_level(privacy_level)
+        queryset = (queryset.privacy_level(privacy_level)
+                    .select_related('user').with_privacy_relations())
         return queryset
 
     def retrieve(self, request, pk):
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mozillians.users.models import IdpProfile, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary contact identity of every profile to the profile row.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of profiles to update per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+
+        while True:
+            batch = list(UserProfile.objects.filter(id__gt=last_id).order_by('id')
+                         .values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            # Same precedence as UserProfile.primary_contact_fields().
+            idps = (IdpProfile.objects.filter(profile_id__in=batch)
+                    .order_by('profile_id', '-primary_contact_identity', 'id')
+                    .values_list('profile_id', 'email', 'privacy', 'primary_contact_identity'))
+            contacts = {}
+            for profile_id, email, privacy, is_contact in idps:
+                if profile_id not in contacts:
+                    contacts[profile_id] = (email if is_contact else '', privacy)
+
+            with transaction.atomic():
+                (UserProfile.objects.filter(id__in=batch).exclude(id__in=contacts.keys())
+                 .update(primary_contact_email='', primary_contact_privacy=None))
+                for profile_id, (email, privacy) in contacts.items():
+                    (UserProfile.objects.filter(pk=profile_id)
+                     .update(primary_contact_email=email, primary_contact_privacy=privacy))
+
+            total += len(batch)
+            self.stdout.write('Updated {0} profiles\n'.format(total))
@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mozillians.users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Compute the public and public_indexable columns of every profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of profiles to update per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+
+        while True:
+            batch = list(UserProfile.objects.filter(id__gt=last_id).order_by('id')
+                         .select_related('user')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            profile_ids = defaultdict(list)
+            for profile in batch:
+                profile_ids[(profile.is_public, profile.is_public_indexable)].append(profile.id)
+
+            with transaction.atomic():
+                for (public, public_indexable), ids in profile_ids.items():
+                    (UserProfile.objects.filter(id__in=ids)
+                     .update(public=public, public_indexable=public_indexable))
+
+            total += len(batch)
+            self.stdout.write('Updated {0} profiles\n'.format(total))
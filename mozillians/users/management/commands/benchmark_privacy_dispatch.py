@@ -0,0 +1,84 @@
+"""
+Compare the privacy aware attribute access of UserProfile with the
+per-access lookup that it replaced.
+
+The benchmark renders the privacy-controlled fields of in-memory
+profiles, so it does not need a populated database.
+"""
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from mozillians.users.managers import MOZILLIANS, PUBLIC
+from mozillians.users.models import UserProfile
+
+
+RENDERED_FIELDS = ['pk', 'id', 'full_name', 'full_name_local', 'bio', 'ircname', 'title',
+                   'timezone', 'tshirt', 'story_link', 'date_mozillian', 'is_vouched',
+                   'last_updated', 'privacy_full_name']
+
+
+def legacy_getattribute(profile, attrname):
+    """Attribute lookup as performed by the previous __getattribute__."""
+    _getattr = (lambda x: models.Model.__getattribute__(profile, x))
+    privacy_fields = UserProfile.privacy_fields()
+    privacy_level = _getattr('_privacy_level')
+    special_functions = {
+        'accounts': '_accounts',
+        'alternate_emails': '_alternate_emails',
+        'email': '_primary_email',
+        'is_public_indexable': '_is_public_indexable',
+        'languages': '_languages',
+        'vouches_made': '_vouches_made',
+        'vouches_received': '_vouches_received',
+        'vouched_by': '_vouched_by',
+        'websites': '_websites',
+        'identity_profiles': '_identity_profiles'
+    }
+
+    if attrname in special_functions:
+        return _getattr(special_functions[attrname])
+
+    if not privacy_level or attrname not in privacy_fields:
+        return _getattr(attrname)
+
+    field_privacy = _getattr('privacy_%s' % attrname)
+    if field_privacy < privacy_level:
+        return privacy_fields.get(attrname)
+
+    return _getattr(attrname)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark privacy aware attribute access on UserProfile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1000,
+                            help='Number of profiles to render per run.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of runs; the best one is reported.')
+
+    def handle(self, *args, **options):
+        profiles = []
+        for i in range(options['profiles']):
+            profile = UserProfile(id=i + 1, full_name='Profile {0}'.format(i),
+                                  bio='Bio', ircname='irc{0}'.format(i))
+            profile.privacy_full_name = PUBLIC if i % 2 else MOZILLIANS
+            profile.set_instance_privacy_level(PUBLIC)
+            profiles.append(profile)
+
+        def render_compiled():
+            for profile in profiles:
+                for field in RENDERED_FIELDS:
+                    getattr(profile, field)
+
+        def render_legacy():
+            for profile in profiles:
+                for field in RENDERED_FIELDS:
+                    legacy_getattribute(profile, field)
+
+        for name, func in (('legacy', render_legacy), ('compiled', render_compiled)):
+            best = min(timeit.repeat(func, number=1, repeat=options['repeat']))
+            self.stdout.write('{0}: {1:.2f} ms for {2} profiles\n'.format(
+                name, best * 1000, options['profiles']))
@@ -0,0 +1,97 @@
+"""
+Compare the materialized public flags of UserProfile with the OR over
+the privacy columns that they replaced.
+
+The benchmark fills the database with synthetic profiles inside a
+transaction that is rolled back at the end.
+"""
+import random
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from mozillians.users.managers import MOZILLIANS, PUBLIC, PUBLIC_INDEXABLE_FIELDS
+from mozillians.users.models import UserProfile
+
+
+def legacy_public_q():
+    """Filter used by the previous UserProfileQuerySet.public()."""
+    public_q = Q()
+    for field in UserProfile.privacy_fields():
+        public_q |= Q(**{'privacy_%s' % field: PUBLIC})
+    return public_q
+
+
+def legacy_public_index_q():
+    """Filter used by the previous UserProfileQuerySet.public_indexable()."""
+    public_index_q = Q()
+    for field in PUBLIC_INDEXABLE_FIELDS:
+        key = 'privacy_%s' % field
+        if field == 'email':
+            field = 'user__email'
+        public_index_q |= (Q(**{key: PUBLIC}) & ~Q(**{field: ''}))
+    return public_index_q
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the public profile queries on synthetic profiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=100000,
+                            help='Number of synthetic profiles to create.')
+        parser.add_argument('--public-ratio', type=float, default=0.05,
+                            help='Share of profiles with a PUBLIC field.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of runs; the best one is reported.')
+
+    def create_profiles(self, count, public_ratio):
+        prefix = 'benchmark-public-'
+        users = [User(username='{0}{1}'.format(prefix, i),
+                      email='{0}{1}@example.com'.format(prefix, i))
+                 for i in range(count)]
+        User.objects.bulk_create(users, batch_size=1000)
+        user_ids = User.objects.filter(username__startswith=prefix).values_list('id', flat=True)
+
+        privacy_fields = ['privacy_%s' % field for field in UserProfile.privacy_fields()]
+        profiles = []
+        for user_id in user_ids:
+            profile = UserProfile(user_id=user_id, full_name='Profile {0}'.format(user_id))
+            if random.random() < public_ratio:
+                field = random.choice(privacy_fields)
+                setattr(profile, field, PUBLIC)
+                profile.public = True
+                profile.public_indexable = field in ('privacy_full_name', 'privacy_email')
+            else:
+                profile.privacy_full_name = MOZILLIANS
+            profiles.append(profile)
+        UserProfile.objects.bulk_create(profiles, batch_size=1000)
+        return prefix
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write('Creating {0} profiles\n'.format(options['profiles']))
+            prefix = self.create_profiles(options['profiles'], options['public_ratio'])
+            username = '{0}{1}'.format(prefix, options['profiles'] // 2)
+            profiles = UserProfile.objects.all()
+
+            queries = [
+                ('public count',
+                 lambda: profiles.filter(legacy_public_q()).count(),
+                 lambda: profiles.public().count()),
+                ('public_indexable count',
+                 lambda: profiles.exclude(full_name='').filter(legacy_public_index_q()).count(),
+                 lambda: profiles.public_indexable().count()),
+                ('view_profile public exists',
+                 lambda: profiles.filter(user__username=username)
+                                 .filter(legacy_public_q()).exists(),
+                 lambda: profiles.filter(user__username=username).public().exists()),
+            ]
+            for name, legacy, materialized in queries:
+                for label, func in (('legacy', legacy), ('materialized', materialized)):
+                    best = min(timeit.repeat(func, number=1, repeat=options['repeat']))
+                    self.stdout.write('{0} ({1}): {2:.2f} ms\n'.format(name, label, best * 1000))
+
+            transaction.set_rollback(True)
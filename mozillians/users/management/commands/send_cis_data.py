@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from mozillians.users.models import UserProfile
+from mozillians.users.tasks import CIS_PUBLISH_BATCH_SIZE, publish_profiles
+
+
+class Command(BaseCommand):
+    help = 'Publish the changed Identity Profiles of all the profiles to CIS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Publish unchanged payloads too, for a full resync.')
+        parser.add_argument('--batch-size', type=int, default=CIS_PUBLISH_BATCH_SIZE,
+                            help='Number of profiles to publish at once.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        sent = 0
+        skipped = 0
+
+        while True:
+            batch = list(UserProfile.objects.filter(id__gt=last_id).order_by('id')
+                         .values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            stats = publish_profiles(batch, force=options['force'])
+            sent += stats['sent']
+            skipped += stats['skipped']
+
+        self.stdout.write('Sent {0} payloads, skipped {1} unchanged\n'.format(sent, skipped))
@@ -1,5 +1,4 @@
-from django.apps import apps
-from django.db.models import Q
+from django.db.models import Prefetch
 from django.db.models.query import ModelIterable, QuerySet, ValuesIterable
 
 from django.utils.translation import ugettext_lazy as _lazy
@@ -17,6 +16,50 @@ PRIVACY_CHOICES_WITH_PRIVATE = ((MOZILLIANS, _lazy(u'Mozillians')),
 
 PUBLIC_INDEXABLE_FIELDS = ['full_name', 'ircname', 'email']
 
+# The relations that UserProfile filters by privacy, with the attribute
+# with_privacy_relations() prefetches each of them to.
+PRIVACY_RELATIONS = {
+    'externalaccount_set': '_prefetched_externalaccounts',
+    'idp_profiles': '_prefetched_idp_profiles',
+    'language_set': '_prefetched_languages',
+}
+
+
+def privacy_relation_prefetches(lookup=''):
+    """Return the prefetches of with_privacy_relations() for the profiles at lookup.
+
+    E.g. privacy_relation_prefetches('userprofile__') for a queryset of
+    group memberships.
+    """
+    return [Prefetch(lookup + relation, to_attr=attr)
+            for relation, attr in sorted(PRIVACY_RELATIONS.items())]
+
+
+class PrefetchedRelation(list):
+    """The prefetched objects of a privacy relation.
+
+    Answers the queryset methods the templates, views and serializers
+    use on the relations, so callers can't tell it from the queryset
+    returned when the relation is not prefetched.
+    """
+
+    def all(self):
+        return self
+
+    def exists(self):
+        return bool(self)
+
+    def count(self):
+        return len(self)
+
+    def first(self):
+        return self[0] if self else None
+
+    def filter(self, **kwargs):
+        return PrefetchedRelation(obj for obj in self
+                                  if all(getattr(obj, name) == value
+                                         for name, value in kwargs.items()))
+
 
 class UserProfileValuesIterable(ValuesIterable):
     """Custom ValuesIterable to support privacy.
@@ -69,20 +112,6 @@ class UserProfileQuerySet(QuerySet):
     """Custom QuerySet to support privacy."""
 
     def __init__(self, *args, **kwargs):
-        # TODO update public_q with external accounts
-        self.public_q = Q()
-        UserProfile = apps.get_model('users', 'UserProfile')
-        for field in UserProfile.privacy_fields():
-            key = 'privacy_%s' % field
-            self.public_q |= Q(**{key: PUBLIC})
-
-        self.public_index_q = Q()
-        for field in PUBLIC_INDEXABLE_FIELDS:
-            key = 'privacy_%s' % field
-            if field == 'email':
-                field = 'user__email'
-            self.public_index_q |= (Q(**{key: PUBLIC}) & ~Q(**{field: ''}))
-
         super(UserProfileQuerySet, self).__init__(*args, **kwargs)
         # Override ModelIterable class to repsect the privacy_level
         self._iterable_class = UserProfileModelIterable
@@ -94,7 +123,7 @@ class UserProfileQuerySet(QuerySet):
 
     def public(self):
         """Return profiles with at least one PUBLIC field."""
-        return self.filter(self.public_q)
+        return self.filter(public=True)
 
     def vouched(self):
         """Return complete and vouched profiles."""
@@ -104,12 +133,21 @@ class UserProfileQuerySet(QuerySet):
         """Return complete profiles."""
         return self.exclude(full_name='')
 
+    def with_privacy_relations(self):
+        """Prefetch the relations that UserProfile filters by privacy.
+
+        accounts, websites, alternate_emails, identity_profiles and
+        languages are then served from memory, respecting the privacy
+        level of each profile.
+        """
+        return self.prefetch_related(*privacy_relation_prefetches())
+
     def public_indexable(self):
         """Return public indexable profiles."""
-        return self.complete().filter(self.public_index_q)
+        return self.complete().filter(public_indexable=True)
 
     def not_public_indexable(self):
-        return self.complete().exclude(self.public_index_q)
+        return self.complete().filter(public_indexable=False)
 
     def _clone(self, *args, **kwargs):
         """Custom _clone with privacy level propagation."""
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0045_auto_20190109_0324'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='primary_contact_email',
+            field=models.EmailField(default=b'', max_length=254, blank=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='primary_contact_privacy',
+            field=models.PositiveIntegerField(default=None, null=True, choices=[(3, 'Mozillians'), (4, 'Public'), (1, 'Private')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0046_userprofile_primary_contact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='public',
+            field=models.BooleanField(default=False, db_index=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='public_indexable',
+            field=models.BooleanField(default=False, db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0048_userprofile_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CISOutbox',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('profile_id', models.PositiveIntegerField(unique=True)),
+                ('requests', models.PositiveIntegerField(default=1)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'CIS outbox',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0049_cisoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idpprofile',
+            name='cis_payload_hash',
+            field=models.CharField(default=b'', max_length=40, editable=False, blank=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_vouch_count(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Vouch = apps.get_model('users', 'Vouch')
+
+    counts = Vouch.objects.values_list('vouchee').annotate(count=Count('id')).order_by()
+    for profile_id, count in counts:
+        UserProfile.objects.filter(pk=profile_id).update(vouch_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0050_idpprofile_cis_payload_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='vouch_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_vouch_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def backfill_primary_contact(apps, schema_editor):
+    IdpProfile = apps.get_model('users', 'IdpProfile')
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    # Same precedence as UserProfile.primary_contact_fields().
+    idps = (IdpProfile.objects.order_by('profile_id', '-primary_contact_identity', 'id')
+            .values_list('profile_id', 'email', 'privacy', 'primary_contact_identity'))
+    seen = set()
+    for profile_id, email, privacy, is_contact in idps.iterator():
+        if profile_id in seen:
+            continue
+        seen.add(profile_id)
+        (UserProfile.objects.filter(pk=profile_id)
+         .update(primary_contact_email=email if is_contact else '',
+                 primary_contact_privacy=privacy))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0052_userprofile_basket_vouched'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_primary_contact, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Q
+
+
+PUBLIC = 4
+# Same fields as mozillians.users.managers.PUBLIC_INDEXABLE_FIELDS.
+PUBLIC_INDEXABLE_FIELDS = ['full_name', 'ircname', 'email']
+
+
+def backfill_public_flags(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    # The privacy fields of UserProfile.privacy_fields(), the ones
+    # controlling a field of the profile or the email.
+    names = set(field.name for field in UserProfile._meta.get_fields())
+    public_q = Q()
+    for name in names:
+        if name.startswith('privacy_') and (name[8:] in names or name == 'privacy_email'):
+            public_q |= Q(**{name: PUBLIC})
+    UserProfile.objects.filter(public_q).update(public=True)
+
+    indexable_q = Q()
+    for field in PUBLIC_INDEXABLE_FIELDS:
+        if field == 'email':
+            # The email is the primary contact email or the user email.
+            filled_q = ~Q(primary_contact_email='') | ~Q(user__email='')
+        else:
+            filled_q = ~Q(**{field: ''})
+        indexable_q |= filled_q & Q(**{'privacy_%s' % field: PUBLIC})
+    # Materialize the ids, MySQL can't update a table joined in the filter.
+    profile_ids = list(UserProfile.objects.filter(indexable_q).values_list('pk', flat=True))
+    UserProfile.objects.filter(pk__in=profile_ids).update(public_indexable=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0053_backfill_primary_contact'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_public_flags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def backfill_basket_vouched(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    # Unvouched profiles were unsubscribed on every save before
+    # basket_vouched recorded it.
+    UserProfile.objects.filter(basket_vouched__isnull=True,
+                               is_vouched=False).update(basket_vouched=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0054_backfill_public_flags'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_basket_vouched, migrations.RunPython.noop),
+    ]
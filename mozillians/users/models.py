@@ -1,15 +1,20 @@
+import hashlib
+import json
 import logging
 import os
 import uuid
+from collections import namedtuple
 from itertools import chain
 
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.core.mail import send_mail
-from django.db import models
-from django.db.models import Q, Manager, ManyToManyField
-from django.utils.encoding import iri_to_uri
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Q, Manager, ManyToManyField, Subquery
+from django.utils.encoding import iri_to_uri, smart_str
 from django.utils.http import urlquote
 from django.utils.timezone import now
 from django.utils.translation import ugettext as _, ugettext_lazy as _lazy
@@ -22,7 +27,7 @@ from sorl.thumbnail import ImageField, get_thumbnail
 from waffle import switch_is_active
 
 from mozillians.common import utils
-from mozillians.common.templatetags.helpers import absolutify, gravatar
+from mozillians.common.templatetags.helpers import absolutify, gravatar, gravatars
 from mozillians.common.templatetags.helpers import offset_of_timezone
 from mozillians.common.urlresolvers import reverse
 from mozillians.groups.models import (Group, GroupAlias, GroupMembership, Invite,
@@ -31,18 +36,228 @@ from mozillians.phonebook.validators import (validate_email, validate_twitter,
                                              validate_website, validate_username_not_url,
                                              validate_phone_number, validate_linkedin,
                                              validate_discord)
-from mozillians.users import get_languages_for_locale
+from mozillians.users import LazyLanguageChoices, get_language_names
 from mozillians.users.managers import (EMPLOYEES,
                                        MOZILLIANS, PRIVACY_CHOICES, PRIVACY_CHOICES_WITH_PRIVATE,
-                                       PRIVATE, PUBLIC, PUBLIC_INDEXABLE_FIELDS,
+                                       PRIVACY_RELATIONS, PRIVATE, PUBLIC,
+                                       PUBLIC_INDEXABLE_FIELDS, PrefetchedRelation,
                                        UserProfileQuerySet)
-from mozillians.users.tasks import send_userprofile_to_cis
+from mozillians.users.tasks import (generate_photo_thumbnails, queue_userprofile_for_cis,
+                                    queue_userprofiles_for_cis)
 
 
 COUNTRIES = product_details.get_regions('en-US')
-AVATAR_SIZE = (300, 300)
+# Group of a profile as shown on profile pages, see get_annotated_groups().
+AnnotatedGroup = namedtuple('AnnotatedGroup', ['id', 'name', 'url', 'is_access_group', 'pending',
+                                               'pending_terms', 'inviter', 'is_curator'])
+AVATAR_SIZE = (500, 500)
+# Thumbnails generated when a photo is uploaded.
+PHOTO_GEOMETRIES = ['150x150', '160x160', '300x300', '500x500']
+PHOTO_URL_CACHE_KEY = 'users:photo_url:{0}:{1}'
+PHOTO_URL_CACHE_TIMEOUT = 60 * 60 * 24
+# EXIF orientation values and the transpose that undoes them.
+EXIF_ORIENTATION_TAG = 274
+EXIF_ORIENTATIONS = {
+    3: Image.ROTATE_180,
+    6: Image.ROTATE_270,
+    8: Image.ROTATE_90,
+}
 logger = logging.getLogger(__name__)
 ProfileManager = Manager.from_queryset(UserProfileQuerySet)
+# Attributes of UserProfile served by privacy aware helper properties.
+PRIVACY_SPECIAL_ATTRIBUTES = {
+    'accounts': '_accounts',
+    'alternate_emails': '_alternate_emails',
+    'email': '_primary_email',
+    'is_public_indexable': '_is_public_indexable',
+    'languages': '_languages',
+    'vouches_made': '_vouches_made',
+    'vouches_received': '_vouches_received',
+    'vouched_by': '_vouched_by',
+    'websites': '_websites',
+    'identity_profiles': '_identity_profiles'
+}
+
+
+def merge_alternate_emails(legacy_emails, identity_profiles):
+    """Merge legacy alternate emails with identity profile emails.
+
+    Takes ExternalAccount objects of type EMAIL and IdpProfile objects
+    and returns a list with one entry per address. When an address
+    exists in both, the entry with the highest privacy value is kept,
+    preferring the IdpProfile on a tie. Addresses are compared case
+    insensitively, like the database does.
+
+    Only the API combines both sources. get_cis_emails() and the
+    profile page list identity profiles alone, legacy alternate emails
+    are neither published to CIS nor shown, so there is nothing for
+    them to merge.
+    """
+    legacy_emails = list(legacy_emails)
+    identity_profiles = list(identity_profiles)
+
+    idp_privacy = {}
+    for idp in identity_profiles:
+        key = idp.email.lower()
+        idp_privacy[key] = max(idp_privacy.get(key, 0), idp.privacy)
+    legacy_emails = [e for e in legacy_emails
+                     if idp_privacy.get(e.identifier.lower(), 0) < e.privacy]
+
+    legacy_privacy = {}
+    for email in legacy_emails:
+        key = email.identifier.lower()
+        legacy_privacy[key] = max(legacy_privacy.get(key, 0), email.privacy)
+    identity_profiles = [i for i in identity_profiles
+                         if legacy_privacy.get(i.email.lower(), 0) < i.privacy]
+
+    return legacy_emails + identity_profiles
+
+
+class ViewerClearance(object):
+    """Group memberships that grant a profile privacy clearance.
+
+    Computed once per profile and shared between requests through the
+    cache. Flags stored on the user and profile rows (is_superuser,
+    is_vouched) are not part of it, they are always read from the
+    instances themselves.
+    """
+    CACHE_KEY = 'users:clearance:{0}'
+    CACHE_TIMEOUT = 60 * 60
+    MANAGERS_GROUP = 'Managers'
+    STAFF_GROUP = 'staff'
+
+    def __init__(self, in_managers, in_staff, in_nda):
+        self.in_managers = in_managers
+        self.in_staff = in_staff
+        self.in_nda = in_nda
+
+    @classmethod
+    def compute(cls, profile):
+        """Query the clearance of a profile from the database."""
+        nda_groups = [settings.NDA_GROUP, settings.NDA_STAFF_GROUP]
+        in_managers = profile.user.groups.filter(name=cls.MANAGERS_GROUP).exists()
+        names = set(GroupMembership.objects
+                    .filter(userprofile_id=profile.pk)
+                    .filter(Q(group__name=cls.STAFF_GROUP)
+                            | Q(group__name__in=nda_groups, status=GroupMembership.MEMBER))
+                    .values_list('group__name', flat=True))
+        return cls(in_managers=in_managers,
+                   in_staff=cls.STAFF_GROUP in names,
+                   in_nda=bool(names.intersection(nda_groups)))
+
+    @classmethod
+    def group_names(cls):
+        """Return the names of the groups that grant clearance."""
+        return set([cls.STAFF_GROUP, settings.NDA_GROUP, settings.NDA_STAFF_GROUP])
+
+    @classmethod
+    def for_profile(cls, profile):
+        """Return the clearance of a profile, from the cache if possible."""
+        key = cls.CACHE_KEY.format(profile.pk)
+        clearance = cache.get(key)
+        if clearance is None:
+            clearance = cls.compute(profile)
+            cache.set(key, clearance, cls.CACHE_TIMEOUT)
+        return clearance
+
+    @classmethod
+    def invalidate(cls, *profile_ids):
+        """Drop the cached clearance of the given profiles."""
+        cache.delete_many([cls.CACHE_KEY.format(pk) for pk in profile_ids])
+
+
+def notify_profiles_changed(profile_ids):
+    """Queue the given profiles for CIS and update their search index.
+
+    Skills, languages and groups are part of both, but changing them
+    does not save the profile.
+    """
+    profiles = list(UserProfile.objects.filter(pk__in=profile_ids).complete())
+    queue_userprofiles_for_cis([profile.pk for profile in profiles])
+    signal_processor = apps.get_app_config('haystack').signal_processor
+    for profile in profiles:
+        signal_processor.handle_save(UserProfile, profile)
+
+
+def normalize_photo(image):
+    """Return an RGB version of a PIL image that fits in AVATAR_SIZE.
+
+    EXIF data does not survive re-encoding, so the EXIF orientation is
+    applied to the pixels.
+    """
+    try:
+        orientation = image._getexif().get(EXIF_ORIENTATION_TAG)
+    except (AttributeError, IOError, KeyError, IndexError):
+        orientation = None
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if orientation in EXIF_ORIENTATIONS:
+        image = image.transpose(EXIF_ORIENTATIONS[orientation])
+    image.thumbnail(AVATAR_SIZE, Image.ANTIALIAS)
+    return image
+
+
+def photo_urls_for(profiles, geometries, privacy_level=None):
+    """Return the photo URLs of profiles for each of the geometries.
+
+    The result maps profile ids to {geometry: url}. privacy_level is
+    the clearance of the viewer, like in get_privacy_aware_photo_url.
+    When it is None the privacy level of each instance is used, like
+    in get_photo_url.
+
+    Thumbnails that are not pre-generated are looked up in the cache
+    with a single get_many. Cache keys contain the photo name, which
+    changes on every upload, so a new photo never gets the URLs of the
+    previous one.
+    """
+    urls = {}
+    lookups = {}
+    gravatar_emails = {}
+    for profile in profiles:
+        profile_urls = urls.setdefault(profile.pk, {})
+        level = profile._privacy_level if privacy_level is None else privacy_level
+        if level is None or profile.privacy_photo >= level:
+            if not profile.photo:
+                gravatar_emails[profile.pk] = profile.email
+                continue
+            photo_name = profile.photo.name
+            pregenerated = profile.photo_thumbnail_urls
+        else:
+            photo_name = None
+            pregenerated = {}
+
+        for geometry in geometries:
+            if geometry in pregenerated:
+                profile_urls[geometry] = pregenerated[geometry]
+                continue
+            name_hash = hashlib.md5(smart_str(photo_name or settings.DEFAULT_AVATAR_PATH))
+            key = PHOTO_URL_CACHE_KEY.format(name_hash.hexdigest(), geometry)
+            lookups.setdefault(key, []).append((profile, photo_name, geometry))
+
+    for geometry in geometries:
+        gravatar_urls = gravatars(gravatar_emails.values(), size=geometry)
+        for pk, email in gravatar_emails.items():
+            urls[pk][geometry] = gravatar_urls[email]
+
+    cached = cache.get_many(lookups.keys()) if lookups else {}
+    generated = {}
+    for key, entries in lookups.items():
+        url = cached.get(key)
+        if url is None:
+            profile, photo_name, geometry = entries[0]
+            if photo_name:
+                url = profile.get_photo_thumbnail(geometry).url
+            else:
+                url = get_thumbnail(settings.DEFAULT_AVATAR_PATH, geometry, crop='center').url
+            if not (url.startswith('https://') or url.startswith('http://')):
+                url = absolutify(url)
+            generated[key] = url
+        for profile, photo_name, geometry in entries:
+            urls[profile.pk][geometry] = url
+
+    if generated:
+        cache.set_many(generated, PHOTO_URL_CACHE_TIMEOUT)
+    return urls
 
 
 def _calculate_photo_filename(instance, filename):
@@ -50,6 +265,117 @@ def _calculate_photo_filename(instance, filename):
     return os.path.join(settings.USER_AVATAR_DIR, str(uuid.uuid4()) + '.jpg')
 
 
+class DirtyFieldsMixin(object):
+    """Track the fields of a model changed since it was loaded or saved.
+
+    save(only_dirty=True) writes only the changed fields and skips the
+    query and the save signals when nothing changed. While an instance
+    is saved, has_changed() tells signal receivers which fields the
+    save changes.
+
+    A plain save() is a full write, as for any model. Only the callers
+    that pass only_dirty get the shortcut.
+
+    COUNTER_FIELDS are maintained with queryset updates elsewhere. They
+    are never dirty, so save(only_dirty=True) can't overwrite them from
+    a stale instance.
+    """
+    COUNTER_FIELDS = ()
+    _loaded_values = None
+    _changed_fields = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(DirtyFieldsMixin, cls).from_db(db, field_names, values)
+        instance._loaded_values = instance._get_field_values()
+        return instance
+
+    def _get_attnames(self, names):
+        names = set(names)
+        return set(field.attname for field in self._meta.concrete_fields
+                   if field.name in names or field.attname in names)
+
+    def _get_field_values(self):
+        # Read __dict__ directly, deferred fields are not loaded and
+        # UserProfile hides privacy controlled fields behind attributes.
+        values = self.__dict__
+        return dict((field.attname, values[field.attname])
+                    for field in self._meta.concrete_fields if field.attname in values)
+
+    def get_dirty_fields(self):
+        """Return the names of the fields changed since the last load or save.
+
+        Every field is dirty for instances that were not loaded from the
+        database.
+        """
+        fields = [field for field in self._meta.concrete_fields
+                  if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        loaded = self._loaded_values
+        if loaded is None:
+            return set(field.attname for field in fields)
+
+        dirty = set()
+        values = self.__dict__
+        for field in fields:
+            name = field.attname
+            if name not in values:
+                continue
+            value = values[name]
+            # Files are uploaded on save, until then the name is the uploaded one.
+            if (name not in loaded or value != loaded[name]
+                    or getattr(value, '_committed', True) is False):
+                dirty.add(name)
+        return dirty
+
+    def has_changed(self, *fields):
+        """Return whether the save in progress changes any of the fields.
+
+        Without fields, whether it changes anything at all. Outside of
+        save() every field is considered changed.
+        """
+        changed = self._changed_fields
+        if changed is None:
+            return True
+        if not fields:
+            return bool(changed)
+        return any(field in changed for field in fields)
+
+    def save(self, *args, **kwargs):
+        only_dirty = kwargs.pop('only_dirty', False)
+        dirty = self.get_dirty_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            dirty &= self._get_attnames(update_fields)
+        elif only_dirty and self.pk and not self._state.adding:
+            if not dirty:
+                return
+            auto_now = [field.attname for field in self._meta.concrete_fields
+                        if getattr(field, 'auto_now', False)]
+            kwargs['update_fields'] = dirty.union(auto_now)
+
+        self._changed_fields = dirty
+        try:
+            super(DirtyFieldsMixin, self).save(*args, **kwargs)
+        finally:
+            self._changed_fields = None
+
+        self._update_loaded_values(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super(DirtyFieldsMixin, self).refresh_from_db(using=using, fields=fields)
+        self._update_loaded_values(fields)
+
+    def _update_loaded_values(self, fields):
+        """Mark fields, or every field when None, as in sync with the database."""
+        values = self._get_field_values()
+        if fields is None:
+            self._loaded_values = values
+        elif self._loaded_values is not None:
+            attnames = self._get_attnames(fields)
+            self._loaded_values.update((name, value) for name, value in values.items()
+                                       if name in attnames)
+
+
 class PrivacyField(models.PositiveSmallIntegerField):
 
     def __init__(self, *args, **kwargs):
@@ -61,6 +387,7 @@ class PrivacyField(models.PositiveSmallIntegerField):
 
 class UserProfilePrivacyModel(models.Model):
     _privacy_level = None
+    _privacy_mask = None
 
     privacy_photo = PrivacyField()
     privacy_full_name = PrivacyField()
@@ -138,14 +465,57 @@ class UserProfilePrivacyModel(models.Model):
             cls.CACHED_PRIVACY_FIELDS = privacy_fields
         return cls.CACHED_PRIVACY_FIELDS
 
+    @classmethod
+    def privacy_visible_q(cls, level, prefix=''):
+        """
+        Return a Q object matching the profiles that have at least one
+        privacy-controlled field visible to a viewer with clearance
+        `level`. Use `prefix` to apply it through a relation,
+        e.g. 'vouchee__'.
+        """
+        query = Q()
+        for field in cls.privacy_fields():
+            query |= Q(**{'{0}privacy_{1}__gte'.format(prefix, field): level})
+        return query
+
+    def is_visible_at(self, level):
+        """Check in memory the condition of privacy_visible_q()."""
+        _getattr = models.Model.__getattribute__
+        return any(_getattr(self, 'privacy_%s' % field) >= level
+                   for field in type(self).privacy_fields())
+
+    def _build_privacy_mask(self, level):
+        """
+        Return a dictionary with the privacy-controlled fields that are
+        hidden from a viewer with clearance `level`, mapped to the values
+        shown instead.
+        """
+        _getattr = models.Model.__getattribute__
+        return dict((field, default)
+                    for field, default in type(self).privacy_fields().items()
+                    if field not in PRIVACY_SPECIAL_ATTRIBUTES
+                    and _getattr(self, 'privacy_%s' % field) < level)
+
+    def __setattr__(self, attrname, value):
+        """Keep the privacy mask in sync with the privacy level and settings."""
+        super(UserProfilePrivacyModel, self).__setattr__(attrname, value)
+        if attrname == '_privacy_level' or attrname.startswith('privacy_'):
+            level = self.__dict__.get('_privacy_level')
+            self.__dict__['_privacy_mask'] = self._build_privacy_mask(level) if level else None
+
 
-class UserProfile(UserProfilePrivacyModel):
+class UserProfile(DirtyFieldsMixin, UserProfilePrivacyModel):
     REFERRAL_SOURCE_CHOICES = (
         ('direct', 'Mozillians'),
         ('contribute', 'Get Involved'),
     )
 
+    # Maintained by the vouch signals and reconcile_vouch_counts().
+    # is_vouched and can_vouch follow it but stay writable through save().
+    COUNTER_FIELDS = ('vouch_count',)
+
     objects = ProfileManager()
+    _clearance = None
 
     user = models.OneToOneField(User)
     full_name = models.CharField(max_length=255, default='', blank=False,
@@ -158,6 +528,8 @@ class UserProfile(UserProfilePrivacyModel):
     can_vouch = models.BooleanField(
         default=False,
         help_text='You can edit can_vouch status by editing invidual vouches')
+    # Maintained by the vouch signals, see users.signals.
+    vouch_count = models.PositiveIntegerField(default=0, editable=False)
     last_updated = models.DateTimeField(auto_now=True)
     groups = models.ManyToManyField(Group, blank=True, related_name='members',
                                     through=GroupMembership)
@@ -185,6 +557,8 @@ class UserProfile(UserProfilePrivacyModel):
                                 on_delete=models.SET_NULL)
 
     basket_token = models.CharField(max_length=1024, default='', blank=True)
+    # Vouched newsletter state last sent to Basket, None if never synced.
+    basket_vouched = models.NullBooleanField(default=None, editable=False)
     date_mozillian = models.DateField('When was involved with Mozilla',
                                       null=True, blank=True, default=None)
     timezone = models.CharField(max_length=100, blank=True, default='',
@@ -214,6 +588,18 @@ class UserProfile(UserProfilePrivacyModel):
     # This is the Auth0 user ID. We are saving only the primary here.
     auth0_user_id = models.CharField(max_length=1024, default='', blank=True)
     is_staff = models.BooleanField(default=False)
+    # Denormalized from the primary contact IdpProfile, kept in sync by
+    # the IdpProfile signals and refresh_primary_contact(). The privacy
+    # is None for profiles without identity profiles.
+    primary_contact_email = models.EmailField(blank=True, default='')
+    primary_contact_privacy = models.PositiveIntegerField(
+        null=True, default=None, choices=PRIVACY_CHOICES_WITH_PRIVATE)
+    # JSON with the photo name and the URLs of its PHOTO_GEOMETRIES
+    # thumbnails, written by the generate_photo_thumbnails task.
+    photo_thumbnails = models.TextField(blank=True, default='', editable=False)
+    # Materialized is_public and is_public_indexable, updated on save.
+    public = models.BooleanField(default=False, db_index=True, editable=False)
+    public_indexable = models.BooleanField(default=False, db_index=True, editable=False)
 
     def __unicode__(self):
         """Return this user's name when their profile is called."""
@@ -235,56 +621,65 @@ class UserProfile(UserProfilePrivacyModel):
 
         Otherwise it returns a default privacy respecting value for
         the attribute, as defined in the privacy_fields dictionary.
+        The fields to hide are computed once, when the privacy level
+        of the instance is set, so plain attribute reads stay cheap.
 
-        special_functions provides methods that privacy safe their
-        respective properties, where the privacy modifications are
-        more complex.
+        PRIVACY_SPECIAL_ATTRIBUTES provides methods that privacy safe
+        their respective properties, where the privacy modifications
+        are more complex.
         """
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        privacy_fields = UserProfile.privacy_fields()
-        privacy_level = _getattr('_privacy_level')
-        special_functions = {
-            'accounts': '_accounts',
-            'alternate_emails': '_alternate_emails',
-            'email': '_primary_email',
-            'is_public_indexable': '_is_public_indexable',
-            'languages': '_languages',
-            'vouches_made': '_vouches_made',
-            'vouches_received': '_vouches_received',
-            'vouched_by': '_vouched_by',
-            'websites': '_websites',
-            'identity_profiles': '_identity_profiles'
-        }
-
-        if attrname in special_functions:
-            return _getattr(special_functions[attrname])
-
-        if not privacy_level or attrname not in privacy_fields:
-            return _getattr(attrname)
+        _getattr = models.Model.__getattribute__
+        if attrname in PRIVACY_SPECIAL_ATTRIBUTES:
+            return _getattr(self, PRIVACY_SPECIAL_ATTRIBUTES[attrname])
 
-        field_privacy = _getattr('privacy_%s' % attrname)
-        if field_privacy < privacy_level:
-            return privacy_fields.get(attrname)
-
-        return _getattr(attrname)
+        privacy_mask = _getattr(self, '_privacy_mask')
+        if privacy_mask and attrname in privacy_mask:
+            return privacy_mask[attrname]
+        return _getattr(self, attrname)
 
     def _filter_accounts_privacy(self, accounts):
         if self._privacy_level:
             return accounts.filter(privacy__gte=self._privacy_level)
         return accounts
 
+    def _get_prefetched(self, relation):
+        """Return the objects with_privacy_relations() loaded for relation, or None."""
+        return self.__dict__.get(PRIVACY_RELATIONS[relation])
+
+    def _privacy_aware_relation(self, relation, queryset, predicate):
+        """Return the objects of queryset, from memory if relation is prefetched.
+
+        When the profile comes from a queryset using
+        with_privacy_relations(), the objects of the relation are already
+        loaded, so a PrefetchedRelation of those matching the predicate and
+        the privacy level of the instance is returned instead of running a
+        new query. Otherwise queryset is returned as is.
+        """
+        prefetched = self._get_prefetched(relation)
+        if prefetched is None:
+            return queryset
+
+        privacy_level = self._privacy_level
+        return PrefetchedRelation(
+            obj for obj in prefetched
+            if predicate(obj) and (not privacy_level or obj.privacy >= privacy_level))
+
     @property
     def _accounts(self):
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         excluded_types = [ExternalAccount.TYPE_WEBSITE, ExternalAccount.TYPE_EMAIL]
         accounts = _getattr('externalaccount_set').exclude(type__in=excluded_types)
-        return self._filter_accounts_privacy(accounts)
+        return self._privacy_aware_relation('externalaccount_set',
+                                            self._filter_accounts_privacy(accounts),
+                                            lambda x: x.type not in excluded_types)
 
     @property
     def _alternate_emails(self):
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         accounts = _getattr('externalaccount_set').filter(type=ExternalAccount.TYPE_EMAIL)
-        return self._filter_accounts_privacy(accounts)
+        return self._privacy_aware_relation('externalaccount_set',
+                                            self._filter_accounts_privacy(accounts),
+                                            lambda x: x.type == ExternalAccount.TYPE_EMAIL)
 
     @property
     def _api_alternate_emails(self):
@@ -294,25 +689,15 @@ class UserProfile(UserProfilePrivacyModel):
         and ExternalAccount objects. In conflicts/duplicates it returns
         the minimum privacy level defined.
         """
-        legacy_emails_qs = self._alternate_emails
-        idp_qs = self._identity_profiles
-
-        e_exclude = [e.id for e in legacy_emails_qs if
-                     idp_qs.filter(email=e.identifier, privacy__gte=e.privacy).exists()]
-        legacy_emails_qs = legacy_emails_qs.exclude(id__in=e_exclude)
-
-        idp_exclude = [i.id for i in idp_qs if
-                       legacy_emails_qs.filter(identifier=i.email,
-                                               privacy__gte=i.privacy).exists()]
-        idp_qs = idp_qs.exclude(id__in=idp_exclude)
-
-        return chain(legacy_emails_qs, idp_qs)
+        return merge_alternate_emails(self._alternate_emails, self._identity_profiles)
 
     @property
     def _identity_profiles(self):
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         accounts = _getattr('idp_profiles').all()
-        return self._filter_accounts_privacy(accounts)
+        return self._privacy_aware_relation('idp_profiles',
+                                            self._filter_accounts_privacy(accounts),
+                                            lambda x: True)
 
     @property
     def _is_public_indexable(self):
@@ -326,6 +711,9 @@ class UserProfile(UserProfilePrivacyModel):
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         if self._privacy_level > _getattr('privacy_languages'):
             return _getattr('language_set').none()
+        prefetched = self._get_prefetched('language_set')
+        if prefetched is not None:
+            return PrefetchedRelation(prefetched)
         return _getattr('language_set').all()
 
     @property
@@ -333,13 +721,14 @@ class UserProfile(UserProfilePrivacyModel):
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
 
         privacy_fields = UserProfile.privacy_fields()
+        contact_email = _getattr('primary_contact_email')
+        contact_privacy = _getattr('primary_contact_privacy')
 
         if self._privacy_level:
             # Try IDP contact first
-            if self.idp_profiles.exists():
-                contact_ids = self.identity_profiles.filter(primary_contact_identity=True)
-                if contact_ids.exists():
-                    return contact_ids[0].email
+            if contact_privacy is not None:
+                if contact_privacy >= self._privacy_level:
+                    return contact_email
                 return ''
 
             # Fallback to user.email
@@ -347,40 +736,67 @@ class UserProfile(UserProfilePrivacyModel):
                 return privacy_fields['email']
 
         # In case we don't have a privacy aware attribute access
-        if self.idp_profiles.filter(primary_contact_identity=True).exists():
-            return self.idp_profiles.filter(primary_contact_identity=True)[0].email
-        return _getattr('user').email
+        return contact_email or _getattr('user').email
+
+    @classmethod
+    def primary_contact_fields(cls, profile_id):
+        """Return the denormalized primary contact fields of a profile.
+
+        The result can be passed to update() or set on an instance.
+        """
+        contact = (IdpProfile.objects.filter(profile_id=profile_id)
+                   .order_by('-primary_contact_identity', 'id')
+                   .only('email', 'privacy', 'primary_contact_identity').first())
+        if not contact:
+            return {'primary_contact_email': '', 'primary_contact_privacy': None}
+        return {
+            'primary_contact_email': contact.email if contact.primary_contact_identity else '',
+            'primary_contact_privacy': contact.privacy
+        }
+
+    def refresh_primary_contact(self, save=False):
+        """Copy the primary contact identity to the profile.
+
+        With save=True only the denormalized columns are written, without
+        calling save() and its signals.
+        """
+        fields = UserProfile.primary_contact_fields(self.pk)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        # The email is one of the PUBLIC_INDEXABLE_FIELDS.
+        fields.update(public=self.is_public, public_indexable=self.is_public_indexable)
+        self.public = fields['public']
+        self.public_indexable = fields['public_indexable']
+        if save:
+            UserProfile.objects.filter(pk=self.pk).update(**fields)
+
+    @classmethod
+    def refresh_public_flags(cls, profile_ids):
+        """Recompute the public flags of profiles changed with update()."""
+        profiles = cls.objects.filter(pk__in=profile_ids).select_related('user')
+        for profile in profiles:
+            public, public_indexable = profile.is_public, profile.is_public_indexable
+            if (public, public_indexable) != (profile.public, profile.public_indexable):
+                cls.objects.filter(pk=profile.pk).update(public=public,
+                                                         public_indexable=public_indexable)
 
     @property
     def _vouched_by(self):
         privacy_level = self._privacy_level
         voucher = (UserProfile.objects.filter(vouches_made__vouchee=self)
-                   .order_by('vouches_made__date'))
-
-        if voucher.exists():
-            voucher = voucher[0]
-            if privacy_level:
-                voucher.set_instance_privacy_level(privacy_level)
-                for field in UserProfile.privacy_fields():
-                    if getattr(voucher, 'privacy_%s' % field) >= privacy_level:
-                        return voucher
-                return None
-            return voucher
+                   .order_by('vouches_made__date').first())
 
-        return None
+        if voucher and privacy_level:
+            if not voucher.is_visible_at(privacy_level):
+                return None
+            voucher.set_instance_privacy_level(privacy_level)
+        return voucher
 
     def _vouches(self, type):
+        """Return the vouches whose vouchee is visible at the current privacy level."""
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-
-        vouch_ids = []
-        for vouch in _getattr(type).all():
-            vouch.vouchee.set_instance_privacy_level(self._privacy_level)
-            for field in UserProfile.privacy_fields():
-                if getattr(vouch.vouchee, 'privacy_%s' % field, 0) >= self._privacy_level:
-                    vouch_ids.append(vouch.id)
-        vouches = _getattr(type).filter(pk__in=vouch_ids)
-
-        return vouches
+        visible_q = UserProfile.privacy_visible_q(self._privacy_level, prefix='vouchee__')
+        return _getattr(type).filter(visible_q)
 
     @property
     def _vouches_made(self):
@@ -400,18 +816,32 @@ class UserProfile(UserProfilePrivacyModel):
     def _websites(self):
         _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         accounts = _getattr('externalaccount_set').filter(type=ExternalAccount.TYPE_WEBSITE)
-        return self._filter_accounts_privacy(accounts)
+        return self._privacy_aware_relation('externalaccount_set',
+                                            self._filter_accounts_privacy(accounts),
+                                            lambda x: x.type == ExternalAccount.TYPE_WEBSITE)
 
     @property
     def display_name(self):
         return self.full_name
 
+    @property
+    def clearance(self):
+        """Return the ViewerClearance of the user, loaded once per instance."""
+        if self._clearance is None:
+            self._clearance = ViewerClearance.for_profile(self)
+        return self._clearance
+
+    def clear_clearance(self):
+        """Forget the clearance of the user, here and in the cache."""
+        self._clearance = None
+        ViewerClearance.invalidate(self.pk)
+
     @property
     def privacy_level(self):
         """Return user privacy clearance."""
-        if (self.user.groups.filter(name='Managers').exists() or self.user.is_superuser):
+        if self.user.is_superuser or self.clearance.in_managers:
             return PRIVATE
-        if self.groups.filter(name='staff').exists():
+        if self.clearance.in_staff:
             return EMPLOYEES
         if self.is_vouched:
             return MOZILLIANS
@@ -437,18 +867,11 @@ class UserProfile(UserProfilePrivacyModel):
 
     @property
     def is_manager(self):
-        return self.user.is_superuser or self.user.groups.filter(name='Managers').exists()
+        return self.user.is_superuser or self.clearance.in_managers
 
     @property
     def is_nda(self):
-        query = {
-            'userprofile__pk': self.pk,
-            'status': GroupMembership.MEMBER
-        }
-        is_nda_member = (GroupMembership.objects.filter(Q(group__name=settings.NDA_GROUP)
-                                                        | Q(group__name=settings.NDA_STAFF_GROUP))
-                                                .filter(**query).exists())
-        return is_nda_member or self.user.is_superuser
+        return self.user.is_superuser or self.clearance.in_nda
 
     @property
     def date_vouched(self):
@@ -496,7 +919,11 @@ class UserProfile(UserProfilePrivacyModel):
             self.save()
 
     def set_membership(self, model, membership_list):
-        """Alters membership to Groups and Skills."""
+        """Alters membership to Groups and Skills.
+
+        Aliases are resolved in one query and new memberships are
+        created in bulk. For groups, CIS is notified once at the end.
+        """
         if model is Group:
             m2mfield = self.groups
             alias_model = GroupAlias
@@ -505,48 +932,73 @@ class UserProfile(UserProfilePrivacyModel):
             alias_model = SkillAlias
 
         # Remove any visible groups that weren't supplied in this list.
+        changed = False
         if model is Group:
-            (GroupMembership.objects.filter(userprofile=self, group__visible=True)
-                                    .exclude(group__name__in=membership_list).delete())
+            removed = (GroupMembership.objects.filter(userprofile=self, group__visible=True)
+                                              .exclude(group__name__in=membership_list))
+            if GroupMembership.delete_memberships(removed):
+                changed = True
         else:
             m2mfield.remove(*[g for g in m2mfield.all()
                               if g.name not in membership_list and g.is_visible])
 
         # Add/create the rest of the groups
-        groups_to_add = []
-        for g in membership_list:
-            if alias_model.objects.filter(name=g).exists():
-                group = alias_model.objects.get(name=g).alias
-            else:
-                group = model.objects.create(name=g)
-
-            if group.is_visible:
-                groups_to_add.append(group)
+        aliases = alias_model.objects.filter(name__in=membership_list).select_related('alias')
+        groups = dict((alias.name.lower(), alias.alias) for alias in aliases)
+        for name in membership_list:
+            if name.lower() not in groups:
+                # New groups need an alias and a url, they are created one by one.
+                groups[name.lower()] = model.objects.create(name=name)
+        groups_to_add = [group for group in groups.values() if group.is_visible]
 
         if model is Group:
-            for group in groups_to_add:
-                group.add_member(self)
+            existing = set()
+            memberships = (GroupMembership.objects.filter(userprofile=self,
+                                                          group__in=groups_to_add)
+                                                  .select_related('group'))
+            for membership in memberships:
+                existing.add(membership.group_id)
+                if membership.status != GroupMembership.MEMBER or membership.needs_renewal:
+                    # Promotions send emails and newsletters, use the regular path.
+                    membership.group.add_member(self)
+
+            date_joined = now()
+            new_memberships = [GroupMembership(userprofile=self, group=group,
+                                               status=GroupMembership.MEMBER,
+                                               date_joined=date_joined)
+                               for group in groups_to_add if group.id not in existing]
+            if new_memberships:
+                GroupMembership.objects.bulk_create(new_memberships)
+                added = [membership.group_id for membership in new_memberships]
+                Group.refresh_member_counts(added)
+                Group.invalidate_shared_skills(added)
+                changed = True
+
+            if changed:
+                self.clear_clearance()
+                notify_profiles_changed([self.pk])
         else:
             m2mfield.add(*groups_to_add)
 
+    @property
+    def photo_thumbnail_urls(self):
+        """Return the pre-generated thumbnail URLs of the photo by geometry.
+
+        Empty if there is no photo, it is hidden by privacy or its
+        thumbnails are not generated yet.
+        """
+        if not self.photo or not self.photo_thumbnails:
+            return {}
+        data = json.loads(self.photo_thumbnails)
+        if data.get('photo') != self.photo.name:
+            return {}
+        return data.get('urls', {})
+
     def get_photo_thumbnail(self, geometry='160x160', **kwargs):
         if 'crop' not in kwargs:
             kwargs['crop'] = 'center'
 
         if self.photo and default_storage.exists(self.photo.name):
-            # Workaround for legacy images in RGBA model
-
-            try:
-                image_obj = Image.open(self.photo)
-            except IOError:
-                return get_thumbnail(settings.DEFAULT_AVATAR_PATH, geometry, **kwargs)
-
-            if image_obj.mode == 'RGBA':
-                new_fh = default_storage.open(self.photo.name, 'w')
-                converted_image_obj = image_obj.convert('RGB')
-                converted_image_obj.save(new_fh, 'JPEG')
-                new_fh.close()
-
             return get_thumbnail(self.photo, geometry, **kwargs)
         return get_thumbnail(settings.DEFAULT_AVATAR_PATH.format(), geometry, **kwargs)
 
@@ -561,6 +1013,9 @@ class UserProfile(UserProfilePrivacyModel):
         if (not self.photo and self.privacy_photo >= privacy_level):
             return gravatar(self.email, size=geometry)
 
+        if not kwargs:
+            return photo_urls_for([self], [geometry])[self.pk][geometry]
+
         photo_url = self.get_photo_thumbnail(geometry, **kwargs).url
         if photo_url.startswith('https://') or photo_url.startswith('http://'):
             return photo_url
@@ -633,64 +1088,65 @@ class UserProfile(UserProfilePrivacyModel):
         send_mail(subject, filtered_message, settings.FROM_NOREPLY,
                   [self.email])
 
-    def _get_annotated_groups(self):
-        # Query this way so we only get the groups that the privacy controls allow the
-        # current user to see. We have to force evaluation of this query first, otherwise
-        # Django combines the whole thing into one query and loses the privacy control.
-        groups_manager = self.groups
-        # checks to avoid AttributeError exception b/c self.groups may returns
-        # EmptyQuerySet instead of the default manager due to privacy controls
-        user_group_ids = []
-        if hasattr(groups_manager, 'visible'):
-            user_group_ids = groups_manager.visible().values_list('id', flat=True)
-
-        return self.groupmembership_set.filter(group__id__in=user_group_ids)
-
-    def get_annotated_tags(self):
-        """
-        Return a list of all the visible tags the user is a member of or pending
-        membership. The groups pending membership will have a .pending attribute
-        set to True, others will have it set False.
+    def get_annotated_groups(self):
         """
-        tags = self._get_annotated_groups().filter(group__is_access_group=False)
-        annotated_tags = []
-        for membership in tags:
-            tag = membership.group
-            tag.pending = (membership.status == GroupMembership.PENDING)
-            tag.pending_terms = (membership.status == GroupMembership.PENDING_TERMS)
-            annotated_tags.append(tag)
-        return annotated_tags
+        Return a tuple of the visible access groups and tags the user is a
+        member of or pending membership, as lists of AnnotatedGroup.
 
-    def get_annotated_access_groups(self):
-        """
-        Return a list of all the visible access groups the user is a member of or pending
-        membership. The groups pending membership will have a .pending attribute
-        set to True, others will have it set False. There is also an inviter attribute
-        which displays the inviter of the user in the group.
+        The records carry the pending and pending_terms flags of the
+        membership, whether the user curates the group and, for access
+        groups, the inviter of the user. Everything is fetched with one
+        query, plus one for the inviters if there are any.
         """
-        access_groups = self._get_annotated_groups().filter(group__is_access_group=True)
-        annotated_access_groups = []
-
-        for membership in access_groups:
-            group = membership.group
-            group.pending = (membership.status == GroupMembership.PENDING)
-            group.pending_terms = (membership.status == GroupMembership.PENDING_TERMS)
-
-            try:
-                invite = Invite.objects.get(group=membership.group, redeemer=self)
-            except Invite.DoesNotExist:
-                invite = None
+        # Only return the groups that the privacy controls allow the current user to see.
+        privacy_level = self._privacy_level
+        if privacy_level and self.privacy_groups < privacy_level:
+            return [], []
+
+        invites = Invite.objects.filter(group=OuterRef('group'), redeemer=OuterRef('userprofile'))
+        curated = Group.curators.through.objects.filter(group=OuterRef('group'),
+                                                        userprofile=OuterRef('userprofile'))
+        memberships = list(
+            GroupMembership.objects.filter(userprofile_id=self.id, group__visible=True)
+            .annotate(inviter_id=Subquery(invites.values('inviter')[:1]),
+                      is_curator=Exists(curated))
+            .order_by('group__name')
+            .values_list('group__id', 'group__name', 'group__url', 'group__is_access_group',
+                         'status', 'inviter_id', 'is_curator'))
+
+        inviter_ids = set(row[5] for row in memberships if row[3] and row[5])
+        inviters = {}
+        if inviter_ids:
+            inviters = UserProfile.objects.select_related('user').in_bulk(inviter_ids)
+
+        access_groups = []
+        tags = []
+        for (group_id, name, url, is_access_group, status, inviter_id,
+             is_curator) in memberships:
+            group = AnnotatedGroup(
+                id=group_id, name=name, url=url, is_access_group=is_access_group,
+                pending=(status == GroupMembership.PENDING),
+                pending_terms=(status == GroupMembership.PENDING_TERMS),
+                inviter=inviters.get(inviter_id) if is_access_group else None,
+                is_curator=bool(is_curator))
+            if is_access_group:
+                access_groups.append(group)
+            else:
+                tags.append(group)
+        return access_groups, tags
 
-            if invite:
-                group.inviter = invite.inviter
-            annotated_access_groups.append(group)
+    def get_annotated_tags(self):
+        """Return the visible tags of get_annotated_groups()."""
+        return self.get_annotated_groups()[1]
 
-        return annotated_access_groups
+    def get_annotated_access_groups(self):
+        """Return the visible access groups of get_annotated_groups()."""
+        return self.get_annotated_groups()[0]
 
     def get_cis_emails(self):
         """Prepares the entry for emails in the CIS format."""
         idp_profiles = self.idp_profiles.all()
-        primary_idp = idp_profiles.filter(primary=True)
+        primary_idp = [idp for idp in idp_profiles if idp.primary]
         emails = []
         primary_email = {
             'value': self.email,
@@ -700,14 +1156,16 @@ class UserProfile(UserProfilePrivacyModel):
         }
         # We have an IdpProfile marked as primary (login identity)
         # If there is not an idp profile, the self.email is the one that is used to login
-        if primary_idp.exists():
+        if primary_idp:
             primary_email['value'] = primary_idp[0].email
             primary_email['name'] = primary_idp[0].get_type_display()
 
         emails.append(primary_email)
 
         # Non primary identity profiles
-        for idp in self.idp_profiles.filter(primary=False):
+        for idp in idp_profiles:
+            if idp.primary:
+                continue
             entry = {
                 'value': idp.email,
                 'verified': True,
@@ -721,7 +1179,9 @@ class UserProfile(UserProfilePrivacyModel):
     def get_cis_uris(self):
         """Prepares the entry for URIs in the CIS format."""
         accounts = []
-        for account in self.externalaccount_set.exclude(type=ExternalAccount.TYPE_EMAIL):
+        for account in self.externalaccount_set.all():
+            if account.type == ExternalAccount.TYPE_EMAIL:
+                continue
             value = account.get_identifier_url()
             account_type = ExternalAccount.ACCOUNT_TYPES[account.type]
             if value:
@@ -735,27 +1195,24 @@ class UserProfile(UserProfilePrivacyModel):
 
         return accounts
 
+    def _get_cis_memberships(self):
+        # bundle_profiles() prefetches the memberships into cis_memberships.
+        memberships = getattr(self, 'cis_memberships', None)
+        if memberships is None:
+            memberships = (GroupMembership.objects
+                           .filter(userprofile=self, status=GroupMembership.MEMBER)
+                           .select_related('group'))
+        return memberships
+
     def get_cis_groups(self, idp):
         """Prepares the entry for profile groups in the CIS format."""
-
-        memberships = GroupMembership.objects.filter(
-            userprofile=self,
-            status=GroupMembership.MEMBER,
-            group__is_access_group=True
-        )
-        groups = ['mozilliansorg_{}'.format(m.group.url) for m in memberships]
+        groups = ['mozilliansorg_{}'.format(m.group.url) for m in self._get_cis_memberships()
+                  if m.group.is_access_group]
         return groups
 
     def get_cis_tags(self):
         """Prepares the entry for profile tags in the CIS format."""
-        memberships = GroupMembership.objects.filter(
-            userprofile=self,
-            status=GroupMembership.MEMBER
-        ).exclude(
-            group__is_access_group=True
-        )
-
-        tags = [m.group.url for m in memberships]
+        tags = [m.group.url for m in self._get_cis_memberships() if not m.group.is_access_group]
         return tags
 
     def timezone_offset(self):
@@ -770,19 +1227,27 @@ class UserProfile(UserProfilePrivacyModel):
     def save(self, *args, **kwargs):
         self._privacy_level = None
         autovouch = kwargs.pop('autovouch', False)
+        self.public = self.is_public
+        self.public_indexable = self.is_public_indexable
+        dirty = self.get_dirty_fields()
 
         super(UserProfile, self).save(*args, **kwargs)
+
+        if self.photo and 'photo' in dirty:
+            # The task reads the photo, wait until it is committed.
+            pk = self.pk
+            transaction.on_commit(lambda: generate_photo_thumbnails.delay(pk))
         # Auto_vouch follows the first save, because you can't
         # create foreign keys without a database id.
 
-        if self.is_complete:
-            send_userprofile_to_cis.delay(self.pk)
+        if dirty and self.is_complete:
+            queue_userprofile_for_cis(self.pk)
 
         if autovouch:
             self.auto_vouch()
 
 
-class IdpProfile(models.Model):
+class IdpProfile(DirtyFieldsMixin, models.Model):
     """Basic Identity Provider information for Profiles."""
     PROVIDER_UNKNOWN = 0
     PROVIDER_PASSWORDLESS = 10
@@ -820,6 +1285,8 @@ class IdpProfile(models.Model):
     privacy = models.PositiveIntegerField(default=MOZILLIANS, choices=PRIVACY_CHOICES_WITH_PRIVATE)
     primary_contact_identity = models.BooleanField(default=False)
     username = models.CharField(max_length=1024, default='', blank=True)
+    # Digest of the last payload published to CIS for this identity.
+    cis_payload_hash = models.CharField(max_length=40, default='', blank=True, editable=False)
 
     def get_provider_type(self):
         """Helper method to autopopulate the model type given the user_id."""
@@ -844,14 +1311,20 @@ class IdpProfile(models.Model):
         """Custom save method.
 
         Provides a default contact identity and a helper to assign the provider type.
+        The profile is only saved, with the fields that changed, when the
+        identity changes its primary contact or its user id.
         """
         self.type = self.get_provider_type()
         # If there isn't a primary contact identity, create one
-        if not (IdpProfile.objects.filter(profile=self.profile,
-                                          primary_contact_identity=True).exists()):
+        if not (self.primary_contact_identity
+                or IdpProfile.objects.filter(profile=self.profile,
+                                             primary_contact_identity=True).exists()):
             self.primary_contact_identity = True
 
+        dirty = self.get_dirty_fields()
         super(IdpProfile, self).save(*args, **kwargs)
+        if not dirty:
+            return
 
         # Save profile.privacy_email when a primary contact identity changes
         profile = self.profile
@@ -860,7 +1333,10 @@ class IdpProfile(models.Model):
         # Set the user id in the userprofile too
         if self.primary:
             profile.auth0_user_id = self.auth0_user_id
-        profile.save()
+        profile.save(only_dirty=True)
+        # The identities are part of the CIS payload of the profile.
+        if profile.is_complete:
+            queue_userprofile_for_cis(profile.pk)
 
     def __unicode__(self):
         return u'{}|{}|{}'.format(self.profile, self.type, self.email)
@@ -888,6 +1364,21 @@ class Vouch(models.Model):
         return u'{0} vouched by {1}'.format(self.vouchee, self.voucher)
 
 
+class CISOutbox(models.Model):
+    """Profile waiting to be published to CIS, see queue_userprofile_for_cis."""
+    # Not a foreign key, profiles are queued while their memberships are
+    # deleted, right before the profile itself.
+    profile_id = models.PositiveIntegerField(unique=True)
+    requests = models.PositiveIntegerField(default=1)
+    updated = models.DateTimeField(default=now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'CIS outbox'
+
+    def __unicode__(self):
+        return u'{0} ({1} requests)'.format(self.profile_id, self.requests)
+
+
 class AbuseReport(models.Model):
     TYPE_SPAM = 'spam'
     TYPE_INAPPROPRIATE = 'inappropriate'
@@ -1066,7 +1557,7 @@ class ExternalAccount(models.Model):
 
 
 class Language(models.Model):
-    code = models.CharField(max_length=63, choices=get_languages_for_locale('en'))
+    code = models.CharField(max_length=63, choices=LazyLanguageChoices('en'))
     userprofile = models.ForeignKey(UserProfile)
 
     class Meta:
@@ -1080,13 +1571,7 @@ class Language(models.Model):
         return self.get_code_display()
 
     def get_native(self):
-        if not getattr(self, '_native', None):
-            languages = get_languages_for_locale(self.code)
-            for code, language in languages:
-                if code == self.code:
-                    self._native = language
-                    break
-        return self._native
+        return get_language_names(self.code).get(self.code)
 
     def unique_error_message(self, model_class, unique_check):
         if (model_class == type(self) and unique_check == ('code', 'userprofile')):
@@ -1,6 +1,7 @@
 from haystack import indexes
 
 from mozillians.groups.models import GroupMembership
+from mozillians.users.managers import privacy_relation_prefetches
 from mozillians.users.models import IdpProfile, UserProfile
 
 
@@ -60,6 +61,10 @@ class UserProfileIndex(indexes.SearchIndex, indexes.Indexable):
         """Exclude incomplete profiles from indexing."""
         return self.get_model().objects.complete()
 
+    def read_queryset(self, using=None):
+        """Load the profiles of a page of results with their privacy relations."""
+        return self.get_model().objects.select_related('user').with_privacy_relations()
+
 
 class IdpProfileIndex(indexes.SearchIndex, indexes.Indexable):
     """IdpProfile Profile Search Index."""
@@ -85,3 +90,8 @@ class IdpProfileIndex(indexes.SearchIndex, indexes.Indexable):
                 idps_ids.append(idp.id)
                 unique_emails.add(idp.email)
         return self.get_model().objects.filter(id__in=idps_ids)
+
+    def read_queryset(self, using=None):
+        """Load the profiles of a page of results with their privacy relations."""
+        return (self.get_model().objects.select_related('profile__user')
+                .prefetch_related(*privacy_relation_prefetches('profile__')))
@@ -1,17 +1,20 @@
 import json
 import logging
+from django.apps import apps
 from django.db import transaction
-from django.db.models import signals
+from django.db.models import F, signals
 from django.dispatch import receiver
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group as AuthGroup, User
 
 from raven.contrib.django.raven_compat.models import client as sentry_client
 
 from mozillians.common.utils import bundle_profile_data
-from mozillians.groups.models import Group
-from mozillians.users.models import UserProfile, Vouch
-from mozillians.users.tasks import subscribe_user_to_basket, unsubscribe_from_basket_task
+from mozillians.groups.models import Group, GroupMembership
+from mozillians.users.models import (IdpProfile, Language, UserProfile, ViewerClearance, Vouch,
+                                     notify_profiles_changed)
+from mozillians.users.tasks import (queue_userprofile_for_cis, subscribe_user_to_basket,
+                                    unsubscribe_from_basket_task)
 
 
 # Signal to create a UserProfile.
@@ -44,21 +47,26 @@ def remove_user_from_access_groups(sender, instance, **kwargs):
         # If the user is the only curator of an access group
         # add all the super users as curators and remove the user
         if not group.curator_can_leave(instance):
-            for super_user in UserProfile.objects.filter(user__is_superuser=True):
-                group.curators.add(super_user)
-                if not group.has_member(super_user):
-                    group.add_member(super_user)
+            group.add_superusers_as_curators()
         group.curators.remove(instance)
 
 
 # Basket User signals
 @receiver(signals.post_save, sender=UserProfile, dispatch_uid='update_basket_sig')
 def update_basket(sender, instance, **kwargs):
+    # Only sync the vouched newsletter when the vouched status differs
+    # from the one Basket last accepted. The tasks record the new state.
+    # Profiles never synced are not subscribed.
+    is_vouched = instance.is_vouched
+    if bool(instance.basket_vouched) == is_vouched:
+        return
+
     newsletters = [settings.BASKET_VOUCHED_NEWSLETTER]
-    if instance.is_vouched:
-        subscribe_user_to_basket.delay(instance.id, newsletters)
+    if is_vouched:
+        subscribe_user_to_basket.delay(instance.id, newsletters, sync_vouched=True)
     else:
-        unsubscribe_from_basket_task.delay(instance.email, newsletters)
+        unsubscribe_from_basket_task.delay(instance.email, newsletters,
+                                           sync_vouched_id=instance.id)
 
 
 @receiver(signals.pre_delete, sender=UserProfile, dispatch_uid='unsubscribe_from_basket_sig')
@@ -92,22 +100,188 @@ def push_empty_groups_to_cis(sender, instance, **kwargs):
     send_userprofile_to_cis.delay(profile_results=data)
 
 
+# Keep the denormalized primary contact of the profile in sync.
+@receiver(signals.post_save, sender=IdpProfile, dispatch_uid='refresh_primary_contact_save_sig')
+@receiver(signals.post_delete, sender=IdpProfile, dispatch_uid='refresh_primary_contact_sig')
+def refresh_primary_contact(sender, instance, raw=False, **kwargs):
+    if raw or not instance.has_changed('email', 'privacy', 'primary_contact_identity'):
+        return
+    fields = UserProfile.primary_contact_fields(instance.profile_id)
+    UserProfile.objects.filter(pk=instance.profile_id).update(**fields)
+    UserProfile.refresh_public_flags([instance.profile_id])
+    if IdpProfile.profile.is_cached(instance):
+        profile = instance.profile
+        for name, value in fields.items():
+            setattr(profile, name, value)
+        profile._update_loaded_values(fields.keys())
+
+
+# user.email is the primary email of profiles without a contact identity.
+@receiver(signals.post_save, sender=User, dispatch_uid='refresh_user_public_flags_sig')
+def refresh_user_public_flags(sender, instance, created, raw, update_fields=None, **kwargs):
+    if raw or created or (update_fields is not None and 'email' not in update_fields):
+        return
+    UserProfile.refresh_public_flags(
+        list(UserProfile.objects.filter(user=instance).values_list('pk', flat=True)))
+
+
+# Skills and languages are edited without saving the profile.
+@receiver(signals.m2m_changed, sender=UserProfile.skills.through,
+          dispatch_uid='notify_skills_changed_sig')
+def notify_skills_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # The cleared profiles are not known after the clear.
+        instance._cleared_profile_ids = list(instance.members.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        profile_ids = [instance.pk]
+        if reverse:
+            profile_ids = instance.__dict__.pop('_cleared_profile_ids', [])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        profile_ids = pk_set if reverse else [instance.pk]
+    else:
+        return
+    notify_profiles_changed(profile_ids)
+
+
+@receiver(signals.post_save, sender=Language, dispatch_uid='notify_language_saved_sig')
+@receiver(signals.post_delete, sender=Language, dispatch_uid='notify_language_deleted_sig')
+def notify_languages_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        notify_profiles_changed([instance.userprofile_id])
+
+
 # Signals related to vouching.
-@receiver(signals.post_delete, sender=Vouch, dispatch_uid='update_vouch_flags_delete_sig')
+def _update_vouch_count(vouch, delta):
+    """Add delta to the vouch count of the vouchee and update its vouch flags.
+
+    The profile is not saved. Basket, CIS and the search index are only
+    notified when is_vouched or can_vouch changes.
+    """
+    profiles = UserProfile.objects.filter(pk=vouch.vouchee_id)
+    if not profiles.update(vouch_count=F('vouch_count') + delta):
+        # The profile no longer exists.
+        return
+    vouch_count, is_vouched, can_vouch = profiles.values_list(
+        'vouch_count', 'is_vouched', 'can_vouch').get()
+
+    flags = {
+        'is_vouched': vouch_count > 0,
+        'can_vouch': vouch_count >= settings.CAN_VOUCH_THRESHOLD,
+    }
+    changed = (is_vouched, can_vouch) != (flags['is_vouched'], flags['can_vouch'])
+    if changed:
+        profiles.update(**flags)
+
+    if Vouch.vouchee.is_cached(vouch):
+        profile = vouch.vouchee
+        profile.vouch_count = vouch_count
+        for name, value in flags.items():
+            setattr(profile, name, value)
+        profile._update_loaded_values(['vouch_count'] + flags.keys())
+    elif changed:
+        profile = profiles.get()
+    else:
+        return
+
+    if changed:
+        update_basket(UserProfile, profile)
+        queue_userprofile_for_cis(profile.pk)
+        apps.get_app_config('haystack').signal_processor.handle_save(UserProfile, profile)
+
+
 @receiver(signals.post_save, sender=Vouch, dispatch_uid='update_vouch_flags_save_sig')
-def update_vouch_flags(sender, instance, **kwargs):
-    if kwargs.get('raw'):
+def update_vouch_flags(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        _update_vouch_count(instance, 1)
+
+
+@receiver(signals.post_delete, sender=Vouch, dispatch_uid='update_vouch_flags_delete_sig')
+def update_vouch_flags_delete(sender, instance, **kwargs):
+    _update_vouch_count(instance, -1)
+
+
+# Signals related to privacy clearance.
+@receiver(signals.post_delete, sender=GroupMembership,
+          dispatch_uid='clear_clearance_membership_delete_sig')
+@receiver(signals.post_save, sender=GroupMembership,
+          dispatch_uid='clear_clearance_membership_save_sig')
+def clear_membership_clearance(sender, instance, **kwargs):
+    if GroupMembership.userprofile.is_cached(instance):
+        instance.userprofile.clear_clearance()
+    else:
+        ViewerClearance.invalidate(instance.userprofile_id)
+
+
+@receiver(signals.m2m_changed, sender=User.groups.through,
+          dispatch_uid='clear_clearance_auth_groups_sig')
+def clear_auth_groups_clearance(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate the clearance of users added to or removed from auth groups.
+
+    Membership in the Managers group grants PRIVATE clearance.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
         return
-    try:
-        profile = instance.vouchee
-    except UserProfile.DoesNotExist:
-        # In this case we delete not only the vouches but the
-        # UserProfile as well. Do nothing.
+    if not reverse:
+        user_ids = [instance.pk]
+        if User.userprofile.is_cached(instance):
+            instance.userprofile._clearance = None
+    elif pk_set is not None:
+        user_ids = pk_set
+    else:
+        user_ids = instance.user_set.values_list('id', flat=True)
+    profile_ids = UserProfile.objects.filter(user_id__in=user_ids).values_list('id', flat=True)
+    ViewerClearance.invalidate(*profile_ids)
+
+
+def _clearance_group_names(model):
+    if model is AuthGroup:
+        return set([ViewerClearance.MANAGERS_GROUP])
+    return ViewerClearance.group_names()
+
+
+def _clearance_profile_ids(instance):
+    """Return the ids of the profiles whose clearance depends on a group."""
+    if isinstance(instance, AuthGroup):
+        return list(UserProfile.objects.filter(user__groups=instance).values_list('id', flat=True))
+    return list(GroupMembership.objects.filter(group=instance)
+                .values_list('userprofile_id', flat=True))
+
+
+@receiver(signals.pre_save, sender=Group, dispatch_uid='load_clearance_group_name_sig')
+@receiver(signals.pre_save, sender=AuthGroup, dispatch_uid='load_clearance_auth_group_name_sig')
+def load_clearance_group_name(sender, instance, raw=False, **kwargs):
+    old_name = None
+    if instance.pk and not raw:
+        old_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+    instance._clearance_old_name = old_name
+
+
+@receiver(signals.post_save, sender=Group, dispatch_uid='clear_clearance_group_rename_sig')
+@receiver(signals.post_save, sender=AuthGroup,
+          dispatch_uid='clear_clearance_auth_group_rename_sig')
+def clear_group_rename_clearance(sender, instance, created, raw=False, **kwargs):
+    """Invalidate the clearance of the members of a group renamed from or to a clearance group."""
+    old_name = instance.__dict__.pop('_clearance_old_name', None)
+    if raw or created or old_name is None or old_name == instance.name:
         return
+    if _clearance_group_names(sender).intersection([old_name, instance.name]):
+        ViewerClearance.invalidate(*_clearance_profile_ids(instance))
+
+
+@receiver(signals.pre_delete, sender=Group, dispatch_uid='load_clearance_group_members_sig')
+@receiver(signals.pre_delete, sender=AuthGroup,
+          dispatch_uid='load_clearance_auth_group_members_sig')
+def load_clearance_group_members(sender, instance, **kwargs):
+    # The members are not known anymore after the delete.
+    if instance.name in _clearance_group_names(sender):
+        instance._clearance_profile_ids = _clearance_profile_ids(instance)
 
-    vouches_qs = Vouch.objects.filter(vouchee=profile)
-    vouches = vouches_qs.count()
 
-    profile.is_vouched = vouches > 0
-    profile.can_vouch = vouches >= settings.CAN_VOUCH_THRESHOLD
-    profile.save(**{'autovouch': False})
+@receiver(signals.post_delete, sender=Group, dispatch_uid='clear_clearance_group_delete_sig')
+@receiver(signals.post_delete, sender=AuthGroup,
+          dispatch_uid='clear_clearance_auth_group_delete_sig')
+def clear_group_delete_clearance(sender, instance, **kwargs):
+    profile_ids = instance.__dict__.pop('_clearance_profile_ids', None)
+    if profile_ids:
+        ViewerClearance.invalidate(*profile_ids)
@@ -6,6 +6,8 @@ from datetime import timedelta
 from django.conf import settings
 from django.core.mail import send_mail
 from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
 from django.utils.timezone import now
 
 import basket
@@ -16,12 +18,14 @@ from haystack import connections
 from raven.contrib.django.raven_compat.models import client as sentry_client
 
 from mozillians.celery import app
-from mozillians.common.utils import akismet_spam_check, bundle_profile_data, is_test_environment
+from mozillians.common.utils import (akismet_spam_check, bundle_identities, cis_payload_hash,
+                                     is_test_environment)
 from mozillians.common.templatetags.helpers import get_object_or_none
 
 
 BASKET_TASK_RETRY_DELAY = 120  # 2 minutes
 BASKET_TASK_MAX_RETRIES = 2  # Total 1+2 = 3 tries
+BASKET_RECONCILE_BATCH_SIZE = 500
 BASKET_URL = getattr(settings, 'BASKET_URL', False)
 BASKET_API_KEY = os.environ.get('BASKET_API_KEY', getattr(settings, 'BASKET_API_KEY', False))
 BASKET_VOUCHED_NEWSLETTER = getattr(settings, 'BASKET_VOUCHED_NEWSLETTER', False)
@@ -33,10 +37,14 @@ BASKET_ENABLED = all([
     BASKET_NDA_NEWSLETTER
 ])
 
+CIS_CREDENTIALS_REFRESH_MARGIN = timedelta(minutes=5)
+CIS_PUBLISH_BATCH_SIZE = 100
 INCOMPLETE_ACC_MAX_DAYS = 7
 MOZILLIANS_NEWSLETTERS = [BASKET_NDA_NEWSLETTER, BASKET_VOUCHED_NEWSLETTER]
 MOZILLIANS_URL = getattr(settings, 'SITE_URL', 'https://mozillians.org')
 
+logger = logging.getLogger(__name__)
+
 
 class DebugBasketTask(Task):
     """Base Error Handing Abstract class for all the Basket Tasks."""
@@ -182,7 +190,20 @@ def unsubscribe_user_task(self, result, newsletters=[], optout=False):
 
 
 @shared_task()
-def subscribe_user_to_basket(instance_id, newsletters=[]):
+def set_basket_vouched(instance_id, is_vouched):
+    """Record the vouched newsletter state of a user in Basket.
+
+    This runs last in the subscribe and unsubscribe chains, after Basket
+    accepted the change. When a chain fails, the profile stays out of
+    sync for reconcile_basket_subscriptions.
+    """
+    from mozillians.users.models import UserProfile
+
+    UserProfile.objects.filter(pk=instance_id).update(basket_vouched=is_vouched)
+
+
+@shared_task()
+def subscribe_user_to_basket(instance_id, newsletters=[], sync_vouched=False):
     """Subscribe a user to Basket.
 
     This task subscribes a user to Basket, if not already subscribed
@@ -190,6 +211,9 @@ def subscribe_user_to_basket(instance_id, newsletters=[]):
     retries on failure at most BASKET_TASK_MAX_RETRIES times and if it
     finally doesn't complete successfully, it emails the
     settings.BASKET_MANAGERS with details.
+
+    With sync_vouched, the profile is marked as subscribed to the
+    vouched newsletter once done.
     """
 
     from mozillians.users.models import UserProfile
@@ -204,7 +228,10 @@ def subscribe_user_to_basket(instance_id, newsletters=[]):
 
     lookup_subtask = lookup_user_task.subtask((instance.email,))
     subscribe_subtask = subscribe_user_task.subtask((instance.email, newsletters,))
-    chain(lookup_subtask | subscribe_subtask)()
+    subtasks = [lookup_subtask, subscribe_subtask]
+    if sync_vouched:
+        subtasks.append(set_basket_vouched.si(instance.pk, True))
+    chain(*subtasks)()
 
 
 @shared_task()
@@ -228,19 +255,113 @@ def update_email_in_basket(old_email, new_email):
 
 
 @shared_task()
-def unsubscribe_from_basket_task(email, newsletters=[]):
+def unsubscribe_from_basket_task(email, newsletters=[], sync_vouched_id=None):
     """Remove user from Basket Task.
 
-    This task unsubscribes a user from the Mozillians newsletter.
+    This task unsubscribes a user from the Mozillians newsletter. The
+    profile with the id sync_vouched_id, if given, is marked as
+    unsubscribed from the vouched newsletter once done.
     """
     if not BASKET_ENABLED or not waffle.switch_is_active('BASKET_SWITCH_ENABLED'):
         return
 
     # Lookup the email and then pass the result to the unsubscribe subtask
-    chain(
+    subtasks = [
         lookup_user_task.subtask((email,)),
         unsubscribe_user_task.subtask((newsletters,))
-    ).delay()
+    ]
+    if sync_vouched_id:
+        subtasks.append(set_basket_vouched.si(sync_vouched_id, False))
+    chain(*subtasks).delay()
+
+
+@app.task
+def reconcile_basket_subscriptions(batch_size=BASKET_RECONCILE_BATCH_SIZE):
+    """Sync the vouched newsletter of profiles whose Basket state is out of date.
+
+    This covers vouched profiles that were never synced and changes whose
+    subscribe or unsubscribe chain did not complete, see
+    set_basket_vouched. Profiles that fail stay pending for the next run.
+    """
+    from mozillians.users.models import UserProfile
+
+    if not BASKET_ENABLED or not waffle.switch_is_active('BASKET_SWITCH_ENABLED'):
+        return None
+
+    newsletters = [BASKET_VOUCHED_NEWSLETTER]
+    profiles = (UserProfile.objects.exclude(basket_vouched=F('is_vouched'))
+                .exclude(basket_vouched__isnull=True, is_vouched=False)
+                .select_related('user', 'country').order_by('pk')[:batch_size])
+    synced = {True: [], False: []}
+    failed = 0
+    for profile in profiles:
+        try:
+            if profile.is_vouched:
+                kwargs = {
+                    'sync': 'N',
+                    'source_url': MOZILLIANS_URL,
+                    'optin': 'Y',
+                    'api_key': BASKET_API_KEY
+                }
+                if profile.country:
+                    kwargs['country'] = profile.country.code2
+                basket.subscribe(profile.email, newsletters, **kwargs)
+            else:
+                try:
+                    result = basket.lookup_user(email=profile.email)
+                except basket.BasketException as exc:
+                    if not exc[0] == u'User not found':
+                        raise
+                else:
+                    if set(newsletters).intersection(result.get('newsletters', [])):
+                        basket.unsubscribe(token=result.get('token'), email=profile.email,
+                                           newsletters=newsletters, optout=False)
+        except basket.BasketException:
+            failed += 1
+            continue
+        synced[profile.is_vouched].append(profile.pk)
+
+    for is_vouched, profile_ids in synced.items():
+        if profile_ids:
+            UserProfile.objects.filter(pk__in=profile_ids).update(basket_vouched=is_vouched)
+
+    return {
+        'subscribed': len(synced[True]),
+        'unsubscribed': len(synced[False]),
+        'failed': failed,
+    }
+
+
+@app.task(ignore_result=True)
+def reconcile_vouch_counts(profile_ids=None):
+    """Fix the stored vouch counts and vouch flags of profiles that drifted.
+
+    The counters are kept in sync by the vouch signals, this catches up
+    with vouches changed without them, e.g. in bulk, and with counts a
+    full save() of a stale profile wrote back. Profiles whose flags
+    change are sent to CIS and reindexed, Basket is left to
+    reconcile_basket_subscriptions.
+    """
+    from mozillians.users.models import UserProfile, notify_profiles_changed
+
+    profiles = UserProfile.objects.all()
+    if profile_ids is not None:
+        profiles = profiles.filter(pk__in=profile_ids)
+    profiles = (profiles.annotate(live_vouch_count=Count('vouches_received')).order_by()
+                .values_list('pk', 'vouch_count', 'is_vouched', 'can_vouch', 'live_vouch_count'))
+
+    changed = []
+    for pk, vouch_count, is_vouched, can_vouch, live_vouch_count in profiles:
+        flags = (live_vouch_count > 0, live_vouch_count >= settings.CAN_VOUCH_THRESHOLD)
+        if (vouch_count, is_vouched, can_vouch) == (live_vouch_count,) + flags:
+            continue
+        UserProfile.objects.filter(pk=pk).update(
+            vouch_count=live_vouch_count, is_vouched=flags[0], can_vouch=flags[1])
+        if (is_vouched, can_vouch) != flags:
+            changed.append(pk)
+
+    if changed:
+        notify_profiles_changed(changed)
 
 
 @app.task
@@ -279,6 +400,49 @@ def check_spam_account(instance_id, **kwargs):
         AbuseReport.objects.get_or_create(**kwargs)
 
 
+@app.task
+def generate_photo_thumbnails(instance_id):
+    """Generate the standard thumbnails of a profile photo.
+
+    Photos uploaded before they were normalized at upload time are
+    converted to RGB first. The thumbnail URLs are stored on the
+    profile, unless the photo changed in the meantime.
+    """
+    from django.core.files.storage import default_storage
+
+    from PIL import Image
+    from sorl.thumbnail import get_thumbnail
+
+    from mozillians.common.templatetags.helpers import absolutify
+    from mozillians.users.models import PHOTO_GEOMETRIES, UserProfile, normalize_photo
+
+    profile = get_object_or_none(UserProfile, id=instance_id)
+    if not profile or not profile.photo:
+        return
+    photo_name = profile.photo.name
+
+    try:
+        image = Image.open(profile.photo)
+    except IOError:
+        return
+    if image.mode != 'RGB':
+        image = normalize_photo(image)
+        fh = default_storage.open(photo_name, 'w')
+        image.save(fh, 'JPEG', quality=95)
+        fh.close()
+
+    urls = {}
+    for geometry in PHOTO_GEOMETRIES:
+        url = get_thumbnail(profile.photo, geometry, crop='center').url
+        if not (url.startswith('https://') or url.startswith('http://')):
+            url = absolutify(url)
+        urls[geometry] = url
+
+    photo_thumbnails = json.dumps({'photo': photo_name, 'urls': urls})
+    (UserProfile.objects.filter(id=instance_id, photo=photo_name)
+                        .update(photo_thumbnails=photo_thumbnails))
+
+
 @app.task
 def delete_reported_spam_accounts():
     """Task to automatically delete spam accounts"""
@@ -373,33 +537,44 @@ def index_all_profiles():
     call_command('clear_index', **options)
 
 
-@app.task
-def send_userprofile_to_cis(instance_id=None, profile_results=[], **kwargs):
-    import boto3
-
-    from cis.publisher import ChangeDelegate
+# Boto session with the credentials of the CIS role, reused by the tasks
+# of a worker process until the credentials are about to expire.
+_cis_session = {}
 
-    if is_test_environment() or settings.DINO_PARK_ACTIVE:
-        return []
 
-    if not instance_id and not profile_results:
-        return []
+def get_cis_session():
+    """Return a boto session authenticated with the CIS role."""
+    import boto3
 
-    if instance_id:
-        profile_results = bundle_profile_data(instance_id)
+    expiration = _cis_session.get('expiration')
+    if expiration and now() < expiration - CIS_CREDENTIALS_REFRESH_MARGIN:
+        return _cis_session['session']
 
     sts = boto3.client('sts')
     sts_response = sts.assume_role(
         RoleArn=settings.CIS_IAM_ROLE_ARN,
         RoleSessionName=settings.CIS_IAM_ROLE_SESSION_NAME
     )
+    credentials = sts_response['Credentials']
 
     session = boto3.session.Session(
-        aws_access_key_id=sts_response['Credentials']['AccessKeyId'],
-        aws_secret_access_key=sts_response['Credentials']['SecretAccessKey'],
-        aws_session_token=sts_response['Credentials']['SessionToken'],
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
         region_name=settings.CIS_AWS_REGION
     )
+    _cis_session.update(session=session, expiration=credentials['Expiration'])
+    return session
+
+
+def publish_batch(profile_results, session=None):
+    """Send many CIS payloads over a single boto session."""
+    from cis.publisher import ChangeDelegate
+
+    if not profile_results:
+        return []
+    if session is None:
+        session = get_cis_session()
 
     publisher = {
         'id': settings.CIS_PUBLISHER_NAME
@@ -429,12 +604,153 @@ def send_userprofile_to_cis(instance_id=None, profile_results=[], **kwargs):
     return results
 
 
+def cis_send_succeeded(result):
+    """Return whether a CIS send result reports a successful publish."""
+    if not result:
+        return False
+    if isinstance(result, dict):
+        if result.get('FunctionError') or result.get('error'):
+            return False
+        status_code = result.get('StatusCode')
+        if status_code is not None and not 200 <= int(status_code) < 300:
+            return False
+    return True
+
+
+def publish_profiles(profile_ids, force=False):
+    """Publish the Identity Profiles of profiles to CIS.
+
+    Payloads identical to the last one published for an identity are
+    skipped, unless force is set. Only payloads CIS accepted have their
+    hash stored, so failed sends are retried on the next publish. Returns
+    the counts of sent, failed and skipped payloads along with the
+    publish results.
+    """
+    from mozillians.users.models import IdpProfile
+
+    profile_results = []
+    hashes = []
+    identities = bundle_identities(profile_ids)
+    for idp, data in identities:
+        payload_hash = cis_payload_hash(data)
+        if force or payload_hash != idp.cis_payload_hash:
+            profile_results.append(data)
+            hashes.append((idp.pk, payload_hash))
+
+    results = publish_batch(profile_results)
+    failed = 0
+    for (idp_id, payload_hash), result in zip(hashes, results):
+        if not cis_send_succeeded(result):
+            failed += 1
+            continue
+        IdpProfile.objects.filter(pk=idp_id).update(cis_payload_hash=payload_hash)
+
+    stats = {
+        'sent': len(profile_results),
+        'failed': failed,
+        'skipped': len(identities) - len(profile_results),
+        'results': results,
+    }
+    logger.info('CIS publish: %(sent)d payloads sent, %(failed)d failed, '
+                '%(skipped)d unchanged skipped', stats)
+    return stats
+
+
+@app.task
+def send_userprofile_to_cis(instance_id=None, profile_results=[], instance_ids=None,
+                            force=False, **kwargs):
+    if is_test_environment() or settings.DINO_PARK_ACTIVE:
+        return []
+
+    if not instance_id and not profile_results and not instance_ids:
+        return []
+
+    if instance_id:
+        instance_ids = [instance_id]
+    if instance_ids:
+        return publish_profiles(instance_ids, force=force)['results']
+
+    return publish_batch(profile_results)
+
+
+def queue_userprofile_for_cis(instance_id):
+    """Queue a profile to be published to CIS by publish_cis_outbox.
+
+    Profiles queued several times before the next run are published once.
+    """
+    from mozillians.users.models import CISOutbox
+
+    def _bump():
+        return (CISOutbox.objects.filter(profile_id=instance_id)
+                .update(requests=F('requests') + 1, updated=now()))
+
+    if not _bump():
+        try:
+            with transaction.atomic():
+                CISOutbox.objects.create(profile_id=instance_id)
+        except IntegrityError:
+            # Queued concurrently.
+            _bump()
+
+
+def queue_userprofiles_for_cis(instance_ids):
+    """Queue many profiles at once, see queue_userprofile_for_cis."""
+    from mozillians.users.models import CISOutbox
+
+    instance_ids = set(instance_ids)
+    if not instance_ids:
+        return
+    queued = CISOutbox.objects.filter(profile_id__in=instance_ids)
+    queued.update(requests=F('requests') + 1, updated=now())
+    missing = instance_ids.difference(queued.values_list('profile_id', flat=True))
+    try:
+        with transaction.atomic():
+            CISOutbox.objects.bulk_create([CISOutbox(profile_id=pk) for pk in missing])
+    except IntegrityError:
+        # Some were queued concurrently.
+        for instance_id in missing:
+            queue_userprofile_for_cis(instance_id)
+
+
+@app.task
+def publish_cis_outbox():
+    """Publish every profile queued in the CIS outbox once."""
+    from mozillians.users.models import CISOutbox
+
+    cutoff = now()
+    entries = list(CISOutbox.objects.filter(updated__lte=cutoff)
+                   .order_by('profile_id').values_list('profile_id', 'requests'))
+    if not entries:
+        return {'profiles': 0, 'requests': 0, 'collapsed': 0}
+
+    profile_ids = [profile_id for profile_id, _ in entries]
+    for i in range(0, len(profile_ids), CIS_PUBLISH_BATCH_SIZE):
+        batch = profile_ids[i:i + CIS_PUBLISH_BATCH_SIZE]
+        send_userprofile_to_cis.apply_async(kwargs={'instance_ids': batch}, queue='cis')
+    # Only delete the entries read above, entries committed since then
+    # and profiles queued again since the cutoff stay for the next run.
+    CISOutbox.objects.filter(profile_id__in=profile_ids, updated__lte=cutoff).delete()
+
+    requests = sum(count for _, count in entries)
+    stats = {
+        'profiles': len(profile_ids),
+        'requests': requests,
+        'collapsed': requests - len(profile_ids),
+    }
+    logger.info('CIS outbox: published %(profiles)d profiles for %(requests)d requests, '
+                '%(collapsed)d collapsed', stats)
+    return stats
+
+
 @app.task
-def periodically_send_cis_data():
-    """Periodically send all mozillians.org IdpProfiles to CIS."""
+def periodically_send_cis_data(force=False):
+    """Periodically send all changed mozillians.org IdpProfiles to CIS."""
 
     from mozillians.users.models import UserProfile
 
-    users = UserProfile.objects.all().values_list('id')
+    users = list(UserProfile.objects.order_by('id').values_list('id', flat=True))
     # Send in parallel the profiles in batches of 100 profiles
-    send_userprofile_to_cis.chunks(iter(users), 100).apply_async(queue='cis')
+    for i in range(0, len(users), CIS_PUBLISH_BATCH_SIZE):
+        batch = users[i:i + CIS_PUBLISH_BATCH_SIZE]
+        send_userprofile_to_cis.apply_async(kwargs={'instance_ids': batch, 'force': force},
+                                            queue='cis')
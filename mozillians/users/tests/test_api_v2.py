@@ -96,16 +96,15 @@ class UserProfileDetailedSerializerTests(TestCase):
                'privacy': 'Mozillians'}
         eq_(serializer.data['bio'], bio)
 
-    def test_transform_photo(self):
-        def _get_url(dimensions):
-            return dimensions
+    @patch('mozillians.users.api.v2.photo_urls_for')
+    def test_transform_photo(self, photo_urls_for_mock):
+        def _get_urls(profiles, geometries):
+            return dict((profile.pk, dict((g, g) for g in geometries)) for profile in profiles)
 
         user = UserFactory.create(userprofile={'timezone': 'Europe/Athens'})
         user.userprofile._groups = Group.objects.none()
         context = {'request': self.factory.get('/')}
-        get_photo_url_mock = Mock()
-        get_photo_url_mock.side_effect = _get_url
-        user.userprofile.get_photo_url = get_photo_url_mock
+        photo_urls_for_mock.side_effect = _get_urls
         serializer = UserProfileDetailedSerializer(user.userprofile, context=context)
         photo = {'value': '300x300',
                  '150x150': '150x150',
@@ -113,6 +112,7 @@ class UserProfileDetailedSerializerTests(TestCase):
                  '500x500': '500x500',
                  'privacy': 'Mozillians'}
         eq_(serializer.data['photo'], photo)
+        eq_(photo_urls_for_mock.call_count, 1)
 
     def test_get_country(self):
         context = {'request': self.factory.get('/')}
@@ -265,6 +265,30 @@ class UserProfileViewSetTests(TestCase):
         ok_(userprofile_mock.objects.complete.called)
         userprofile_mock.objects.complete().privacy_level.assert_called_with(MOZILLIANS)
 
+    def test_get_queryset_page_queries(self):
+        for i in range(3):
+            profile = UserFactory.create().userprofile
+            profile.externalaccount_set.create(type=ExternalAccount.TYPE_AMO,
+                                               identifier='amo{0}'.format(i))
+            Language.objects.create(userprofile=profile, code='en')
+            IdpProfile.objects.create(profile=profile, auth0_user_id='github|{0}'.format(i),
+                                      email='foo{0}@example.com'.format(i))
+        viewset = UserProfileViewSet()
+        viewset.request = Mock()
+        viewset.request.privacy_level = MOZILLIANS
+
+        # The profiles with their users and one query per prefetched relation.
+        with self.assertNumQueries(4):
+            profiles = list(viewset.get_queryset())
+            for profile in profiles:
+                ok_(profile.user.username)
+                eq_(len(profile.accounts), 1)
+                eq_(len(profile.languages), 1)
+                eq_(len(profile.identity_profiles), 1)
+                eq_(len(profile.websites), 0)
+                eq_(len(profile._api_alternate_emails), 1)
+        eq_(len(profiles), 3)
+
     def test_retrieve_base(self):
         viewset = UserProfileViewSet()
         viewset.request = Mock()
@@ -1,9 +1,11 @@
 from django.test.utils import override_settings
 
-from nose.tools import eq_
+from mock import patch
+from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users import AVAILABLE_LANGUAGES, get_languages_for_locale
+from mozillians.users import (AVAILABLE_LANGUAGES, LazyLanguageChoices, get_language_names,
+                              get_languages_for_locale)
 from mozillians.common.authbackend import calculate_username
 from mozillians.users.tests import UserFactory
 
@@ -40,3 +42,16 @@ class GetTranslatedLanguagesTests(TestCase):
     def test_valid_locale(self):
         get_languages_for_locale('en')
         self.assertIn('en', AVAILABLE_LANGUAGES.keys())
+
+    def test_language_names(self):
+        eq_(get_language_names('fr'), dict(get_languages_for_locale('fr')))
+        eq_(get_language_names('de-DE'), get_language_names('de_DE'))
+        eq_(get_language_names('foobar'), get_language_names('en'))
+
+    @patch('mozillians.users.get_languages_for_locale')
+    def test_lazy_language_choices(self, get_languages_mock):
+        get_languages_mock.return_value = [('en', 'English')]
+        choices = LazyLanguageChoices('en')
+        ok_(not get_languages_mock.called)
+        eq_(list(choices), [('en', 'English')])
+        get_languages_mock.assert_called_once_with('en')
@@ -1,9 +1,9 @@
 from mock import patch
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.managers import PUBLIC
-from mozillians.users.models import UserProfile
+from mozillians.users.managers import MOZILLIANS, PUBLIC
+from mozillians.users.models import ExternalAccount, IdpProfile, UserProfile
 from mozillians.users.tests import UserFactory
 
 
@@ -76,3 +76,46 @@ class UserProfileQuerySetTests(TestCase):
         queryset = UserProfile.objects.all()
         queryset.privacy_level(99)
         eq_(queryset.all()[0]._privacy_level, 99)
+
+    def test_with_privacy_relations(self):
+        profile = UserFactory.create().userprofile
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_SUMO,
+                                           identifier='sumo', privacy=PUBLIC)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_AMO,
+                                           identifier='amo', privacy=MOZILLIANS)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_WEBSITE,
+                                           identifier='http://example.com', privacy=PUBLIC)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_EMAIL,
+                                           identifier='foo@example.com', privacy=MOZILLIANS)
+        IdpProfile.objects.create(profile=profile, auth0_user_id='github|foo',
+                                  email='foo@example.com', privacy=PUBLIC)
+
+        queryset = UserProfile.objects.privacy_level(PUBLIC).with_privacy_relations()
+        with self.assertNumQueries(4):
+            prefetched = queryset.get(pk=profile.pk)
+        with self.assertNumQueries(0):
+            eq_([a.identifier for a in prefetched.accounts], ['sumo'])
+            eq_([w.identifier for w in prefetched.websites], ['http://example.com'])
+            eq_(len(prefetched.alternate_emails), 0)
+            eq_(len(prefetched.identity_profiles), 1)
+
+        prefetched.set_instance_privacy_level(MOZILLIANS)
+        with self.assertNumQueries(0):
+            eq_(set([a.identifier for a in prefetched.accounts]), set(['amo', 'sumo']))
+            eq_(len(prefetched.alternate_emails), 1)
+
+    def test_with_privacy_relations_queryset_methods(self):
+        profile = UserFactory.create().userprofile
+        profile.language_set.create(code='en')
+        IdpProfile.objects.create(profile=profile, auth0_user_id='github|foo',
+                                  email='foo@example.com', privacy=PUBLIC,
+                                  primary_contact_identity=True)
+
+        prefetched = UserProfile.objects.with_privacy_relations().get(pk=profile.pk)
+        with self.assertNumQueries(0):
+            ok_(prefetched.languages.exists())
+            eq_(prefetched.languages.all().count(), 1)
+            ok_(not prefetched.websites.exists())
+            eq_(prefetched.identity_profiles.filter(primary_contact_identity=True).first().email,
+                'foo@example.com')
+            eq_(prefetched.identity_profiles.filter(primary_contact_identity=False).count(), 0)
@@ -1,26 +1,28 @@
 # -*- coding: utf-8 -*-
+import json
 import unittest
 from datetime import datetime
 from uuid import uuid4
 
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group as AuthGroup, User
 from django.db.models.query import QuerySet
 from django.test import override_settings
 from django.utils.timezone import make_aware, now
 
 import pytz
-from mock import Mock, patch
+from mock import ANY, Mock, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.groups.models import Group, Skill
-from mozillians.groups.tests import (GroupAliasFactory, GroupFactory,
+from mozillians.groups.models import Group, GroupMembership, Skill
+from mozillians.groups.tests import (GroupAliasFactory, GroupFactory, InviteFactory,
                                      SkillAliasFactory, SkillFactory)
 from mozillians.users.managers import (EMPLOYEES, MOZILLIANS, PUBLIC, PUBLIC_INDEXABLE_FIELDS)
 from mozillians.users.models import (ExternalAccount, IdpProfile, UserProfile,
-                                     _calculate_photo_filename, Vouch)
-from mozillians.users.tests import UserFactory
+                                     _calculate_photo_filename, merge_alternate_emails,
+                                     photo_urls_for, Vouch)
+from mozillians.users.tests import LanguageFactory, UserFactory
 
 
 class SignaledFunctionsTests(TestCase):
@@ -32,7 +34,7 @@ class SignaledFunctionsTests(TestCase):
     @override_settings(BASKET_VOUCHED_NEWSLETTER='foo')
     def test_subscribe_to_basket_post_save(self, subscribe_user_mock):
         user = UserFactory.create()
-        subscribe_user_mock.assert_called_with(user.userprofile.id, ['foo'])
+        subscribe_user_mock.assert_called_with(user.userprofile.id, ['foo'], sync_vouched=True)
 
     def test_delete_user_obj_on_profile_delete(self):
         user = UserFactory.create()
@@ -78,6 +80,22 @@ class SignaledFunctionsTests(TestCase):
         eq_(vouched.userprofile.is_vouched, False)
         ok_(unsubscribe_from_basket_mock.called_with(vouched.userprofile.email, ['foo']))
 
+    @patch('mozillians.users.signals.unsubscribe_from_basket_task.delay')
+    @patch('mozillians.users.signals.subscribe_user_to_basket.delay')
+    def test_basket_synced_only_on_vouched_change(self, subscribe_mock, unsubscribe_mock):
+        profile = UserFactory.create(vouched=False).userprofile
+        eq_(profile.basket_vouched, None)
+        ok_(not unsubscribe_mock.called)
+
+        profile.save()
+        ok_(not subscribe_mock.called)
+        ok_(not unsubscribe_mock.called)
+
+        profile.vouch(None)
+        subscribe_mock.assert_called_once_with(profile.pk, ANY, sync_vouched=True)
+        # The state is recorded by the tasks, once Basket accepted it.
+        eq_(UserProfile.objects.get(pk=profile.pk).basket_vouched, None)
+
     @override_settings(CAN_VOUCH_THRESHOLD=5)
     def test_vouch_can_vouch_gets_updated(self):
         unvouched = UserFactory.create(vouched=False)
@@ -96,6 +114,61 @@ class SignaledFunctionsTests(TestCase):
         unvouched = User.objects.get(pk=unvouched.id)
         eq_(unvouched.userprofile.can_vouch, True)
 
+    @override_settings(CAN_VOUCH_THRESHOLD=5)
+    @patch('mozillians.users.signals.queue_userprofile_for_cis')
+    @patch('mozillians.users.signals.subscribe_user_to_basket.delay')
+    def test_vouch_side_effects_only_when_flags_change(self, subscribe_mock, queue_mock):
+        profile = UserFactory.create(vouched=False).userprofile
+        profile.vouch(None, 'Reason #0')
+        ok_(profile.is_vouched)
+        eq_(profile.vouch_count, 1)
+        ok_(subscribe_mock.called)
+        ok_(queue_mock.called)
+
+        subscribe_mock.reset_mock()
+        queue_mock.reset_mock()
+        profile.vouch(None, 'Reason #1')
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.vouch_count, 2)
+        ok_(profile.is_vouched)
+        ok_(not subscribe_mock.called)
+        ok_(not queue_mock.called)
+
+    def test_unvouch_updates_vouch_count(self):
+        profile = UserFactory.create().userprofile
+        eq_(profile.vouch_count, 1)
+        profile.vouches_received.all().delete()
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.vouch_count, 0)
+        ok_(not profile.is_vouched)
+
+    def test_stale_profile_save_keeps_vouch_flags(self):
+        profile = UserFactory.create(vouched=False).userprofile
+        stale = UserProfile.objects.get(pk=profile.pk)
+        profile.vouch(None, 'Reason')
+        stale.full_name = 'Stale Name'
+        stale.save(only_dirty=True)
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.full_name, 'Stale Name')
+        eq_(profile.vouch_count, 1)
+        ok_(profile.is_vouched)
+
+    def test_save_writes_vouch_flags(self):
+        profile = UserFactory.create(vouched=False).userprofile
+        profile.is_vouched = True
+        profile.can_vouch = True
+        profile.save()
+        profile = UserProfile.objects.get(pk=profile.pk)
+        ok_(profile.is_vouched)
+        ok_(profile.can_vouch)
+        eq_(profile.vouch_count, 0)
+
+    def test_vouch_leaves_cached_vouchee_clean(self):
+        profile = UserFactory.create(vouched=False).userprofile
+        profile.vouch(None, 'Reason')
+        ok_(profile.is_vouched)
+        eq_(profile.get_dirty_fields(), set())
+
     def test_vouch_multiple_mozilla_alternate_emails(self):
         user = UserFactory.create(vouched=False)
         IdpProfile.objects.create(
@@ -218,7 +291,7 @@ class UserProfileTests(TestCase):
         group_1.add_member(user_1.userprofile)
         group_1.add_member(user_2.userprofile)
         user_groups = user_1.userprofile.get_annotated_tags()
-        eq_([group_1], user_groups)
+        eq_([group_1.id], [group.id for group in user_groups])
 
     def test_get_annotated_tags_only_visible(self):
         """ Test that get_annotated_tags() only returns visible groups
@@ -231,7 +304,7 @@ class UserProfileTests(TestCase):
         group_2.add_member(profile)
 
         user_groups = profile.get_annotated_tags()
-        eq_([group_1], user_groups)
+        eq_([group_1.id], [group.id for group in user_groups])
 
     def test_get_annotated_access_groups_only_visible(self):
         """ Test that get_annotated_access_groups() only returns visible groups
@@ -244,7 +317,28 @@ class UserProfileTests(TestCase):
         group_2.add_member(profile)
 
         user_groups = profile.get_annotated_access_groups()
-        eq_([group_1], user_groups)
+        eq_([group_1.id], [group.id for group in user_groups])
+
+    def test_get_annotated_groups(self):
+        profile = UserFactory.create().userprofile
+        inviter = UserFactory.create().userprofile
+        tag = GroupFactory.create()
+        tag.add_member(profile, GroupMembership.PENDING)
+        for i in range(3):
+            group = GroupFactory.create(is_access_group=True)
+            group.add_member(profile)
+            group.curators.add(profile)
+            InviteFactory.create(group=group, redeemer=profile, inviter=inviter)
+
+        with self.assertNumQueries(2):
+            access_groups, tags = profile.get_annotated_groups()
+            eq_(len(access_groups), 3)
+            for group in access_groups:
+                eq_(group.inviter, inviter)
+                ok_(group.is_curator)
+                ok_(not group.pending)
+            eq_([(tag.id, True)], [(group.id, group.pending) for group in tags])
+            ok_(not tags[0].is_curator)
 
     @patch('mozillians.users.models.send_mail')
     def test_email_now_vouched(self, send_mail_mock):
@@ -307,6 +401,26 @@ class UserProfileTests(TestCase):
         user.userprofile.set_instance_privacy_level(9)
         eq_(user.userprofile._privacy_level, 9)
 
+    def test_privacy_mask_follows_privacy_settings(self):
+        user = UserFactory.create(userprofile={'full_name': 'foobar',
+                                               'privacy_full_name': MOZILLIANS})
+        profile = user.userprofile
+        profile.set_instance_privacy_level(PUBLIC)
+        eq_(profile.full_name, '')
+        profile.privacy_full_name = PUBLIC
+        eq_(profile.full_name, 'foobar')
+        profile.set_instance_privacy_level(None)
+        profile.privacy_full_name = MOZILLIANS
+        eq_(profile.full_name, 'foobar')
+
+    def test_privacy_mask_uncontrolled_fields(self):
+        user = UserFactory.create()
+        profile = user.userprofile
+        profile.set_instance_privacy_level(PUBLIC)
+        eq_(profile.pk, user.userprofile.pk)
+        eq_(profile.user, user)
+        ok_('pk' not in profile._privacy_mask)
+
     def test_email_no_privacy(self):
         user = UserFactory.create()
         eq_(user.userprofile.email, user.email)
@@ -362,6 +476,25 @@ class UserProfileTests(TestCase):
         user = UserFactory.create()
         ok_(not user.userprofile.is_public)
 
+    def test_public_flags_on_save(self):
+        user = UserFactory.create(userprofile={'ircname': 'bar'})
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        ok_(not profile.public)
+        ok_(not profile.public_indexable)
+
+        profile.privacy_ircname = PUBLIC
+        profile.save()
+        profile = UserProfile.objects.get(pk=profile.pk)
+        ok_(profile.public)
+        ok_(profile.public_indexable)
+
+        profile.privacy_ircname = MOZILLIANS
+        profile.privacy_bio = PUBLIC
+        profile.save()
+        profile = UserProfile.objects.get(pk=profile.pk)
+        ok_(profile.public)
+        ok_(not profile.public_indexable)
+
     def test_is_public_indexable(self):
         for field in PUBLIC_INDEXABLE_FIELDS:
             user = UserFactory.create(
@@ -393,6 +526,32 @@ class UserProfileTests(TestCase):
         ok_(user.userprofile.groups.filter(name='bar').exists())
         eq_(user.userprofile.groups.count(), 1)
 
+    @patch('mozillians.users.models.queue_userprofiles_for_cis')
+    def test_set_membership_group_single_cis_publish(self, send_to_cis_mock):
+        group_1 = GroupFactory.create(name='foo')
+        group_2 = GroupFactory.create(name='lo')
+        GroupAliasFactory.create(alias=group_2, name='bar')
+        user = UserFactory.create()
+        group_3 = GroupFactory.create(name='baz')
+        group_3.add_member(user.userprofile)
+        send_to_cis_mock.reset_mock()
+
+        user.userprofile.set_membership(Group, ['foo', 'bar', 'new'])
+        eq_(set(user.userprofile.groups.values_list('name', flat=True)),
+            set([group_1.name, group_2.name, 'new']))
+        send_to_cis_mock.assert_called_once_with([user.userprofile.pk])
+        eq_(Group.objects.get(pk=group_3.pk).member_count, 0)
+
+    @patch('mozillians.users.models.queue_userprofiles_for_cis')
+    def test_set_membership_group_unchanged(self, send_to_cis_mock):
+        group = GroupFactory.create(name='foo')
+        user = UserFactory.create()
+        group.add_member(user.userprofile)
+        send_to_cis_mock.reset_mock()
+
+        user.userprofile.set_membership(Group, ['foo'])
+        ok_(not send_to_cis_mock.called)
+
     def test_set_membership_skill_matches_alias(self):
         group_1 = SkillFactory.create(name='foo')
         group_2 = SkillFactory.create(name='lo')
@@ -432,6 +591,51 @@ class UserProfileTests(TestCase):
         user.userprofile.get_photo_url('80x80', firefox='rocks')
         get_photo_thumbnail_mock.assert_called_with('80x80', firefox='rocks')
 
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_get_photo_url_pregenerated(self, get_photo_thumbnail_mock):
+        user = UserFactory.create(userprofile={'photo': 'foo'})
+        profile = user.userprofile
+        profile.photo_thumbnails = json.dumps({'photo': 'foo',
+                                               'urls': {'150x150': 'https://example.com/150'}})
+        eq_(profile.get_photo_url('150x150'), 'https://example.com/150')
+        ok_(not get_photo_thumbnail_mock.called)
+
+        profile.photo = 'bar'
+        eq_(profile.photo_thumbnail_urls, {})
+        profile.get_photo_url('150x150', upscale=False)
+        get_photo_thumbnail_mock.assert_called_with('150x150', upscale=False)
+
+    @patch('mozillians.users.models.cache')
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_photo_urls_for(self, get_photo_thumbnail_mock, cache_mock):
+        get_photo_thumbnail_mock.return_value.url = 'https://example.com/bar-70'
+        cache_mock.get_many.return_value = {}
+        gravatar_profile = UserFactory.create().userprofile
+        pregenerated = UserFactory.create(userprofile={'photo': 'foo'}).userprofile
+        pregenerated.photo_thumbnails = json.dumps(
+            {'photo': 'foo', 'urls': {'150x150': 'https://example.com/150'}})
+        uncached = UserFactory.create(userprofile={'photo': 'bar'}).userprofile
+
+        with patch('mozillians.users.models.gravatars') as gravatars_mock:
+            gravatars_mock.side_effect = lambda emails, size: dict.fromkeys(emails, 'gravatar')
+            urls = photo_urls_for([gravatar_profile, pregenerated, uncached], ['150x150', '70x70'])
+        gravatars_mock.assert_called_with([gravatar_profile.email], size='70x70')
+        eq_(urls[gravatar_profile.pk], {'150x150': 'gravatar', '70x70': 'gravatar'})
+        eq_(urls[pregenerated.pk]['150x150'], 'https://example.com/150')
+        eq_(urls[uncached.pk]['70x70'], 'https://example.com/bar-70')
+        eq_(cache_mock.get_many.call_count, 1)
+        eq_(len(cache_mock.get_many.call_args[0][0]), 3)
+        eq_(cache_mock.set_many.call_count, 1)
+
+    @patch('mozillians.users.models.cache')
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_photo_urls_for_cached(self, get_photo_thumbnail_mock, cache_mock):
+        profile = UserFactory.create(userprofile={'photo': 'foo'}).userprofile
+        cache_mock.get_many.side_effect = lambda keys: dict((key, 'cached') for key in keys)
+        eq_(photo_urls_for([profile], ['70x70']), {profile.pk: {'70x70': 'cached'}})
+        ok_(not get_photo_thumbnail_mock.called)
+        ok_(not cache_mock.set_many.called)
+
     @patch('mozillians.users.models.gravatar')
     def test_get_photo_url_without_photo(self, gravatar_mock):
         user = UserFactory.create()
@@ -496,6 +700,105 @@ class UserProfileTests(TestCase):
         GroupFactory.create(name='foobar')
         ok_(not user.userprofile.is_nda)
 
+    def test_clearance_loaded_once(self):
+        user = UserFactory.create()
+        profile = user.userprofile
+        profile.clearance
+        with self.assertNumQueries(0):
+            eq_(profile.privacy_level, MOZILLIANS)
+            ok_(not profile.is_manager)
+            ok_(not profile.is_nda)
+
+    @override_settings(NDA_GROUP='foobar')
+    def test_clearance_cleared_on_membership_change(self):
+        user = UserFactory.create()
+        profile = user.userprofile
+        group = GroupFactory.create(name='foobar')
+        ok_(not profile.is_nda)
+        group.add_member(profile)
+        ok_(profile.is_nda)
+        ok_(UserProfile.objects.get(pk=profile.pk).is_nda)
+
+    def test_clearance_cleared_on_managers_change(self):
+        user = UserFactory.create()
+        ok_(not user.userprofile.is_manager)
+        manager_group, _ = AuthGroup.objects.get_or_create(name='Managers')
+        user.groups.add(manager_group)
+        ok_(user.userprofile.is_manager)
+        ok_(UserProfile.objects.get(pk=user.userprofile.pk).is_manager)
+
+    @override_settings(NDA_GROUP='foobar')
+    def test_clearance_cleared_on_group_rename(self):
+        profile = UserFactory.create().userprofile
+        group = GroupFactory.create(name='foo')
+        group.add_member(profile)
+        ok_(not UserProfile.objects.get(pk=profile.pk).is_nda)
+        group.name = 'foobar'
+        group.save()
+        ok_(UserProfile.objects.get(pk=profile.pk).is_nda)
+
+    def test_clearance_cleared_on_managers_delete(self):
+        user = UserFactory.create()
+        manager_group, _ = AuthGroup.objects.get_or_create(name='Managers')
+        user.groups.add(manager_group)
+        ok_(UserProfile.objects.get(pk=user.userprofile.pk).is_manager)
+        manager_group.delete()
+        ok_(not UserProfile.objects.get(pk=user.userprofile.pk).is_manager)
+
+    @patch('mozillians.users.models.queue_userprofile_for_cis')
+    def test_save_only_dirty(self, queue_mock):
+        user = UserFactory.create(userprofile={'full_name': 'foo', 'bio': 'bar'})
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        eq_(profile.get_dirty_fields(), set())
+        queue_mock.reset_mock()
+
+        profile.save(only_dirty=True)
+        ok_(not queue_mock.called)
+
+        UserProfile.objects.filter(pk=profile.pk).update(bio='updated')
+        profile.full_name = 'baz'
+        eq_(profile.get_dirty_fields(), set(['full_name']))
+        profile.save(only_dirty=True)
+        queue_mock.assert_called_once_with(profile.pk)
+        eq_(profile.get_dirty_fields(), set())
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.full_name, 'baz')
+        eq_(profile.bio, 'updated')
+
+    def test_save_writes_every_field(self):
+        user = UserFactory.create(userprofile={'full_name': 'foo', 'bio': 'bar'})
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        UserProfile.objects.filter(pk=profile.pk).update(bio='updated')
+        profile.save()
+        eq_(UserProfile.objects.get(pk=profile.pk).bio, 'bar')
+
+    @patch('mozillians.users.models.queue_userprofiles_for_cis')
+    def test_skills_edit_notifies_cis(self, queue_mock):
+        profile = UserFactory.create(userprofile={'full_name': 'foo'}).userprofile
+        skill = SkillFactory.create()
+        queue_mock.reset_mock()
+        with patch('mozillians.common.signals.SearchSignalProcessor.handle_save') as index_mock:
+            profile.skills.add(skill)
+        queue_mock.assert_called_once_with([profile.pk])
+        index_mock.assert_called_once_with(UserProfile, profile)
+
+        queue_mock.reset_mock()
+        skill.members.clear()
+        queue_mock.assert_called_once_with([profile.pk])
+
+    @patch('mozillians.users.models.queue_userprofiles_for_cis')
+    def test_languages_edit_notifies_cis(self, queue_mock):
+        profile = UserFactory.create(userprofile={'full_name': 'foo'}).userprofile
+        queue_mock.reset_mock()
+        with patch('mozillians.common.signals.SearchSignalProcessor.handle_save') as index_mock:
+            language = LanguageFactory.create(userprofile=profile, code='fr')
+        queue_mock.assert_called_once_with([profile.pk])
+        index_mock.assert_called_once_with(UserProfile, profile)
+
+        queue_mock.reset_mock()
+        language.delete()
+        queue_mock.assert_called_once_with([profile.pk])
+
 
 class VouchTests(TestCase):
     """Tests related to the vouching functionality."""
@@ -568,6 +871,24 @@ class VouchTests(TestCase):
         user_profile.set_instance_privacy_level(MOZILLIANS)
         eq_(set(user_profile.vouches_made.all()), set(Vouch.objects.filter(voucher=user_profile)))
 
+    @override_settings(CAN_VOUCH_THRESHOLD=1)
+    def test_vouches_made_single_query(self):
+        voucher = UserFactory.create()
+        for privacy in [PUBLIC, MOZILLIANS, PUBLIC]:
+            vouchee = UserFactory.create(userprofile={'privacy_full_name': privacy})
+            vouchee.userprofile.vouch(voucher.userprofile)
+        user_profile = voucher.userprofile
+        user_profile.set_instance_privacy_level(PUBLIC)
+        with self.assertNumQueries(1):
+            eq_(len(user_profile.vouches_made.all()), 2)
+
+    def test_is_visible_at(self):
+        profile = UserFactory.create(userprofile={'privacy_bio': PUBLIC}).userprofile
+        ok_(profile.is_visible_at(PUBLIC))
+        profile.privacy_bio = MOZILLIANS
+        ok_(not profile.is_visible_at(PUBLIC))
+        ok_(profile.is_visible_at(MOZILLIANS))
+
     def test_vouch_reset(self):
         voucher = UserFactory.create()
         user = UserFactory.create()
@@ -606,6 +927,27 @@ class CalculatePhotoFilenameTests(TestCase):
         ok_(uuid4_mock.called)
 
 
+class MergeAlternateEmailsTests(unittest.TestCase):
+    def test_no_conflicts(self):
+        legacy = Mock(identifier='foo@example.com', privacy=MOZILLIANS)
+        idp = Mock(email='bar@example.com', privacy=PUBLIC)
+        eq_(merge_alternate_emails([legacy], [idp]), [legacy, idp])
+
+    def test_conflict_keeps_highest_privacy(self):
+        legacy = Mock(identifier='foo@example.com', privacy=PUBLIC)
+        idp = Mock(email='foo@example.com', privacy=MOZILLIANS)
+        eq_(merge_alternate_emails([legacy], [idp]), [legacy])
+
+        legacy = Mock(identifier='foo@example.com', privacy=MOZILLIANS)
+        idp = Mock(email='foo@example.com', privacy=PUBLIC)
+        eq_(merge_alternate_emails([legacy], [idp]), [idp])
+
+    def test_conflict_same_privacy_keeps_idp(self):
+        legacy = Mock(identifier='Foo@example.com', privacy=MOZILLIANS)
+        idp = Mock(email='foo@example.com', privacy=MOZILLIANS)
+        eq_(merge_alternate_emails([legacy], [idp]), [idp])
+
+
 class ExternalAccountTests(TestCase):
     def test_get_url(self):
         profile = UserFactory.create().userprofile
@@ -687,6 +1029,94 @@ class EmailAttributeTests(TestCase):
         profile.set_instance_privacy_level(PUBLIC)
         eq_(profile.email, '')
 
+    def test_existing_idp_no_queries(self):
+        profile = UserFactory.create(email='foo@foo.com').userprofile
+        IdpProfile.objects.create(
+            profile=profile,
+            auth0_user_id='github|foo@bar.com',
+            email='foo@bar.com',
+            primary=True,
+            primary_contact_identity=True,
+            privacy=PUBLIC
+        )
+        profile = UserProfile.objects.get(pk=profile.pk)
+        profile.set_instance_privacy_level(PUBLIC)
+        with self.assertNumQueries(0):
+            eq_(profile.email, 'foo@bar.com')
+
+    def test_unchanged_idp_does_not_save_profile(self):
+        profile = UserFactory.create(email='foo@foo.com').userprofile
+        IdpProfile.objects.create(
+            profile=profile,
+            auth0_user_id='github|foo@bar.com',
+            email='foo@bar.com',
+            primary=True,
+            primary_contact_identity=True,
+            privacy=MOZILLIANS
+        )
+        idp = IdpProfile.objects.get(profile=profile)
+        with patch('mozillians.users.models.UserProfile.save') as save_mock:
+            idp.save(only_dirty=True)
+            idp.save()
+        ok_(not save_mock.called)
+
+        idp.privacy = PUBLIC
+        idp.save(only_dirty=True)
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.privacy_email, PUBLIC)
+        eq_(profile.primary_contact_privacy, PUBLIC)
+
+    def test_delete_primary_contact_idp(self):
+        profile = UserFactory.create(email='foo@foo.com').userprofile
+        idp = IdpProfile.objects.create(
+            profile=profile,
+            auth0_user_id='github|foo@bar.com',
+            email='foo@bar.com',
+            primary=True,
+            primary_contact_identity=True,
+            privacy=PUBLIC
+        )
+        eq_(profile.email, 'foo@bar.com')
+        idp.delete()
+        eq_(profile.email, 'foo@foo.com')
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.primary_contact_email, '')
+        eq_(profile.primary_contact_privacy, None)
+
+    def test_refresh_primary_contact_public_flags(self):
+        profile = UserFactory.create(email='', userprofile={'privacy_email': PUBLIC}).userprofile
+        ok_(not UserProfile.objects.get(pk=profile.pk).public_indexable)
+        IdpProfile.objects.bulk_create([IdpProfile(
+            profile=profile,
+            auth0_user_id='github|foo@bar.com',
+            email='foo@bar.com',
+            primary_contact_identity=True,
+            privacy=PUBLIC
+        )])
+        profile.refresh_primary_contact(save=True)
+        ok_(profile.public_indexable)
+        ok_(UserProfile.objects.get(pk=profile.pk).public_indexable)
+
+    def test_delete_primary_contact_idp_public_flags(self):
+        profile = UserFactory.create(email='', userprofile={'privacy_email': PUBLIC}).userprofile
+        idp = IdpProfile.objects.create(
+            profile=profile,
+            auth0_user_id='github|foo@bar.com',
+            email='foo@bar.com',
+            primary_contact_identity=True,
+            privacy=PUBLIC
+        )
+        ok_(UserProfile.objects.get(pk=profile.pk).public_indexable)
+        IdpProfile.objects.get(pk=idp.pk).delete()
+        ok_(not UserProfile.objects.get(pk=profile.pk).public_indexable)
+
+    def test_user_email_change_public_flags(self):
+        user = UserFactory.create(email='', userprofile={'privacy_email': PUBLIC})
+        ok_(not UserProfile.objects.get(pk=user.userprofile.pk).public_indexable)
+        user.email = 'foo@bar.com'
+        user.save()
+        ok_(UserProfile.objects.get(pk=user.userprofile.pk).public_indexable)
+
 
 class PrivacyModelTests(unittest.TestCase):
     def setUp(self):
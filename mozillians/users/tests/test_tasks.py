@@ -1,19 +1,27 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.test.utils import override_settings
+from django.utils.timezone import now
 
 from basket.base import BasketException
 from celery.exceptions import Retry
-from mock import patch
+from mock import ANY, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.models import AbuseReport
-from mozillians.users.tasks import (delete_reported_spam_accounts,
-                                    lookup_user_task, remove_incomplete_accounts,
-                                    subscribe_user_task, subscribe_user_to_basket,
+from mozillians.users.models import (PHOTO_GEOMETRIES, AbuseReport, CISOutbox, IdpProfile,
+                                     UserProfile)
+from mozillians.users.tasks import (_cis_session, cis_send_succeeded,
+                                    delete_reported_spam_accounts,
+                                    generate_photo_thumbnails, get_cis_session,
+                                    lookup_user_task, publish_batch, publish_cis_outbox,
+                                    publish_profiles, queue_userprofile_for_cis,
+                                    reconcile_basket_subscriptions, reconcile_vouch_counts,
+                                    remove_incomplete_accounts,
+                                    set_basket_vouched, subscribe_user_task,
+                                    subscribe_user_to_basket,
                                     unsubscribe_from_basket_task,
                                     unsubscribe_user_task, update_email_in_basket)
 from mozillians.users.tests import UserFactory
@@ -135,6 +143,31 @@ class BasketTests(TestCase):
         ok_(not subscribe_mock.called)
         ok_(not result.get())
 
+    @patch('mozillians.users.tasks.BASKET_ENABLED', True)
+    @patch('mozillians.users.tasks.waffle.switch_is_active')
+    @patch('mozillians.users.tasks.chain')
+    @patch('mozillians.users.tasks.set_basket_vouched')
+    @patch('mozillians.users.tasks.subscribe_user_task')
+    @patch('mozillians.users.tasks.lookup_user_task')
+    def test_subscribe_sync_vouched(self, lookup_mock, subscribe_mock, set_vouched_mock,
+                                    chain_mock, switch_is_active_mock):
+        switch_is_active_mock.return_value = True
+        profile = UserFactory.create().userprofile
+        chain_mock.reset_mock()
+        set_vouched_mock.reset_mock()
+
+        subscribe_user_to_basket(profile.pk, ['foo'], sync_vouched=True)
+        set_vouched_mock.si.assert_called_once_with(profile.pk, True)
+        chain_mock.assert_called_once_with(lookup_mock.subtask.return_value,
+                                           subscribe_mock.subtask.return_value,
+                                           set_vouched_mock.si.return_value)
+
+    def test_set_basket_vouched(self):
+        profile = UserFactory.create().userprofile
+        UserProfile.objects.filter(pk=profile.pk).update(basket_vouched=None)
+        set_basket_vouched(profile.pk, True)
+        eq_(UserProfile.objects.get(pk=profile.pk).basket_vouched, True)
+
     @patch('mozillians.users.tasks.basket.lookup_user')
     def test_lookup_task_user_not_found(self, lookup_mock):
 
@@ -281,6 +314,68 @@ class BasketTests(TestCase):
         retry_mock.called_with(exc)
 
 
+class BasketReconciliationTests(TestCase):
+    def setUp(self):
+        with patch('mozillians.users.signals.subscribe_user_to_basket.delay'):
+            with patch('mozillians.users.signals.unsubscribe_from_basket_task.delay'):
+                self.vouched = UserFactory.create().userprofile
+                self.unvouched = UserFactory.create(vouched=False).userprofile
+                self.never_synced = UserFactory.create(vouched=False).userprofile
+        UserProfile.objects.update(basket_vouched=None)
+        # Subscribed while it was vouched.
+        UserProfile.objects.filter(pk=self.unvouched.pk).update(basket_vouched=True)
+
+    @patch('mozillians.users.tasks.BASKET_ENABLED', True)
+    @patch('mozillians.users.tasks.BASKET_VOUCHED_NEWSLETTER', 'vouched')
+    @patch('mozillians.users.tasks.waffle.switch_is_active', return_value=True)
+    @patch('mozillians.users.tasks.basket')
+    def test_reconcile(self, basket_mock, switch_is_active_mock):
+        basket_mock.BasketException = BasketException
+        basket_mock.lookup_user.return_value = {'token': 'token', 'newsletters': ['vouched']}
+
+        stats = reconcile_basket_subscriptions()
+        eq_(stats, {'subscribed': 1, 'unsubscribed': 1, 'failed': 0})
+        basket_mock.subscribe.assert_called_once_with(
+            self.vouched.email, ['vouched'], sync='N', source_url=ANY, optin='Y', api_key=ANY)
+        basket_mock.unsubscribe.assert_called_once_with(
+            token='token', email=self.unvouched.email, newsletters=['vouched'], optout=False)
+        eq_(UserProfile.objects.get(pk=self.vouched.pk).basket_vouched, True)
+        eq_(UserProfile.objects.get(pk=self.unvouched.pk).basket_vouched, False)
+        eq_(UserProfile.objects.get(pk=self.never_synced.pk).basket_vouched, None)
+
+        basket_mock.reset_mock()
+        eq_(reconcile_basket_subscriptions()['subscribed'], 0)
+        ok_(not basket_mock.subscribe.called)
+
+    @patch('mozillians.users.tasks.BASKET_ENABLED', True)
+    @patch('mozillians.users.tasks.waffle.switch_is_active', return_value=True)
+    @patch('mozillians.users.tasks.basket')
+    def test_reconcile_failure_stays_pending(self, basket_mock, switch_is_active_mock):
+        basket_mock.BasketException = BasketException
+        basket_mock.subscribe.side_effect = BasketException('error')
+        basket_mock.lookup_user.side_effect = BasketException(u'User not found')
+
+        stats = reconcile_basket_subscriptions()
+        eq_(stats, {'subscribed': 0, 'unsubscribed': 1, 'failed': 1})
+        ok_(not basket_mock.unsubscribe.called)
+        eq_(UserProfile.objects.get(pk=self.vouched.pk).basket_vouched, None)
+
+
+class VouchCountReconciliationTests(TestCase):
+    @override_settings(CAN_VOUCH_THRESHOLD=2)
+    @patch('mozillians.users.models.queue_userprofiles_for_cis')
+    def test_reconcile_vouch_counts(self, queue_mock):
+        drifted = UserFactory.create().userprofile
+        synced = UserFactory.create().userprofile
+        UserProfile.objects.filter(pk=drifted.pk).update(vouch_count=3, can_vouch=True)
+
+        reconcile_vouch_counts()
+        drifted = UserProfile.objects.get(pk=drifted.pk)
+        eq_((drifted.vouch_count, drifted.is_vouched, drifted.can_vouch), (1, True, False))
+        queue_mock.assert_called_once_with([drifted.pk])
+        eq_(UserProfile.objects.get(pk=synced.pk).vouch_count, 1)
+
+
 class SpamTasksTests(TestCase):
     def test_manual_spam_reports_unvouched_delete(self):
         spam_user = UserFactory.create(vouched=False).userprofile
@@ -331,3 +426,164 @@ class SpamTasksTests(TestCase):
         delete_reported_spam_accounts()
         eq_(AbuseReport.objects.all().count(), 1)
         eq_(User.objects.filter(email=spam_user.email).count(), 1)
+
+
+class PhotoThumbnailsTests(TestCase):
+
+    @patch('sorl.thumbnail.get_thumbnail')
+    @patch('PIL.Image.open')
+    def test_generate_photo_thumbnails(self, open_mock, get_thumbnail_mock):
+        open_mock.return_value.mode = 'RGB'
+        get_thumbnail_mock.return_value.url = 'https://example.com/thumb.jpg'
+        with patch('mozillians.users.models.generate_photo_thumbnails.delay') as delay_mock:
+            with patch('mozillians.users.models.transaction.on_commit') as on_commit_mock:
+                profile = UserFactory.create(userprofile={'photo': 'foo'}).userprofile
+                ok_(not delay_mock.called)
+            on_commit_mock.call_args[0][0]()
+        delay_mock.assert_called_with(profile.pk)
+
+        # Thumbnails are only generated again for a new photo.
+        with patch('mozillians.users.models.transaction.on_commit') as on_commit_mock:
+            profile = UserProfile.objects.get(pk=profile.pk)
+            profile.full_name = 'foo'
+            profile.save()
+            ok_(not on_commit_mock.called)
+
+        generate_photo_thumbnails(profile.pk)
+        eq_(get_thumbnail_mock.call_count, len(PHOTO_GEOMETRIES))
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.photo_thumbnail_urls,
+            dict((geometry, 'https://example.com/thumb.jpg') for geometry in PHOTO_GEOMETRIES))
+
+    @patch('sorl.thumbnail.get_thumbnail')
+    def test_generate_photo_thumbnails_without_photo(self, get_thumbnail_mock):
+        profile = UserFactory.create().userprofile
+        generate_photo_thumbnails(profile.pk)
+        ok_(not get_thumbnail_mock.called)
+        eq_(UserProfile.objects.get(pk=profile.pk).photo_thumbnails, '')
+
+
+class CISPublisherTests(TestCase):
+    def setUp(self):
+        _cis_session.clear()
+
+    def _credentials(self, expiration):
+        return {'Credentials': {'AccessKeyId': 'key', 'SecretAccessKey': 'secret',
+                                'SessionToken': 'token', 'Expiration': expiration}}
+
+    @patch('boto3.session.Session')
+    @patch('boto3.client')
+    def test_session_reused(self, client_mock, session_mock):
+        sts = client_mock.return_value
+        sts.assume_role.return_value = self._credentials(now() + timedelta(hours=1))
+        session = get_cis_session()
+        eq_(get_cis_session(), session)
+        eq_(sts.assume_role.call_count, 1)
+        eq_(session_mock.call_count, 1)
+
+    @patch('boto3.session.Session')
+    @patch('boto3.client')
+    def test_session_refreshed_before_expiration(self, client_mock, session_mock):
+        sts = client_mock.return_value
+        sts.assume_role.return_value = self._credentials(now() + timedelta(minutes=2))
+        get_cis_session()
+        get_cis_session()
+        eq_(sts.assume_role.call_count, 2)
+
+    @patch('mozillians.users.tasks.sentry_client')
+    @patch('cis.publisher.ChangeDelegate')
+    @patch('mozillians.users.tasks.get_cis_session')
+    def test_publish_batch(self, get_cis_session_mock, change_delegate_mock, sentry_mock):
+        profile_results = [{'user_id': 'github|{0}'.format(i), 'groups': []} for i in range(3)]
+        results = publish_batch(profile_results)
+        eq_(len(results), 3)
+        eq_(get_cis_session_mock.call_count, 1)
+        eq_(change_delegate_mock.return_value.send.call_count, 3)
+        eq_(change_delegate_mock.return_value.boto_session, get_cis_session_mock.return_value)
+
+    @patch('cis.publisher.ChangeDelegate')
+    @patch('mozillians.users.tasks.get_cis_session')
+    def test_publish_batch_empty(self, get_cis_session_mock, change_delegate_mock):
+        eq_(publish_batch([]), [])
+        ok_(not get_cis_session_mock.called)
+
+
+class CISOutboxTests(TestCase):
+    def test_queue_collapses_requests(self):
+        profile = UserFactory.create().userprofile
+        CISOutbox.objects.all().delete()
+        queue_userprofile_for_cis(profile.pk)
+        queue_userprofile_for_cis(profile.pk)
+        outbox = CISOutbox.objects.get()
+        eq_(outbox.profile_id, profile.pk)
+        eq_(outbox.requests, 2)
+
+    @patch('mozillians.users.tasks.send_userprofile_to_cis.apply_async')
+    def test_publish_cis_outbox(self, send_to_cis_mock):
+        profile_1 = UserFactory.create().userprofile
+        profile_2 = UserFactory.create().userprofile
+        CISOutbox.objects.all().delete()
+        for i in range(3):
+            queue_userprofile_for_cis(profile_1.pk)
+        queue_userprofile_for_cis(profile_2.pk)
+
+        stats = publish_cis_outbox()
+        eq_(stats, {'profiles': 2, 'requests': 4, 'collapsed': 2})
+        send_to_cis_mock.assert_called_once_with(
+            kwargs={'instance_ids': [profile_1.pk, profile_2.pk]}, queue='cis')
+        ok_(not CISOutbox.objects.exists())
+
+    @patch('mozillians.users.tasks.send_userprofile_to_cis.apply_async')
+    def test_publish_cis_outbox_empty(self, send_to_cis_mock):
+        CISOutbox.objects.all().delete()
+        eq_(publish_cis_outbox()['profiles'], 0)
+        ok_(not send_to_cis_mock.called)
+
+
+@patch('mozillians.users.tasks.publish_batch',
+       side_effect=lambda payloads: [{'StatusCode': 200}] * len(payloads))
+class PublishProfilesTests(TestCase):
+    def setUp(self):
+        self.profile = UserFactory.create().userprofile
+        IdpProfile.objects.create(profile=self.profile, auth0_user_id='github|1',
+                                  email='foo@example.com', primary=True)
+        IdpProfile.objects.create(profile=self.profile, auth0_user_id='ad|1',
+                                  email='foo@example.org')
+
+    def test_unchanged_payloads_skipped(self, publish_batch_mock):
+        eq_(publish_profiles([self.profile.pk])['sent'], 2)
+        eq_(len(publish_batch_mock.call_args[0][0]), 2)
+
+        stats = publish_profiles([self.profile.pk])
+        eq_((stats['sent'], stats['skipped']), (0, 2))
+        eq_(publish_batch_mock.call_args[0][0], [])
+
+    def test_changed_payloads_sent(self, publish_batch_mock):
+        publish_profiles([self.profile.pk])
+        self.profile.full_name = 'Changed Name'
+        self.profile.save()
+        stats = publish_profiles([self.profile.pk])
+        eq_((stats['sent'], stats['skipped']), (2, 0))
+
+    def test_force(self, publish_batch_mock):
+        publish_profiles([self.profile.pk])
+        stats = publish_profiles([self.profile.pk], force=True)
+        eq_((stats['sent'], stats['skipped']), (2, 0))
+
+    def test_failed_send_not_recorded(self, publish_batch_mock):
+        publish_batch_mock.side_effect = lambda payloads: [
+            {'StatusCode': 200}, {'StatusCode': 200, 'FunctionError': 'Unhandled'}]
+        stats = publish_profiles([self.profile.pk])
+        eq_((stats['sent'], stats['failed']), (2, 1))
+        eq_(IdpProfile.objects.filter(profile=self.profile)
+            .exclude(cis_payload_hash='').count(), 1)
+
+        publish_batch_mock.side_effect = lambda payloads: [{'StatusCode': 200}] * len(payloads)
+        stats = publish_profiles([self.profile.pk])
+        eq_((stats['sent'], stats['skipped']), (1, 1))
+
+    def test_cis_send_succeeded(self, publish_batch_mock):
+        ok_(cis_send_succeeded({'StatusCode': 200}))
+        ok_(not cis_send_succeeded(None))
+        ok_(not cis_send_succeeded({'StatusCode': 500}))
+        ok_(not cis_send_succeeded({'StatusCode': 200, 'FunctionError': 'Handled'}))